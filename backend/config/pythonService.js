@@ -0,0 +1,24 @@
+import axios from "axios";
+
+const DEFAULT_BUDGET_MS = Number(process.env.PYTHON_SERVICE_BUDGET_MS) || 25000;
+// Left for the response to reach us after the service's deadline passes.
+const RESPONSE_MARGIN_MS = 500;
+
+// Adds the time budget to a request config. The service splits the budget
+// across its LLM and poster stages and answers with partial results (e.g. a
+// placeholder poster) instead of working past the point where we would
+// have timed out anyway.
+const withBudget = ({ budgetMs = DEFAULT_BUDGET_MS, ...config } = {}) => ({
+  ...config,
+  timeout: budgetMs,
+  headers: {
+    ...config.headers,
+    "X-Request-Budget-Ms": String(Math.max(budgetMs - RESPONSE_MARGIN_MS, 1)),
+  },
+});
+
+export const pythonGet = (path, config) =>
+  axios.get(`${process.env.PYTHON_MICROSERVICE_URL}${path}`, withBudget(config));
+
+export const pythonPost = (path, body, config) =>
+  axios.post(`${process.env.PYTHON_MICROSERVICE_URL}${path}`, body, withBudget(config));
@@ -1,4 +1,4 @@
-import axios from "axios";
+import { pythonGet } from "../config/pythonService.js";
 import Drama from "../models/dramaModel.js";
 import UserList from "../models/userListModel.js";
 
@@ -22,10 +22,9 @@ export const addDrama = asyncHandler(async (req, res) => {
 
   if (!drama) {
     try {
-      const { data: scrapedData } = await axios.get(
-        `${process.env.PYTHON_MICROSERVICE_URL}/fetch`,
-        { params: { title } }
-      );
+      const { data: scrapedData } = await pythonGet("/fetch", {
+        params: { title },
+      });
 
       drama = new Drama({
         title: scrapedData.title,
@@ -91,10 +90,9 @@ export const testUrlScrape = asyncHandler(async (req, res) => {
   }
 
   try {
-    const { data } = await axios.get(
-      `${process.env.PYTHON_MICROSERVICE_URL}/fetch-from-url`,
-      { params: { title } }
-    );
+    const { data } = await pythonGet("/fetch-from-url", {
+      params: { title },
+    });
     // Python service returns the structured data including posterUrl
     res.json(data);
   } catch (error) {
@@ -125,9 +123,7 @@ export const getDramaById = asyncHandler(async (req, res) => {
 
 export const getTopDramas = asyncHandler(async (req, res) => {
   try {
-    const { data } = await axios.get(
-      `${process.env.PYTHON_MICROSERVICE_URL}/top-dramas`
-    );
+    const { data } = await pythonGet("/top-dramas");
     res.json(data);
   } catch (error) {
     console.error("Python top-dramas service error:", error.message);
@@ -138,9 +134,10 @@ export const getTopDramas = asyncHandler(async (req, res) => {
 
 export const getNewReleases = asyncHandler(async (req, res) => {
   try {
-    const { data } = await axios.get(
-      `${process.env.PYTHON_MICROSERVICE_URL}/new-releases`
-    );
+    const { cursor, limit } = req.query;
+    const { data } = await pythonGet("/new-releases", {
+      params: { cursor, limit },
+    });
     res.json(data);
   } catch (error) {
     console.error("Python new-releases service error:", error.message);
@@ -1,4 +1,5 @@
 import axios from "axios";
+import { pythonPost } from "../config/pythonService.js";
 import Recommendation from "../models/recommendationModel.js";
 import UserList from "../models/userListModel.js";
 import mongoose from "mongoose";
@@ -9,14 +10,11 @@ const asyncHandler = (fn) => (req, res, next) =>
 const CACHE_DURATION_MS = 6 * 60 * 60 * 1000; // 6 hours
 
 const fetchFromPythonService = async (genre, excludeTitles = []) => {
-  const params = { genre };
-  if (excludeTitles.length > 0) {
-    params.exclude_titles = JSON.stringify(excludeTitles);
-  }
-  const { data } = await axios.get(
-    `${process.env.PYTHON_MICROSERVICE_URL}/recommend`,
-    { params }
-  );
+  // POST keeps long exclusion lists out of the URL.
+  const { data } = await pythonPost("/recommend", {
+    genre,
+    exclude_titles: excludeTitles,
+  });
   if (!data || !Array.isArray(data.recommendations)) {
     throw new Error("Invalid response structure from recommendation service");
   }
@@ -1,133 +1,129 @@
 import os
-from flask import Flask, request, jsonify
-import json 
-from dotenv import load_dotenv
-from llm.drama_metadata import get_llm_drama_details
-from llm.url_metadata import get_structured_data_for_title_from_asianwiki # NEW IMPORT
-from scrapers.drama_scraper import find_poster as find_poster_url
-# Pass exclude_titles to the function
-from llm.recommendations import get_llm_recommendations_for_genre
-from llm.top_dramas import get_top_dramas_llm
-
-load_dotenv()
+from core import config  # noqa: F401  (loads .env before anything reads settings)
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
+import handlers
+from core.clients import health as client_health
+from core.quota import quota_stats
+from llm.router import router_stats
+from core.metrics import render_prometheus
+from core.deadline import BUDGET_HEADER, deadline_scope, parse_budget
+from core.serialization import compress, encode, parse_fields
+from core.log import get_logger
+
+logger = get_logger(__name__)
 
 app = Flask(__name__)
 
+@app.before_request
+def start_deadline():
+    # The caller's time budget bounds all upstream work done for this request.
+    g.deadline = deadline_scope(parse_budget(request.headers.get(BUDGET_HEADER)))
+    g.deadline.__enter__()
+
+@app.teardown_request
+def end_deadline(error=None):
+    scope = g.pop('deadline', None)
+    if scope is not None:
+        scope.__exit__(None, None, None)
+
+def _json(payload, status):
+    # ?fields= projection and Accept-Encoding negotiation, same as asgi.py.
+    body, headers = encode(payload, parse_fields(request.args.get('fields')), request.headers.get('Accept-Encoding'))
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+def _encoded_json(body, status, headers):
+    body, encoding_headers = compress(body, request.headers.get('Accept-Encoding'), headers.get('ETag'))
+    return Response(body, status=status, headers={**headers, **encoding_headers}, mimetype='application/json')
+
 @app.route('/fetch', methods=['GET'])
 def fetch_drama():
-    title = request.args.get('title')
-    if not title:
-        return jsonify({"error": "Title parameter is required"}), 400
-    try:
-        llm_details = get_llm_drama_details(title)
-        if not llm_details or llm_details.get("description", "").startswith("Error"):
-             print(f"LLM failed to provide details for '{title}'.")
-             # Fallback: Still try to find poster with original title
-             poster_url = find_poster_url(title)
-             fallback_details = {
-                 "title": title, # Use original title
-                 "posterUrl": poster_url,
-                 "description": "Details unavailable.",
-                 # Add other fields as null or default if needed by frontend
-                 "year": None,
-                 "genres": [],
-                 "status": "unknown",
-                 "altTitles": [],
-                 "country": "Unknown",
-                 "cast": [],
-                 "rating": None,
-                 "sourceUrl": None,
-                 "type": "drama"
-             }
-             # Return the fallback with a 200 OK but indicate partial data
-             return jsonify(fallback_details), 200
-             # Or return 500 if you prefer errors for LLM failures:
-             # return jsonify({"error": f"Could not retrieve details for '{title}' from LLM."}), 500
-
-        # If LLM details are good, find poster using the (potentially corrected) LLM title
-        poster_url = find_poster_url(llm_details.get("title", title))
-        final_details = llm_details
-        final_details["posterUrl"] = poster_url
-        print(f"Combined details for '{title}': Poster found - {'Yes' if poster_url and not poster_url.startswith('[https://via.placeholder](https://via.placeholder)') else 'No'}")
-        return jsonify(final_details)
-    except Exception as e:
-        print(f"Error in /fetch endpoint processing '{title}': {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": "Internal server error during detail fetching"}), 500
+    payload, status = handlers.fetch(request.args.get('title'))
+    return _json(payload, status)
+
+@app.route('/fetch/batch', methods=['POST'])
+def fetch_drama_batch():
+    body = request.get_json(silent=True)
+    titles = body.get('titles') if isinstance(body, dict) else None
+    payload, status = handlers.fetch_batch(titles)
+    return _json(payload, status)
 
 # NEW ENDPOINT: Fetch Structured Data from AsianWiki URL (derived from title)
 @app.route('/fetch-from-url', methods=['GET'])
 def fetch_drama_from_url():
-    title = request.args.get('title')
-    if not title:
-        return jsonify({"error": "Title parameter is required"}), 400
-    
-    try:
-        llm_details = get_structured_data_for_title_from_asianwiki(title)
-        
-        if llm_details.get("error"):
-            # If LLM failed, return the error
-            return jsonify(llm_details), 500
-        
-        # If LLM details are good, find poster using the extracted title
-        extracted_title = llm_details.get("title", title)
-        poster_url = find_poster_url(extracted_title)
-        
-        llm_details["posterUrl"] = poster_url
-        
-        print(f"URL Fetch successful for '{extracted_title}': Poster found - {'Yes' if poster_url and not poster_url.startswith('[https://via.placeholder](https://via.placeholder)') else 'No'}")
-        return jsonify(llm_details)
-        
-    except Exception as e:
-        print(f"Error in /fetch-from-url endpoint processing '{title}': {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": "Internal server error during structured detail fetching"}), 500
-
-
-@app.route('/recommend', methods=['GET'])
+    payload, status = handlers.fetch_from_url(request.args.get('title'))
+    return _json(payload, status)
+
+@app.route('/recommend', methods=['GET', 'POST'])
 def recommend_drama():
-    genre = request.args.get('genre')
-    exclude_titles_str = request.args.get('exclude_titles') # Get as string
-
-    if not genre:
-        return jsonify({"error": "Genre parameter is required"}), 400
-
-    exclude_titles = []
-    if exclude_titles_str:
-        try:
-            exclude_titles = json.loads(exclude_titles_str) # Parse JSON string
-            if not isinstance(exclude_titles, list):
-                 print("Warning: exclude_titles parameter was not a valid JSON list.")
-                 exclude_titles = []
-        except json.JSONDecodeError:
-            print("Warning: Could not decode exclude_titles JSON.")
-            exclude_titles = [] # Default to empty list on error
-
-    try:
-        # Pass the parsed list to the LLM function
-        recommendations = get_llm_recommendations_for_genre(genre, exclude_titles)
-        return jsonify(recommendations)
-    except Exception as e:
-        print(f"Error in /recommend endpoint for genre '{genre}': {e}")
-        # Consider more specific error logging if needed
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": "Failed to generate recommendations"}), 500
+    if request.method == 'POST':
+        # Long exclusion lists go in the body: {"genre": ..., "exclude_titles": [...], "mode": ...}
+        body = request.get_json(silent=True)
+        params = body if isinstance(body, dict) else {}
+    else:
+        # exclude_titles arrives as a JSON-encoded list string
+        params = request.args
+    genre, exclude_titles, mode = params.get('genre'), params.get('exclude_titles'), params.get('mode')
+    fmt = handlers.stream_format(request.args.get('stream'), request.headers.get('Accept'))
+    if fmt and genre:
+        chunks, mimetype = handlers.recommend_stream(genre, exclude_titles, fmt, mode)
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=handlers.STREAM_HEADERS)
+    payload, status = handlers.recommend(genre, exclude_titles, mode)
+    return _json(payload, status)
+
+@app.route('/similar', methods=['GET'])
+def similar_dramas():
+    payload, status = handlers.similar(request.args.get('title'), request.args.get('limit'), request.args.get('exclude_titles'))
+    return _json(payload, status)
 
 @app.route('/top-dramas', methods=['GET'])
 def get_top():
-    try:
-        top_dramas = get_top_dramas_llm()
-        return jsonify(top_dramas)
-    except Exception as e:
-        print(f"Error in /top-dramas endpoint: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": "Failed to fetch top dramas"}), 500
+    fmt = handlers.stream_format(request.args.get('stream'), request.headers.get('Accept'))
+    if fmt:
+        chunks, mimetype = handlers.top_dramas_stream(fmt)
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=handlers.STREAM_HEADERS)
+    body, status, headers = handlers.top_dramas(request.headers.get('If-None-Match'), parse_fields(request.args.get('fields')))
+    return _encoded_json(body, status, headers)
+
+@app.route('/new-releases', methods=['GET'])
+def get_new_releases():
+    body, status, headers = handlers.new_releases(
+        request.args.get('cursor'),
+        request.args.get('limit'),
+        request.headers.get('If-None-Match'),
+        parse_fields(request.args.get('fields')),
+    )
+    return _encoded_json(body, status, headers)
+
+@app.route('/poster-image/<signature>/<token>', methods=['GET'])
+def poster_image(signature, token):
+    result, status, headers = handlers.poster_image(
+        signature, token, request.args.get('size'), request.headers.get('Accept'), request.headers.get('If-None-Match')
+    )
+    if status == 304:
+        return Response(status=304, headers=headers)
+    if status != 200:
+        return jsonify(result), status
+    # send_file hands the open file to the server's wsgi.file_wrapper (sendfile where supported).
+    response = send_file(result, mimetype=headers.pop('Content-Type'), conditional=False, etag=False)
+    response.headers.update(headers)
+    return response
+
+@app.route('/catalog/search', methods=['GET'])
+def search_catalog():
+    payload, status = handlers.catalog_search(request.args.get('q'), request.args.get('limit'))
+    return _json(payload, status)
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok", "clients": client_health(), "quota": quota_stats(), "llm": router_stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
+    handlers.start_background_jobs()
     port = int(os.environ.get('PYTHON_PORT', 8000))
+    # Development server only; use serve.py for production.
     # Ensure host='0.0.0.0' if running in Docker or needs external access
-    app.run(host='0.0.0.0', debug=True, port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0', debug=True, port=port)
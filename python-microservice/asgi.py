@@ -0,0 +1,213 @@
+"""
+ASGI entry point. The data endpoints are native async routes: requests
+wait on the event loop instead of pinning a server thread, and the blocking
+Gemini / image-search work runs on a dedicated, bounded thread pool. Every
+other route falls through to the Flask app.
+
+The upstream clients (google-generativeai, openai, ddgs, Custom Search,
+requests) are still called synchronously, so requests doing upstream work
+are capped at ASGI_WORKER_THREADS at a time; further ones wait for a free
+worker without holding a connection thread. Size the pool to the upstream
+concurrency the quotas allow, not to the number of open connections.
+
+Run with: uvicorn asgi:app  (or python serve.py with SERVER_MODE=asgi)
+"""
+import os
+import time
+import asyncio
+import functools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from core import config  # noqa: F401  (loads .env before anything reads settings)
+import handlers
+from app import app as flask_app
+from core.deadline import BUDGET_HEADER, DeadlineExceeded, iter_with_budget, parse_budget, run_until
+from core.serialization import compress, dumps, encode, parse_fields
+from llm.router import LLM_ROUTER_WORKERS
+from scrapers.drama_scraper import POSTER_WORKERS
+
+# Defaults to what the upstream pools can serve at once: a handler waits on
+# at most one LLM route or poster lookup at a time, so more threads than
+# that would only queue inside those pools (and behind the Gemini / CSE
+# quotas) while each holding a worker.
+ASGI_WORKER_THREADS = int(os.getenv("ASGI_WORKER_THREADS", 0)) or LLM_ROUTER_WORKERS + POSTER_WORKERS
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_WORKER_THREADS, thread_name_prefix="asgi-worker")
+
+
+def _budget(request):
+    return parse_budget(request.headers.get(BUDGET_HEADER))
+
+
+def _budgeted(request, fn, *args):
+    """
+    fn bound to a deadline fixed now, as the request arrives, to run on the
+    worker pool. Time spent queued for a worker comes out of the budget.
+    """
+    return functools.partial(run_until, time.monotonic() + _budget(request), fn, *args)
+
+
+# Sent when the deadline passed while the request waited for a worker.
+_EXPIRED = {"error": "Request deadline exceeded before it could be handled"}, 504
+
+
+def _stream(request, chunks, media_type):
+    # Starlette iterates sync generators on its own thread pool.
+    return StreamingResponse(
+        iter_with_budget(_budget(request), chunks), media_type=media_type, headers=handlers.STREAM_HEADERS
+    )
+
+
+def _fields(request):
+    return parse_fields(request.query_params.get("fields"))
+
+
+async def _run(request, fn, *args):
+    # Projection, encoding and compression run on the worker too, off the event loop.
+    handler = _budgeted(request, fn, *args)
+    fields, accept_encoding = _fields(request), request.headers.get("accept-encoding")
+
+    def respond():
+        try:
+            payload, status = handler()
+        except DeadlineExceeded:
+            payload, status = _EXPIRED
+        return encode(payload, fields, accept_encoding) + (status,)
+
+    body, headers, status = await asyncio.get_running_loop().run_in_executor(_executor, respond)
+    return Response(body, status_code=status, headers=headers, media_type="application/json")
+
+
+async def _run_encoded(request, fn, *args):
+    """Like _run for handlers returning (body bytes, status, headers)."""
+    handler = _budgeted(request, fn, *args)
+    accept_encoding = request.headers.get("accept-encoding")
+
+    def respond():
+        try:
+            body, status, headers = handler()
+        except DeadlineExceeded:
+            body, status, headers = dumps(_EXPIRED[0]), _EXPIRED[1], {}
+        body, encoding_headers = compress(body, accept_encoding, headers.get("ETag"))
+        return body, status, {**headers, **encoding_headers}
+
+    body, status, headers = await asyncio.get_running_loop().run_in_executor(_executor, respond)
+    return Response(body, status_code=status, headers=headers, media_type="application/json")
+
+
+async def fetch_drama(request):
+    return await _run(request, handlers.fetch, request.query_params.get("title"))
+
+
+async def fetch_drama_batch(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    titles = body.get("titles") if isinstance(body, dict) else None
+    return await _run(request, handlers.fetch_batch, titles)
+
+
+async def fetch_drama_from_url(request):
+    return await _run(request, handlers.fetch_from_url, request.query_params.get("title"))
+
+
+def _stream_format(request):
+    return handlers.stream_format(request.query_params.get("stream"), request.headers.get("accept"))
+
+
+async def recommend_drama(request):
+    if request.method == "POST":
+        # Long exclusion lists go in the body: {"genre": ..., "exclude_titles": [...], "mode": ...}
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        params = body if isinstance(body, dict) else {}
+    else:
+        params = request.query_params
+    genre, exclude_titles, mode = params.get("genre"), params.get("exclude_titles"), params.get("mode")
+    fmt = _stream_format(request)
+    if fmt and genre:
+        return _stream(request, *handlers.recommend_stream(genre, exclude_titles, fmt, mode))
+    return await _run(request, handlers.recommend, genre, exclude_titles, mode)
+
+
+async def similar_dramas(request):
+    return await _run(
+        request,
+        handlers.similar,
+        request.query_params.get("title"),
+        request.query_params.get("limit"),
+        request.query_params.get("exclude_titles"),
+    )
+
+
+async def get_top(request):
+    fmt = _stream_format(request)
+    if fmt:
+        return _stream(request, *handlers.top_dramas_stream(fmt))
+    return await _run_encoded(request, handlers.top_dramas, request.headers.get("if-none-match"), _fields(request))
+
+
+async def get_new_releases(request):
+    return await _run_encoded(
+        request,
+        handlers.new_releases,
+        request.query_params.get("cursor"),
+        request.query_params.get("limit"),
+        request.headers.get("if-none-match"),
+        _fields(request),
+    )
+
+
+async def poster_image(request):
+    handler = _budgeted(
+        request,
+        handlers.poster_image,
+        request.path_params["signature"],
+        request.path_params["token"],
+        request.query_params.get("size"),
+        request.headers.get("accept"),
+        request.headers.get("if-none-match"),
+    )
+
+    def respond():
+        try:
+            return handler()
+        except DeadlineExceeded:
+            return _EXPIRED + ({},)
+
+    result, status, headers = await asyncio.get_running_loop().run_in_executor(_executor, respond)
+    if status == 304:
+        return Response(status_code=304, headers=headers)
+    if status != 200:
+        return JSONResponse(result, status_code=status)
+    # FileResponse streams from disk (zero-copy sendfile when the server supports it).
+    return FileResponse(result, media_type=headers.pop("Content-Type"), headers=headers)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    handlers.start_background_jobs()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/fetch", fetch_drama, methods=["GET"]),
+        Route("/fetch/batch", fetch_drama_batch, methods=["POST"]),
+        Route("/fetch-from-url", fetch_drama_from_url, methods=["GET"]),
+        Route("/recommend", recommend_drama, methods=["GET", "POST"]),
+        Route("/similar", similar_dramas, methods=["GET"]),
+        Route("/top-dramas", get_top, methods=["GET"]),
+        Route("/new-releases", get_new_releases, methods=["GET"]),
+        Route("/poster-image/{signature}/{token}", poster_image, methods=["GET"]),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,386 @@
+"""
+Offline benchmark / load test.
+
+Starts local stand-ins for Gemini, OpenAI, Google Custom Search, DuckDuckGo and the
+poster image hosts (bench/stub_upstreams.py), points the service at them,
+serves the real app on a local port and drives /fetch, /fetch-from-url,
+/recommend and /top-dramas (plus /new-releases when named in --mix) at a
+fixed concurrency. Reports p50/p95/p99 latency and throughput per endpoint
+plus how many upstream calls were made.
+No network access or API quota is needed.
+
+    python -m bench.loadtest --requests 500 --concurrency 16
+    python -m bench.loadtest --gemini-latency 900:3000:0.01:0.02 --save-baseline bench/baseline.json
+    python -m bench.loadtest --baseline bench/baseline.json --tolerance 0.2
+
+Latency specs are 'median_ms[:p95_ms[:error_rate[:throttle_rate]]]'. With
+--baseline the run exits non-zero if p95 latency, throughput or upstream
+calls per request regress by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from bench.stub_upstreams import LatencyModel, StubUpstreams
+
+DEFAULT_MIX = "fetch=50,fetch-from-url=15,recommend=25,top-dramas=10"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against stubbed upstreams.")
+    parser.add_argument("--requests", type=int, default=400, help="total requests to send")
+    parser.add_argument("--duration", type=float, default=None, help="run for this many seconds instead")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, e.g. 'fetch=3,recommend=1'")
+    parser.add_argument("--server", choices=("asgi", "wsgi"), default="asgi")
+    parser.add_argument("--gemini-latency", default="800:2500", help="median[:p95[:error_rate[:throttle_rate]]] ms")
+    parser.add_argument("--openai-latency", default="700:2000", help="OpenAI stub, reached when the LLM router fails over")
+    parser.add_argument("--search-latency", default="250:700")
+    parser.add_argument("--image-latency", default="30:120")
+    parser.add_argument("--cold", action="store_true", help="make every title unique so caches never hit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="write the report as JSON to this path")
+    parser.add_argument("--baseline", help="compare against a report saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="write this run's report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"fetch", "fetch-from-url", "recommend", "top-dramas", "new-releases"}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure_environment(workdir):
+    """Points the service's configuration at the stubs. Must run before the app is imported."""
+    os.environ.setdefault("GEMINI_API_KEY", "bench-key")
+    os.environ.setdefault("OPENAI_API_KEY", "bench-key")
+    os.environ.setdefault("GOOGLE_SEARCH_API_KEY", "bench-key")
+    os.environ.setdefault("GOOGLE_SEARCH_ENGINE_ID", "bench-cse")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Real quotas would make the limiter, not the code under test, dominate
+    # the numbers; throttling is simulated by the stubs' throttle rate instead.
+    os.environ.setdefault("GEMINI_RPM", "60000")
+    os.environ.setdefault("OPENAI_RPM", "60000")
+    os.environ.setdefault("GOOGLE_CSE_RPM", "60000")
+    # Fresh caches per run so results do not depend on earlier runs.
+    os.environ["CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["SINGLEFLIGHT_LOCK_DIR"] = os.path.join(workdir, "locks")
+
+
+def wire_clients(stub):
+    """Swaps the real Gemini / search clients for ones that talk to the stub server."""
+    # Import the service first: it registers the real poster providers at
+    # import time, which the overrides below replace. Gemini is configured
+    # lazily, so configuring it here first points it at the stub.
+    import handlers  # noqa: F401
+    from core.clients import get_client, register_client
+    from core.config import configure_gemini
+    from scrapers.poster_providers import PosterProviderError, register_provider
+
+    configure_gemini(transport="rest", client_options={"api_endpoint": stub.url})
+
+    def build_cse():
+        import httplib2
+        from googleapiclient.discovery import build
+
+        return build(
+            "customsearch",
+            "v1",
+            developerKey=os.environ["GOOGLE_SEARCH_API_KEY"],
+            http=httplib2.Http(timeout=30),
+            cache_discovery=False,
+            client_options={"api_endpoint": stub.url + "/"},
+        )
+
+    register_client("google_cse", build_cse, check=lambda: True)
+    def build_cse_http():
+        import httplib2
+
+        return httplib2.Http(timeout=30)
+
+    register_client("google_cse_http", build_cse_http, per_thread=True, check=lambda: True)
+
+    def build_openai():
+        from openai import OpenAI
+
+        return OpenAI(api_key=os.environ["OPENAI_API_KEY"], base_url=stub.url + "/v1", max_retries=0)
+
+    register_client("openai", build_openai, check=lambda: True)
+
+    # DDGS has no configurable endpoint, so the provider itself is replaced
+    # with one that reads the stub's DDGS-shaped results.
+    def find_poster_ddgs_stub(title):
+        response = get_client("http").get(f"{stub.url}/ddgs/images", params={"q": f"{title} K-Drama poster cover"})
+        if response.status_code in (403, 429):
+            raise PosterProviderError(f"DDGS stub returned {response.status_code}", quota=True)
+        response.raise_for_status()
+        results = response.json()
+        return results[0]["image"] if results else None
+
+    register_provider("ddgs", find_poster_ddgs_stub, priority=20)
+
+
+def start_server(mode):
+    """Serves the app on a free local port in a daemon thread; returns its base URL."""
+    import handlers
+
+    if mode == "wsgi":
+        from waitress import create_server
+        from app import app
+
+        handlers.start_background_jobs()
+        server = create_server(app, host="127.0.0.1", port=0, threads=int(os.getenv("WSGI_THREADS", 16)))
+        port = server.effective_port
+        threading.Thread(target=server.run, name="bench-wsgi", daemon=True).start()
+    else:
+        import uvicorn
+        from asgi import app
+
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+        threading.Thread(target=server.run, name="bench-asgi", daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{port}"
+    _wait_until_ready(base_url)
+    return base_url
+
+
+def _wait_until_ready(base_url, timeout=30):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+class RequestPlan:
+    """Draws endpoint paths from the weighted mix with a Zipf-like title popularity."""
+
+    def __init__(self, mix, titles, genres, seed, cold=False):
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.titles = titles
+        self.title_weights = [1.0 / (rank + 1) for rank in range(len(titles))]
+        self.genres = genres
+        self.cold = cold
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def next(self):
+        with self._lock:
+            self._counter += 1
+            endpoint = self._rng.choices(self.endpoints, self.weights)[0]
+            title = self._rng.choices(self.titles, self.title_weights)[0]
+            genre = self._rng.choice(self.genres)
+            excluded = self._rng.sample(self.titles, self._rng.randint(0, 2))
+            serial = self._counter
+        if self.cold:
+            title = f"{title} {serial}"
+        if endpoint == "fetch":
+            return endpoint, f"/fetch?title={quote(title)}"
+        if endpoint == "fetch-from-url":
+            return endpoint, f"/fetch-from-url?title={quote(title)}"
+        if endpoint == "recommend":
+            return endpoint, f"/recommend?genre={quote(genre)}&exclude_titles={quote(json.dumps(excluded))}"
+        if endpoint == "new-releases":
+            return endpoint, "/new-releases"
+        return endpoint, "/top-dramas"
+
+
+def drive(base_url, plan, total=None, duration=None, concurrency=16):
+    """Closed-loop load: `concurrency` workers send requests back to back."""
+    import requests
+
+    results = []
+    results_lock = threading.Lock()
+    remaining = [total]
+    deadline = time.monotonic() + duration if duration else None
+    local = threading.local()
+
+    def claim():
+        with results_lock:
+            if deadline is not None:
+                return time.monotonic() < deadline
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        while claim():
+            endpoint, path = plan.next()
+            started = time.perf_counter()
+            try:
+                status = session.get(base_url + path, timeout=120).status_code
+            except requests.RequestException:
+                status = 0
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                results.append((endpoint, status, elapsed))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(results, wall_seconds, upstream_counts):
+    def stats(samples):
+        latencies = sorted(elapsed for _, _, elapsed in samples)
+        errors = sum(1 for _, status, _ in samples if status == 0 or status >= 500)
+        return {
+            "requests": len(samples),
+            "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "max_ms": round((latencies[-1] if latencies else 0) * 1000, 1),
+            "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+
+    by_endpoint = {}
+    for sample in results:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+
+    total_requests = len(results) or 1
+    return {
+        "overall": stats(results),
+        "endpoints": {name: stats(samples) for name, samples in sorted(by_endpoint.items())},
+        "upstream_calls": upstream_counts,
+        "upstream_calls_per_request": {
+            name: round(count / total_requests, 3) for name, count in sorted(upstream_counts.items())
+        },
+        "wall_seconds": round(wall_seconds, 2),
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Returns a list of human-readable regressions (empty when within tolerance)."""
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        current = report["endpoints"].get(name)
+        if current is None:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+    base_rps = baseline.get("overall", {}).get("throughput_rps")
+    if base_rps and report["overall"]["throughput_rps"] < base_rps * (1 - tolerance):
+        regressions.append(f"throughput {report['overall']['throughput_rps']} rps vs baseline {base_rps} rps")
+    for name, base in baseline.get("upstream_calls_per_request", {}).items():
+        current = report["upstream_calls_per_request"].get(name, 0.0)
+        if current > base * (1 + tolerance) + 0.01:
+            regressions.append(f"upstream {name}: {current} calls/request vs baseline {base}")
+    return regressions
+
+
+def print_report(report):
+    header = f"{'endpoint':<16}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, s in rows:
+        print(
+            f"{name:<16}{s['requests']:>7}{s['errors']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}"
+            f"{s['p99_ms']:>10}{s['throughput_rps']:>9}"
+        )
+    print()
+    print("upstream calls:", ", ".join(f"{k}={v}" for k, v in sorted(report["upstream_calls"].items())) or "none")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    stub = StubUpstreams(
+        gemini=LatencyModel.parse(args.gemini_latency),
+        openai=LatencyModel.parse(args.openai_latency),
+        search=LatencyModel.parse(args.search_latency),
+        images=LatencyModel.parse(args.image_latency),
+        seed=args.seed,
+    ).start()
+
+    with tempfile.TemporaryDirectory(prefix="dramapaglu-bench-") as workdir:
+        configure_environment(workdir)
+        wire_clients(stub)
+        base_url = start_server(args.server)
+
+        plan = RequestPlan(mix, stub.corpus.titles(), stub.corpus.genres, args.seed, cold=args.cold)
+        if args.warmup:
+            drive(base_url, plan, total=args.warmup, concurrency=args.concurrency)
+        stub.reset_counts()
+
+        total = None if args.duration else args.requests
+        results, wall = drive(base_url, plan, total=total, duration=args.duration, concurrency=args.concurrency)
+        report = summarize(results, wall, stub.snapshot_counts())
+        report["config"] = {
+            "server": args.server,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "cold": args.cold,
+            "upstreams": {name: model.describe() for name, model in stub.models.items()},
+        }
+
+    stub.stop()
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\nWithin tolerance of baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
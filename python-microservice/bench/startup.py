@@ -0,0 +1,182 @@
+"""
+Startup-time benchmark.
+
+Measures, in fresh interpreter processes, how long importing the entry
+module takes and how long `python serve.py` takes until /health answers,
+which is what an autoscaled replica or a restarted worker waits for. With
+--importtime the slowest imports of one extra run are listed.
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --server wsgi --save-baseline bench/startup-baseline.json
+    python -m bench.startup --baseline bench/startup-baseline.json --tolerance 0.2
+
+Upstream credentials are blanked (overriding .env) so the background jobs
+started with the server never call Gemini, OpenAI or Custom Search; the
+SDKs are still imported by the warmup.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and time-to-ready of the service.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--server", choices=("asgi", "wsgi"), default="asgi")
+    parser.add_argument("--warmup", choices=("background", "eager", "off"), default="background",
+                        help="STARTUP_WARMUP mode for the served process")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for /health")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    parser.add_argument("--json", dest="json_path", help="write the report as JSON to this path")
+    parser.add_argument("--baseline", help="compare against a report saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="write this run's report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression vs baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def _environment(workdir, extra=None):
+    env = dict(os.environ)
+    # load_dotenv() never overrides variables that are already set.
+    for name in ("GEMINI_API_KEY", "OPENAI_API_KEY", "GOOGLE_SEARCH_API_KEY", "GOOGLE_SEARCH_ENGINE_ID"):
+        env[name] = ""
+    env.setdefault("LOG_LEVEL", "WARNING")
+    env["CACHE_DIR"] = os.path.join(workdir, "cache")
+    env["SINGLEFLIGHT_LOCK_DIR"] = os.path.join(workdir, "locks")
+    env.update(extra or {})
+    return env
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(module, env):
+    """Seconds to import `module` in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=SERVICE_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_ready(server, env, timeout):
+    """Seconds from spawning serve.py until /health returns 200."""
+    import requests
+
+    port = _free_port()
+    env = dict(env, SERVER_MODE=server, PYTHON_HOST="127.0.0.1", PYTHON_PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "serve.py"], cwd=SERVICE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise SystemExit(f"serve.py exited with status {process.returncode} before becoming ready")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.02)
+        raise SystemExit(f"serve.py did not become ready within {timeout}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def slowest_imports(module, env, limit=15):
+    """Top cumulative import times (seconds) from `python -X importtime`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() != module:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def _summary(samples):
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 1),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    regressions = []
+    for key in ("import", "ready"):
+        base = baseline.get(key, {}).get("median_ms")
+        current = report[key]["median_ms"]
+        if base and current > base * (1 + tolerance):
+            regressions.append(f"{key}: median {current} ms vs baseline {base} ms")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    module = "asgi" if args.server == "asgi" else "app"
+    with tempfile.TemporaryDirectory(prefix="dramapaglu-startup-") as workdir:
+        env = _environment(workdir, {"STARTUP_WARMUP": args.warmup})
+        imports = [measure_import(module, env) for _ in range(args.runs)]
+        ready = [measure_ready(args.server, env, args.timeout) for _ in range(args.runs)]
+        slowest = slowest_imports(module, env) if args.importtime else None
+    report = {
+        "server": args.server,
+        "warmup": args.warmup,
+        "import": _summary(imports),
+        "ready": _summary(ready),
+    }
+
+    print(f"{'stage':<10}{'runs':>6}{'min ms':>10}{'median ms':>12}{'max ms':>10}")
+    for key in ("import", "ready"):
+        s = report[key]
+        print(f"{key:<10}{s['runs']:>6}{s['min_ms']:>10}{s['median_ms']:>12}{s['max_ms']:>10}")
+
+    if slowest is not None:
+        report["slowest_imports"] = [{"module": name, "ms": round(seconds * 1000, 1)} for seconds, name in slowest]
+        print("\nslowest imports:")
+        for row in report["slowest_imports"]:
+            print(f"  {row['ms']:>8} ms  {row['module']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions vs baseline:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\nNo regressions vs baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
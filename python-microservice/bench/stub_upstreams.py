@@ -0,0 +1,435 @@
+"""
+Local stand-ins for the service's upstreams, used by bench/loadtest.py.
+
+One threaded HTTP server answers:
+  POST /v1beta/models/<model>:generateContent        Gemini (REST transport)
+  POST /v1beta/models/<model>:streamGenerateContent  Gemini streaming
+  POST /v1/chat/completions                          OpenAI chat completions
+  GET  /customsearch/v1                              Google Custom Search
+  GET  /ddgs/images                                  DuckDuckGo image search
+  GET  /images/<slug>.<ext>                          poster images
+
+Gemini answers are rendered from the recorded drama corpus in recorded.json,
+picked by recognising which prompt the service sent. Each upstream has its
+own latency distribution and error/throttle rates.
+"""
+import os
+import re
+import json
+import datetime
+import math
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+RECORDED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded.json")
+
+# A GIF whose logical screen is 500x750 (a 1x1 image inside), padded past
+# the service's minimum poster size; served when Pillow is not available.
+_GIF_POSTER = (
+    b"GIF89a\xf4\x01\xee\x02\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+    b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+).ljust(4096, b"\x00")
+
+
+class LatencyModel:
+    """
+    Log-normal latency with a given median and p95 (milliseconds), plus the
+    fraction of calls that fail with a server error or a throttling response.
+    """
+
+    def __init__(self, median_ms=0.0, p95_ms=None, error_rate=0.0, throttle_rate=0.0):
+        self.median_ms = float(median_ms)
+        self.p95_ms = float(p95_ms if p95_ms is not None else median_ms)
+        self.error_rate = float(error_rate)
+        self.throttle_rate = float(throttle_rate)
+        ratio = self.p95_ms / self.median_ms if self.median_ms > 0 else 1.0
+        self._sigma = math.log(ratio) / 1.645 if ratio > 1 else 0.0
+
+    @classmethod
+    def parse(cls, spec):
+        """'median[:p95[:error_rate[:throttle_rate]]]', e.g. '800:2500:0.01:0.02'."""
+        parts = [float(p) for p in str(spec).split(":") if p != ""]
+        return cls(*parts)
+
+    def delay(self, rng):
+        if self.median_ms <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median_ms), self._sigma) / 1000.0
+
+    def outcome(self, rng):
+        roll = rng.random()
+        if roll < self.throttle_rate:
+            return "throttle"
+        if roll < self.throttle_rate + self.error_rate:
+            return "error"
+        return "ok"
+
+    def describe(self):
+        return {
+            "median_ms": self.median_ms,
+            "p95_ms": self.p95_ms,
+            "error_rate": self.error_rate,
+            "throttle_rate": self.throttle_rate,
+        }
+
+
+def _slug(title):
+    return re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-") or "untitled"
+
+
+def _render_image():
+    try:
+        from io import BytesIO
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new("RGB", (500, 750), (120, 40, 80)).save(buffer, format="JPEG", quality=80)
+        return "jpg", "image/jpeg", buffer.getvalue()
+    except ImportError:
+        return "gif", "image/gif", _GIF_POSTER
+
+
+class RecordedCorpus:
+    def __init__(self, path=RECORDED_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.dramas = data["dramas"]
+        self.genres = data["genres"]
+        self._by_name = {}
+        for drama in self.dramas:
+            for name in [drama["title"], *drama.get("altTitles", [])]:
+                self._by_name[name.casefold()] = drama
+
+    def titles(self):
+        return [drama["title"] for drama in self.dramas]
+
+    def lookup(self, title):
+        drama = self._by_name.get(title.casefold())
+        if drama is not None:
+            return drama
+        # Unknown titles get a deterministic synthetic record, like a model
+        # answering for a title outside the recording.
+        rng = random.Random(title)
+        return {
+            "title": title,
+            "altTitles": [],
+            "year": rng.randint(2005, 2025),
+            "genres": rng.sample(self.genres, 2),
+            "status": "completed",
+            "cast": [],
+            "rating": f"{rng.uniform(6.5, 9.0):.1f}/10",
+        }
+
+    def for_genre(self, genre):
+        genre = genre.casefold()
+        return [d for d in self.dramas if genre in (g.casefold() for g in d["genres"])]
+
+
+class StubUpstreams:
+    def __init__(self, gemini=None, search=None, images=None, openai=None, seed=None, host="127.0.0.1", port=0):
+        self.models = {
+            "gemini": gemini or LatencyModel(),
+            "openai": openai or LatencyModel(),
+            "google_cse": search or LatencyModel(),
+            "ddgs": search or LatencyModel(),
+            "images": images or LatencyModel(),
+        }
+        self.corpus = RecordedCorpus()
+        self.image_ext, self.image_type, self.image_body = _render_image()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counts_lock = threading.Lock()
+        self.counts = {}
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, key):
+        with self._counts_lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot_counts(self):
+        with self._counts_lock:
+            return dict(self.counts)
+
+    def reset_counts(self):
+        with self._counts_lock:
+            self.counts.clear()
+
+    def draw(self, upstream):
+        """Returns (delay_seconds, outcome) for one call to `upstream`."""
+        model = self.models[upstream]
+        with self._rng_lock:
+            return model.delay(self._rng), model.outcome(self._rng)
+
+    def poster_url(self, title):
+        return f"{self.url}/images/{_slug(title)}.{self.image_ext}"
+
+    # --- Gemini -----------------------------------------------------------
+
+    def _details(self, title):
+        drama = self.corpus.lookup(title)
+        return {
+            "title": drama["title"],
+            "altTitles": drama.get("altTitles", []),
+            "year": drama["year"],
+            "country": "South Korea",
+            "genres": drama["genres"],
+            "posterUrl": "",
+            "description": f"{drama['title']} is a {drama['year']} Korean drama ({', '.join(drama['genres'])}).",
+            "cast": drama.get("cast", []),
+            "rating": drama.get("rating"),
+            "sourceUrl": f"https://mydramalist.com/search?q={quote(drama['title'])}",
+            "type": "drama",
+            "status": drama["status"],
+        }
+
+    def _recommendation(self, drama, genre):
+        return {
+            "title": drama["title"],
+            "year": drama["year"],
+            "reason": f"A well-loved {genre.lower()} drama with a strong following.",
+            "genres": drama["genres"],
+            "status": drama["status"],
+            "posterUrl": None,
+        }
+
+    def _recommend(self, prompt, genre, size, pad):
+        # Titles the prompt mentions in quotes are exclusions / already known.
+        picks = [d for d in self.corpus.for_genre(genre) if json.dumps(d["title"]) not in prompt]
+        picks = [self._recommendation(d, genre) for d in picks[:size]]
+        index = 1
+        while pad and len(picks) < size:
+            title = f"{genre} Chronicles {index}"
+            if json.dumps(title) not in prompt:
+                picks.append(self._recommendation(self.corpus.lookup(title), genre))
+            index += 1
+        return {"recommendations": picks}
+
+    def gemini_answer(self, prompt, json_mode=False):
+        """
+        Renders the text Gemini would have returned for `prompt`, the
+        variable part of a task prompt from llm/prompts.py.
+        """
+        if match := re.search(r"^Titles:\s*(\[.*?\])\s*$", prompt, re.S | re.M):
+            payload = [dict(self._details(t), query=t) for t in json.loads(match.group(1))]
+        elif match := re.search(r'^Title: "(.+?)"', prompt, re.M):
+            payload = self._details(match.group(1))
+        elif match := re.search(r"^Date: (\S+)\nWindow: (\d+) days\nCount: up to (\d+)", prompt, re.M):
+            # Premieres spread back from the prompt's date, newest first.
+            today = datetime.date.fromisoformat(match.group(1))
+            spacing = max(1, int(match.group(2)) // max(1, len(self.corpus.dramas)))
+            payload = {
+                "dramas": [
+                    {
+                        "title": d["title"],
+                        "year": d["year"],
+                        "airDate": (today - datetime.timedelta(days=i * spacing)).isoformat(),
+                        "network": "tvN",
+                        "status": "ongoing" if i < 5 else "completed",
+                    }
+                    for i, d in enumerate(self.corpus.dramas[:int(match.group(3))])
+                ]
+            }
+        elif match := re.search(r"^Genre: (.+?)\nCount: (?:exactly )?(\d+)", prompt, re.M):
+            # Pool prompts ask for a plain count and are always filled;
+            # per-request recommendations only ever get what the corpus has.
+            payload = self._recommend(prompt, match.group(1), int(match.group(2)), pad="Count: exactly" not in prompt)
+        elif match := re.search(r"^Count: (\d+)\s*$", prompt, re.M):
+            ranked = sorted(self.corpus.dramas, key=lambda d: d.get("rating", ""), reverse=True)[:int(match.group(1))]
+            payload = {
+                "dramas": [
+                    {
+                        "title": d["title"],
+                        "year": d["year"],
+                        "description": f"{d['title']} keeps topping the charts.",
+                        "status": d["status"],
+                        "posterUrl": None,
+                    }
+                    for d in ranked
+                ]
+            }
+        else:
+            payload = {}
+        text = json.dumps(payload, ensure_ascii=False, indent=None if json_mode else 2)
+        # Structured output comes back as bare JSON; free-form answers are fenced.
+        return text if json_mode else "```json\n" + text + "\n```"
+
+    # --- Image search -----------------------------------------------------
+
+    def search_results(self, query):
+        title = re.sub(r"\s*K-Drama poster cover$", "", query).strip()
+        slug = _slug(title)
+        return [
+            {"link": self.poster_url(title), "width": 500, "height": 750},
+            {"link": f"{self.url}/images/{slug}-alt.{self.image_ext}", "width": 300, "height": 450},
+        ]
+
+
+def _gemini_response(text, prompt_tokens=0):
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text) // 4},
+    }
+
+
+def _openai_response(text, model, prompt_tokens=0):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(text) // 4,
+            "total_tokens": prompt_tokens + len(text) // 4,
+        },
+    }
+
+
+def _make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json", head=False):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+        def _simulate(self, upstream):
+            """Sleeps for the drawn latency; returns an error response tuple or None."""
+            delay, outcome = stub.draw(upstream)
+            stub.count(upstream)
+            if delay:
+                time.sleep(delay)
+            if outcome == "throttle":
+                stub.count(f"{upstream}_throttled")
+                message = "Resource has been exhausted (e.g. check quota)."
+                if upstream == "google_cse":
+                    message = "Quota exceeded for quota metric 'Queries'. rateLimitExceeded"
+                return 429, {"error": {"code": 429, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+            if outcome == "error":
+                stub.count(f"{upstream}_errors")
+                return 500, {"error": {"code": 500, "message": "Internal error (stub)", "status": "INTERNAL"}}
+            return None
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                return json.loads(raw or b"{}")
+            except ValueError:
+                return {}
+
+        def _chat_completions(self, body):
+            failure = self._simulate("openai")
+            if failure:
+                return self._send(*failure)
+            messages = body.get("messages", [])
+            prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+            prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+            json_mode = body.get("response_format", {}).get("type") in ("json_schema", "json_object")
+            text = stub.gemini_answer(prompt, json_mode=json_mode)
+            model = body.get("model", "stub")
+            if not body.get("stream"):
+                return self._send(200, _openai_response(text, model, prompt_tokens))
+            stub.count("openai_stream")
+            step = max(1, len(text) // 3)
+            events = [
+                {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}]}
+                for i in range(0, len(text), step)
+            ]
+            usage = _openai_response(text, model, prompt_tokens)["usage"]
+            events.append({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage})
+            payload = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+            return self._send(200, payload.encode("utf-8"), "text/event-stream")
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self._read_json()
+            if path == "/v1/chat/completions":
+                return self._chat_completions(body)
+            if not re.match(r"^/v1(beta)?/models/[^/:]+:(generateContent|streamGenerateContent)$", path):
+                return self._send(404, {"error": {"code": 404, "message": f"No stub for {path}"}})
+
+            streaming = path.endswith(":streamGenerateContent")
+            failure = self._simulate("gemini")
+            if failure:
+                return self._send(*failure)
+            if streaming:
+                stub.count("gemini_stream")
+
+            prompt = "\n".join(
+                part.get("text", "")
+                for content in body.get("contents", [])
+                for part in content.get("parts", [])
+            )
+            instructions = "\n".join(part.get("text", "") for part in body.get("systemInstruction", {}).get("parts", []))
+            # Rough token estimate so llm_tokens_total moves under load.
+            prompt_tokens = (len(instructions) + len(prompt)) // 4
+            json_mode = body.get("generationConfig", {}).get("responseMimeType") == "application/json"
+            text = stub.gemini_answer(prompt, json_mode=json_mode)
+            if not streaming:
+                return self._send(200, _gemini_response(text, prompt_tokens))
+            # The REST streaming transport reads a JSON array of partial responses.
+            step = max(1, len(text) // 3)
+            chunks = [_gemini_response(text[i:i + step], prompt_tokens) for i in range(0, len(text), step)]
+            return self._send(200, chunks)
+
+        def _get(self, head=False):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            if parsed.path == "/customsearch/v1":
+                failure = self._simulate("google_cse")
+                if failure:
+                    return self._send(*failure)
+                results = stub.search_results(query.get("q", [""])[0])
+                items = [{"link": r["link"], "image": {"width": r["width"], "height": r["height"]}} for r in results]
+                return self._send(200, {"items": items})
+            if parsed.path == "/ddgs/images":
+                failure = self._simulate("ddgs")
+                if failure:
+                    return self._send(*failure)
+                results = stub.search_results(query.get("q", [""])[0])
+                return self._send(200, [{"image": r["link"], "width": r["width"], "height": r["height"]} for r in results])
+            if parsed.path.startswith("/images/"):
+                failure = self._simulate("images")
+                if failure:
+                    return self._send(*failure)
+                return self._send(200, stub.image_body, stub.image_type, head=head)
+            return self._send(404, {"error": f"No stub for {parsed.path}"}, head=head)
+
+        def do_GET(self):
+            self._get()
+
+        def do_HEAD(self):
+            self._get(head=True)
+
+    return Handler
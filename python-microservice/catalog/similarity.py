@@ -0,0 +1,412 @@
+"""
+Local "more like this" engine over the drama catalog. Every record is
+encoded into a fixed-width float32 vector made of weighted blocks:
+multi-hot genres, one-hot country, a soft year bucket, hashed cast names
+and hashed TF-IDF description keywords. Each block is normalized on its
+own so the weights decide how much it counts toward the cosine score.
+
+The matrix is saved as a .npy file next to a JSON sidecar (row keys and
+encoder state) and memory-mapped on startup, so a worker answers queries
+without re-encoding the catalog. A background job rebuilds it when the
+catalog has changed. Queries are matrix products over the whole index
+with exclusion masks, answered in batches.
+"""
+import os
+import re
+import json
+import math
+import time
+import zlib
+import threading
+from collections import Counter
+from catalog.store import get_catalog
+from core.config import lazy_import
+from core.disk_cache import cache_path
+from core.metrics import register_collector, timer
+from core.singleflight import single_flight
+from core.titles import normalize_title
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+# NumPy is optional; /similar answers 503 without it.
+np = lazy_import("numpy")
+
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "1") != "0" and np is not None
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH") or cache_path("similarity")
+SIMILARITY_REBUILD_INTERVAL = int(os.getenv("SIMILARITY_REBUILD_INTERVAL", 600))
+SIMILARITY_MAX_TERMS = int(os.getenv("SIMILARITY_MAX_TERMS", 20000))
+SIMILARITY_MIN_SCORE = float(os.getenv("SIMILARITY_MIN_SCORE", 0.05))
+
+MAX_GENRES = 64
+MAX_COUNTRIES = 32
+YEAR_RANGE = (1990, 2032)
+YEAR_BUCKET = 2
+CAST_DIMS = 256
+KEYWORD_DIMS = 512
+BLOCK_WEIGHTS = {"genres": 3.0, "keywords": 2.0, "cast": 1.5, "country": 0.5, "year": 0.75}
+
+_TOKEN = re.compile(r"[a-z][a-z'-]{2,}")
+_STOPWORDS = frozenset(
+    "the and for with that this from into their they them his her its are was were who whom whose when where "
+    "which while what will would can could has have had not but all one two after before about over under "
+    "between through during each other she him himself herself own out new also more most very than then there "
+    "these those being been only just even such drama series story korean episode episodes season".split()
+)
+
+
+def _tokens(text):
+    return [token for token in _TOKEN.findall((text or "").casefold()) if token not in _STOPWORDS]
+
+
+def _bucket(value, dims):
+    # crc32 rather than hash(): string hashes are salted per process.
+    digest = zlib.crc32(value.encode("utf-8"))
+    return digest % dims, 1.0 if digest & 0x80000000 else -1.0
+
+
+def _names(values):
+    return [normalize_title(value) for value in values or [] if isinstance(value, str) and value.strip()]
+
+
+class FeatureEncoder:
+    """Turns catalog records into block vectors; its vocabularies come from the catalog it was fitted on."""
+
+    def __init__(self, genres, countries, idf):
+        self.genres = {genre: i for i, genre in enumerate(genres)}
+        self.countries = {country: i for i, country in enumerate(countries)}
+        self.idf = idf
+        self.default_idf = max(idf.values(), default=1.0)
+        year_buckets = (YEAR_RANGE[1] - YEAR_RANGE[0]) // YEAR_BUCKET + 1
+        sizes = [
+            ("genres", len(genres)),
+            ("country", len(countries)),
+            ("year", year_buckets),
+            ("cast", CAST_DIMS),
+            ("keywords", KEYWORD_DIMS),
+        ]
+        self.blocks = {}
+        offset = 0
+        for name, size in sizes:
+            self.blocks[name] = (offset, offset + size)
+            offset += size
+        self.dims = offset
+
+    @classmethod
+    def fit(cls, records):
+        genre_counts, country_counts, document_frequency = Counter(), Counter(), Counter()
+        for record in records:
+            genre_counts.update(set(_names(record.get("genres"))))
+            country_counts.update(_names([record.get("country")]))
+            document_frequency.update(set(_tokens(record.get("description"))))
+        total = max(len(records), 1)
+        idf = {
+            token: round(math.log((1 + total) / (1 + count)) + 1.0, 4)
+            for token, count in document_frequency.most_common(SIMILARITY_MAX_TERMS)
+            if count > 1 or total < 50
+        }
+        return cls(
+            [genre for genre, _ in genre_counts.most_common(MAX_GENRES)],
+            [country for country, _ in country_counts.most_common(MAX_COUNTRIES)],
+            idf,
+        )
+
+    def state(self):
+        return {"genres": list(self.genres), "countries": list(self.countries), "idf": self.idf}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["genres"], state["countries"], state["idf"])
+
+    def genre_column(self, genre):
+        index = self.genres.get(normalize_title(genre))
+        return None if index is None else self.blocks["genres"][0] + index
+
+    def encode(self, record, out=None):
+        vector = out if out is not None else np.zeros(self.dims, dtype=np.float32)
+        for genre in _names(record.get("genres")):
+            if genre in self.genres:
+                vector[self.blocks["genres"][0] + self.genres[genre]] = 1.0
+        for country in _names([record.get("country")]):
+            if country in self.countries:
+                vector[self.blocks["country"][0] + self.countries[country]] = 1.0
+        year = record.get("year")
+        if isinstance(year, int) and YEAR_RANGE[0] <= year <= YEAR_RANGE[1]:
+            start, end = self.blocks["year"]
+            position = (year - YEAR_RANGE[0]) / YEAR_BUCKET
+            bucket = int(position)
+            vector[start + bucket] = 1.0
+            # Neighbouring buckets get partial credit so 2015 and 2016 still match.
+            if bucket > 0:
+                vector[start + bucket - 1] = 0.4
+            if start + bucket + 1 < end:
+                vector[start + bucket + 1] = 0.4
+        for name in _names(record.get("cast"))[:10]:
+            column, sign = _bucket(name, CAST_DIMS)
+            vector[self.blocks["cast"][0] + column] += sign
+        for token, count in Counter(_tokens(record.get("description"))).items():
+            column, sign = _bucket(token, KEYWORD_DIMS)
+            vector[self.blocks["keywords"][0] + column] += sign * (1 + math.log(count)) * self.idf.get(token, self.default_idf)
+
+        for name, (start, end) in self.blocks.items():
+            block = vector[start:end]
+            norm = float(np.linalg.norm(block))
+            if norm:
+                block *= math.sqrt(BLOCK_WEIGHTS[name]) / norm
+        norm = float(np.linalg.norm(vector))
+        if norm:
+            vector /= norm
+        return vector
+
+
+def _indexable(record):
+    return bool(record.get("title")) and bool(record.get("genres") or record.get("description") or record.get("cast"))
+
+
+class SimilarityIndex:
+    def __init__(self, matrix, keys, encoder, revision=None, built_at=None):
+        self.matrix = matrix
+        self.keys = keys
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.encoder = encoder
+        self.revision = revision
+        self.built_at = built_at or time.time()
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, records, revision=None):
+        records = [record for record in records if _indexable(record)]
+        encoder = FeatureEncoder.fit(records)
+        matrix = np.zeros((len(records), encoder.dims), dtype=np.float32)
+        for row, record in enumerate(records):
+            encoder.encode(record, out=matrix[row])
+        return cls(matrix, [normalize_title(record["title"]) for record in records], encoder, revision)
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        # Matrix first, sidecar last: a reader only trusts a sidecar whose
+        # shape matches the matrix next to it.
+        with open(path + ".npy" + suffix, "wb") as f:
+            np.save(f, self.matrix)
+        os.replace(path + ".npy" + suffix, path + ".npy")
+        with open(path + ".json" + suffix, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "keys": self.keys,
+                    "encoder": self.encoder.state(),
+                    "built_at": self.built_at,
+                    "shape": list(self.matrix.shape),
+                },
+                f,
+            )
+        os.replace(path + ".json" + suffix, path + ".json")
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(path + ".npy", mmap_mode="r")
+        if list(matrix.shape) != meta["shape"]:
+            raise ValueError("similarity matrix and sidecar do not match")
+        return cls(matrix, meta["keys"], FeatureEncoder.from_state(meta["encoder"]), built_at=meta.get("built_at"))
+
+    def vector_for(self, record):
+        row = self.rows.get(normalize_title(record.get("title")))
+        if row is not None:
+            return np.asarray(self.matrix[row])
+        # Catalog entries newer than the index are encoded on the fly.
+        return self.encoder.encode(record)
+
+    def mask_for(self, titles):
+        mask = np.zeros(len(self.keys), dtype=bool)
+        for title in titles or []:
+            row = self.rows.get(normalize_title(title)) if isinstance(title, str) else None
+            if row is not None:
+                mask[row] = True
+        return mask
+
+    def top_k(self, queries, k, masks=None):
+        """
+        Cosine top-k for a batch of query vectors (m x dims). `masks` is an
+        m x n (or n) boolean array of rows to leave out. Returns one list of
+        (row, score) per query, best first.
+        """
+        if not len(self.keys) or k <= 0:
+            return [[] for _ in range(len(queries))]
+        scores = np.asarray(queries, dtype=np.float32) @ self.matrix.T
+        if masks is not None:
+            scores = np.where(masks, -np.inf, scores)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(int(row), float(score)) for row, score in zip(rows, row_scores) if score >= SIMILARITY_MIN_SCORE]
+            for rows, row_scores in zip(top, top_scores)
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuild_thread = None
+
+
+def rebuild_index():
+    global _index
+    catalog = get_catalog()
+    revision = catalog.revision
+    with timer("similarity_build"):
+        index = SimilarityIndex.build(catalog.all(), revision)
+        index.save(SIMILARITY_INDEX_PATH)
+    # Serve from the memory map like every other worker does.
+    index = SimilarityIndex.load(SIMILARITY_INDEX_PATH)
+    index.revision = revision
+    with _index_lock:
+        _index = index
+    logger.info(f"Similarity index rebuilt: {len(index)} dramas, {index.encoder.dims} features.")
+    return index
+
+
+@single_flight("similarity_cold_start", key=lambda: "similarity")
+def _load_or_build():
+    catalog = get_catalog()
+    try:
+        index = SimilarityIndex.load(SIMILARITY_INDEX_PATH)
+    except (OSError, ValueError, KeyError) as e:
+        logger.info(f"No usable similarity index on disk ({e}); building one.")
+        return rebuild_index()
+    # Catalog revisions are per process; an index saved by another worker
+    # counts as current while it covers as many dramas as the catalog has.
+    if len(index) == sum(1 for record in catalog.all() if _indexable(record)):
+        index.revision = catalog.revision
+    return index
+
+
+def get_similarity_index():
+    global _index
+    if not SIMILARITY_ENABLED:
+        return None
+    index = _index
+    if index is None:
+        index = _load_or_build()
+        with _index_lock:
+            if _index is None:
+                _index = index
+            index = _index
+    return index
+
+
+def _rebuild_loop():
+    while True:
+        time.sleep(SIMILARITY_REBUILD_INTERVAL)
+        index = _index
+        if index is not None and index.revision == get_catalog().revision:
+            continue
+        try:
+            rebuild_index()
+        except Exception as e:
+            logger.error(f"Similarity index rebuild failed: {e}")
+
+
+def start_similarity_indexer():
+    global _rebuild_thread
+    if not SIMILARITY_ENABLED:
+        return
+    with _index_lock:
+        if _rebuild_thread is not None:
+            return
+        _rebuild_thread = threading.Thread(target=_rebuild_loop, name="similarity-index", daemon=True)
+        _rebuild_thread.start()
+
+
+def _record_for_row(index, row):
+    return get_catalog().get(index.keys[row])
+
+
+def similar_to(title, limit=10, exclude_titles=None):
+    """
+    Catalog dramas most similar to `title`, each with a "score". Returns
+    (matched record, results), or (None, []) when the title isn't known.
+    """
+    index = get_similarity_index()
+    record = get_catalog().lookup(title)
+    if index is None or record is None:
+        return record, []
+    with timer("similarity_query"):
+        mask = index.mask_for([record["title"], *(exclude_titles or [])])
+        (matches,) = index.top_k(index.vector_for(record)[None, :], limit, mask[None, :])
+    results = []
+    for row, score in matches:
+        match = _record_for_row(index, row)
+        if match is not None:
+            results.append({**match, "score": round(score, 4)})
+    return record, results
+
+
+def similar_for_genre(genre, seed_titles, count=5):
+    """
+    Recommendation-shaped picks for `genre` close to the caller's own titles
+    (the /recommend exclusion list), or to the genre as a whole without any.
+    Seed titles are scored as one batch; each candidate keeps its best seed.
+    Returns None when the index can't cover the request.
+    """
+    index = get_similarity_index()
+    if index is None or not len(index):
+        return None
+    column = index.encoder.genre_column(genre)
+    if column is None:
+        return None
+    with timer("similarity_query"):
+        in_genre = np.asarray(index.matrix[:, column]) > 0
+        excluded = index.mask_for(seed_titles) | ~in_genre
+        if excluded.all():
+            return None
+
+        catalog = get_catalog()
+        seeds = [catalog.lookup(title) for title in seed_titles or [] if isinstance(title, str)]
+        seeds = [seed for seed in seeds if seed is not None and _indexable(seed)][:50]
+        if seeds:
+            queries = np.stack([index.vector_for(seed) for seed in seeds])
+        else:
+            # No seeds: the genre centroid stands in for "typical of the genre".
+            queries = np.asarray(index.matrix[in_genre]).mean(axis=0, keepdims=True)
+            seeds = [None]
+        per_seed = index.top_k(queries, count, np.broadcast_to(excluded, (len(queries), len(excluded))))
+
+    best = {}
+    for seed, matches in zip(seeds, per_seed):
+        for row, score in matches:
+            if row not in best or score > best[row][0]:
+                best[row] = (score, seed)
+    picks = []
+    for row, (score, seed) in sorted(best.items(), key=lambda item: -item[1][0])[:count]:
+        record = _record_for_row(index, row)
+        if record is None:
+            continue
+        reason = f"Similar to {seed['title']}." if seed else f"A close match for {genre} fans."
+        picks.append({
+            "title": record["title"],
+            "year": record.get("year"),
+            "reason": reason,
+            "genres": record.get("genres") or [],
+            "status": record.get("status") or "completed",
+            "posterUrl": record.get("posterUrl"),
+        })
+    return picks if len(picks) >= count else None
+
+
+def similarity_stats():
+    index = _index
+    if index is None:
+        return {"indexed": 0, "dims": 0, "age_seconds": 0}
+    return {"indexed": len(index), "dims": index.encoder.dims, "age_seconds": round(time.time() - index.built_at, 1)}
+
+
+register_collector(lambda: [(f"similarity_{key}", {}, value) for key, value in similarity_stats().items()])
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import bisect
+import sqlite3
+import threading
+from collections import defaultdict
+from core.disk_cache import cache_path
+from core.titles import normalize_title
+from llm.json_utils import DRAMA_DETAILS_FIELDS
+
+CATALOG_FUZZY_THRESHOLD = float(os.getenv("CATALOG_FUZZY_THRESHOLD", 0.6))
+# Full records older than this are not served in place of a fresh LLM call.
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", 30 * 24 * 3600))
+# How often a worker checks the database for rows other workers wrote.
+CATALOG_RELOAD_CHECK = float(os.getenv("CATALOG_RELOAD_CHECK", 10))
+# Fields that mark a record as full drama details rather than a list entry
+# (recommendation / top-drama items only carry title, year, status...).
+DETAIL_FIELDS = ("description", "cast", "country")
+# What a details lookup serves; list-only fields (reason, airDate, network)
+# merged in from feeds stay out of /fetch responses.
+SERVED_DETAIL_FIELDS = frozenset(DRAMA_DETAILS_FIELDS) | {"posterUrl"}
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    In-memory index over every known name of a drama (title, altTitles):
+    exact lookups through a dict, prefix lookups through a sorted list and
+    typo-tolerant lookups through a trigram inverted index.
+    """
+
+    def __init__(self):
+        self._exact = {}
+        self._sorted_names = []
+        self._trigrams = defaultdict(set)
+        self._name_trigrams = {}
+
+    def add(self, name, canonical):
+        if not name:
+            return
+        if name not in self._exact:
+            bisect.insort(self._sorted_names, name)
+            grams = _trigrams(name)
+            self._name_trigrams[name] = grams
+            for gram in grams:
+                self._trigrams[gram].add(name)
+        self._exact[name] = canonical
+
+    def exact(self, name):
+        return self._exact.get(name)
+
+    def prefix(self, name, limit=10):
+        start = bisect.bisect_left(self._sorted_names, name)
+        matches = []
+        for candidate in self._sorted_names[start:]:
+            if not candidate.startswith(name) or len(matches) >= limit:
+                break
+            matches.append(self._exact[candidate])
+        return list(dict.fromkeys(matches))
+
+    def fuzzy(self, name, threshold=CATALOG_FUZZY_THRESHOLD, limit=5):
+        grams = _trigrams(name)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for candidate in self._trigrams.get(gram, ()):
+                overlap[candidate] += 1
+        scored = []
+        for candidate, shared in overlap.items():
+            score = shared / len(grams | self._name_trigrams[candidate])
+            if score >= threshold:
+                scored.append((score, candidate))
+        scored.sort(reverse=True)
+        results = []
+        for score, candidate in scored:
+            canonical = self._exact[candidate]
+            if canonical not in (c for c, _ in results):
+                results.append((canonical, round(score, 3)))
+            if len(results) >= limit:
+                break
+        return results
+
+
+class DramaCatalog:
+    """
+    Local catalog of every drama record the service has produced, kept in
+    SQLite (WAL) and mirrored into a TitleIndex for sub-millisecond lookups.
+    Every worker process keeps its own mirror: writes merge with the row in
+    the database, and rows other workers wrote are picked up on the next
+    read after CATALOG_RELOAD_CHECK seconds.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dramas ("
+            " key TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "seq" not in {row[1] for row in self._conn.execute("PRAGMA table_info(dramas)")}:
+            self._conn.execute("ALTER TABLE dramas ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS dramas_seq ON dramas (seq)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            " alias TEXT PRIMARY KEY,"
+            " key TEXT NOT NULL,"
+            " seq INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS aliases_seq ON aliases (seq)")
+        self._records = {}
+        self._updated_at = {}
+        self._index = TitleIndex()
+        # Highest row sequence numbers already mirrored in memory.
+        self._seq = -1
+        self._alias_seq = -1
+        self._data_version = None
+        self._last_sync = 0.0
+        self._sync(force=True)
+        # Bumped on every change so derived indexes can tell they are stale.
+        self.revision = 0
+
+    def _index_record(self, key, record):
+        self._index.add(key, key)
+        for alt in record.get("altTitles") or []:
+            if isinstance(alt, str):
+                self._index.add(normalize_title(alt), key)
+
+    def _apply(self, key, record, updated_at):
+        self._records[key] = record
+        self._updated_at[key] = updated_at
+        self._index_record(key, record)
+
+    def _sync(self, force=False):
+        """Mirrors rows written by other processes since the last sync."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_sync < CATALOG_RELOAD_CHECK:
+                return
+            self._last_sync = now
+            # Changes only when another connection commits.
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if not force and data_version == self._data_version:
+                return
+            self._data_version = data_version
+            changed = False
+            rows = self._conn.execute(
+                "SELECT key, data, updated_at, seq FROM dramas WHERE seq > ? ORDER BY seq", (self._seq,)
+            )
+            for key, data, updated_at, seq in rows:
+                self._apply(key, json.loads(data), updated_at)
+                self._seq = max(self._seq, seq)
+                changed = True
+            for alias, key, seq in self._conn.execute(
+                "SELECT alias, key, seq FROM aliases WHERE seq > ? ORDER BY seq", (self._alias_seq,)
+            ):
+                self._index.add(alias, key)
+                self._alias_seq = max(self._alias_seq, seq)
+                changed = True
+            if changed and not force:
+                self.revision += 1
+
+    def upsert(self, record, aliases=(), overwrite=True):
+        """
+        Merges `record` into the catalog. With `overwrite`, non-empty new
+        fields win over stored ones; without it (list entries) they only fill
+        fields the catalog doesn't have yet. `aliases` are other titles the
+        drama was requested under. The merge reads the stored row inside the
+        write transaction, so fields another worker wrote are kept.
+        """
+        if not isinstance(record, dict) or not record.get("title"):
+            return None
+        key = normalize_title(record["title"])
+        if not key:
+            return None
+        now = time.time()
+        names = {normalize_title(alias) for alias in aliases if isinstance(alias, str)} - {"", key}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data, updated_at FROM dramas WHERE key = ?", (key,)).fetchone()
+                existing = json.loads(row[0]) if row else {}
+                merged = dict(existing)
+                for field, value in record.items():
+                    if value in (None, "", []):
+                        continue
+                    if overwrite or field not in existing:
+                        merged[field] = value
+                updated_at = now if overwrite or not row else row[1]
+                new_aliases = sorted(name for name in names if self._index.exact(name) != key)
+                if merged != existing:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO dramas (key, data, updated_at, seq)"
+                        " VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM dramas))",
+                        (key, json.dumps(merged), updated_at),
+                    )
+                elif row:
+                    updated_at = row[1]
+                for name in new_aliases:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO aliases (alias, key, seq)"
+                        " VALUES (?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM aliases))",
+                        (name, key),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            stale = self._records.get(key) != merged or self._updated_at.get(key) != updated_at
+            if stale:
+                self._apply(key, merged, updated_at)
+            for name in new_aliases:
+                self._index.add(name, key)
+            if stale or new_aliases:
+                self.revision += 1
+        return key
+
+    def upsert_many(self, records, overwrite=False):
+        for record in records:
+            self.upsert(record, overwrite=overwrite)
+
+    def get(self, key):
+        self._sync()
+        with self._lock:
+            record = self._records.get(key)
+            return dict(record) if record is not None else None
+
+    def lookup(self, title, require_details=False):
+        """
+        Finds a drama by its title or a known alias (altTitles, titles it was
+        requested under), after normalization. Records found this way are
+        served in place of an LLM call, so partial and fuzzy matches ("Love",
+        "Squid Game 2") are left to search(). With `require_details` only
+        full, recent records match, cut down to the details fields.
+        """
+        name = normalize_title(title)
+        if not name:
+            return None
+        self._sync()
+        with self._lock:
+            key = self._index.exact(name)
+            record = self._records.get(key) if key else None
+            updated_at = self._updated_at.get(key, 0)
+        if record is None:
+            return None
+        if require_details:
+            if not all(field in record for field in DETAIL_FIELDS):
+                return None
+            if time.time() - updated_at > CATALOG_MAX_AGE:
+                return None
+            return {field: value for field, value in record.items() if field in SERVED_DETAIL_FIELDS}
+        return dict(record)
+
+    def search(self, query, limit=10):
+        name = normalize_title(query)
+        if not name:
+            return []
+        self._sync()
+        with self._lock:
+            keys = self._index.prefix(name, limit=limit)
+            if len(keys) < limit:
+                keys += [k for k, _ in self._index.fuzzy(name, limit=limit) if k not in keys]
+            return [dict(self._records[key]) for key in keys[:limit]]
+
+    def all(self):
+        self._sync()
+        with self._lock:
+            return [dict(record) for record in self._records.values()]
+
+    def __len__(self):
+        return len(self._records)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = DramaCatalog(os.getenv("CATALOG_PATH") or cache_path("catalog.db"))
+        return _catalog
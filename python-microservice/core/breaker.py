@@ -0,0 +1,56 @@
+import time
+import threading
+
+# Numeric encoding of CircuitBreaker.state() for gauges.
+BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, cooldown=300):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    def allow(self):
+        """
+        True when a call may go through. In the half-open state only one
+        probe is let through; its caller must end it with record_success(),
+        record_failure() or release_probe(), or the breaker stays shut.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probe_in_flight:
+                return False
+            # Half-open: let a single probe through to test the backend.
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Frees the half-open probe slot after a call that ended without a verdict (skipped, cancelled, unrelated error)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half-open"
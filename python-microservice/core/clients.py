@@ -0,0 +1,181 @@
+import os
+import threading
+from core.config import gemini_configured, google_search_configured, openai_configured
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+DEFAULT_GEMINI_MODEL = "gemini-2.5-flash"
+
+# Re-entrant: building a registered client may itself go through the registry
+# (the "gemini" factory calls get_gemini_model).
+_lock = threading.RLock()
+_registry = {}
+_instances = {}
+_errors = {}
+_thread_local = threading.local()
+
+
+class _ClientSpec:
+    def __init__(self, factory, per_thread, check):
+        self.factory = factory
+        self.per_thread = per_thread
+        self.check = check
+
+
+def register_client(name, factory, per_thread=False, check=None):
+    """
+    Registers a lazily built external client. Process-wide clients are built
+    once and shared; `per_thread` clients (for transports that are not
+    thread-safe, like httplib2) are built once per worker thread.
+    """
+    with _lock:
+        _registry[name] = _ClientSpec(factory, per_thread, check)
+        _instances.pop(name, None)
+        _errors.pop(name, None)
+
+
+def get_client(name):
+    spec = _registry.get(name)
+    if spec is None:
+        raise KeyError(f"Unknown client '{name}'")
+
+    if spec.per_thread:
+        clients = getattr(_thread_local, "clients", None)
+        if clients is None:
+            clients = _thread_local.clients = {}
+        if name not in clients:
+            clients[name] = _build(name, spec)
+        return clients[name]
+
+    client = _instances.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _instances:
+            _instances[name] = _build(name, spec)
+        return _instances[name]
+
+
+def _build(name, spec):
+    try:
+        client = spec.factory()
+    except Exception as e:
+        _errors[name] = str(e)
+        raise
+    _errors.pop(name, None)
+    return client
+
+
+def warmup(names=None):
+    """
+    Builds the given (or all) shared clients up front so the first request
+    doesn't pay for it. Clients without credentials are skipped, and so are
+    per-thread ones: a warmup thread's copy would never serve a request.
+    """
+    results = {}
+    for name in names or list(_registry):
+        spec = _registry[name]
+        if spec.per_thread:
+            results[name] = "per-thread"
+            continue
+        if spec.check is not None and not spec.check():
+            results[name] = "not configured"
+            continue
+        try:
+            get_client(name)
+            results[name] = "ok"
+        except Exception as e:
+            results[name] = f"error: {e}"
+    return results
+
+
+def health():
+    report = {}
+    for name, spec in list(_registry.items()):
+        status = {"built": name in _instances or name in getattr(_thread_local, "clients", {})}
+        if name in _errors:
+            status["error"] = _errors[name]
+        if spec.check is not None:
+            try:
+                status["ok"] = bool(spec.check())
+            except Exception as e:
+                status["ok"] = False
+                status["error"] = str(e)
+        report[name] = status
+    return report
+
+
+def _build_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "DramaPaglu/1.0"
+    return session
+
+
+def _build_google_cse():
+    import httplib2
+    from googleapiclient.discovery import build
+
+    # Building the service (parsing the discovery document) is the slow
+    # part, so it is built once and shared; requests are executed with the
+    # calling thread's google_cse_http.
+    return build(
+        "customsearch",
+        "v1",
+        developerKey=os.getenv("GOOGLE_SEARCH_API_KEY"),
+        http=httplib2.Http(timeout=HTTP_TIMEOUT),
+        cache_discovery=False,
+    )
+
+
+def _build_google_cse_http():
+    import httplib2
+
+    # httplib2.Http is not thread-safe. One per thread keeps its connection
+    # to googleapis.com alive between that thread's calls.
+    return httplib2.Http(timeout=HTTP_TIMEOUT)
+
+
+def _build_openai():
+    from openai import OpenAI
+
+    # Retries and failover are the LLM router's job (llm/router.py). The
+    # base URL can point at a compatible gateway or a local mock.
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        max_retries=0,
+        timeout=HTTP_TIMEOUT,
+    )
+
+
+_gemini_models = {}
+
+
+def get_gemini_model(model_name=DEFAULT_GEMINI_MODEL, system_instruction=None):
+    key = (model_name, system_instruction)
+    model = _gemini_models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        if key not in _gemini_models:
+            import google.generativeai as genai
+
+            _gemini_models[key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+        return _gemini_models[key]
+
+
+register_client("http", _build_http_session)
+register_client("google_cse", _build_google_cse, check=google_search_configured)
+register_client("google_cse_http", _build_google_cse_http, per_thread=True, check=google_search_configured)
+register_client("openai", _build_openai, check=openai_configured)
+register_client(
+    "gemini",
+    lambda: get_gemini_model(DEFAULT_GEMINI_MODEL),
+    check=gemini_configured,
+)
@@ -0,0 +1,172 @@
+"""
+One-time process bootstrap. Importing this module loads .env once; entry
+points (app.py, serve.py) import it before anything that reads settings.
+
+Heavy SDKs (google.generativeai, googleapiclient, ddgs, numpy, Pillow) are
+bound with lazy_import() and only loaded when first used, so a worker can
+answer /health before any of them are in memory. warmup() loads them and
+builds the shared clients ahead of the first request; start_warmup() does
+that on a background thread according to STARTUP_WARMUP:
+
+  background (default)  warm up after the server is ready
+  eager                 warm up before start_warmup() returns
+  off                   load everything on first use
+"""
+import os
+import time
+import importlib
+import importlib.util
+import importlib.machinery
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+_lock = threading.Lock()
+_lazy_modules = []
+_gemini_configured = False
+_warmup_started = False
+
+
+def gemini_configured():
+    return bool(os.getenv("GEMINI_API_KEY"))
+
+
+def openai_configured():
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+
+def google_search_configured():
+    return bool(os.getenv("GOOGLE_SEARCH_API_KEY") and os.getenv("GOOGLE_SEARCH_ENGINE_ID"))
+
+
+def llm_configured():
+    """True when at least one LLM provider has credentials."""
+    return gemini_configured() or openai_configured()
+
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._module_lock = threading.Lock()
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with self._module_lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}' ({'loaded' if self.loaded else 'not loaded'})>"
+
+
+def _installed(name):
+    # importlib.util.find_spec() imports parent packages to locate a
+    # submodule; walking the search path keeps the check import-free.
+    parts = name.split(".")
+    try:
+        spec = importlib.util.find_spec(parts[0])
+    except (ImportError, ValueError):
+        return False
+    for index in range(1, len(parts)):
+        if spec is None or spec.submodule_search_locations is None:
+            return False
+        spec = importlib.machinery.PathFinder.find_spec(".".join(parts[:index + 1]), spec.submodule_search_locations)
+    return spec is not None
+
+
+def lazy_import(name):
+    """
+    Returns a proxy that imports `name` on first use, or None when the
+    module is not installed (so optional dependencies can still be tested
+    with `is None`).
+    """
+    if not _installed(name):
+        return None
+    module = _LazyModule(name)
+    with _lock:
+        _lazy_modules.append(module)
+    return module
+
+
+def configure_gemini(**options):
+    """
+    Configures the Gemini SDK with GEMINI_API_KEY the first time it is
+    needed. Later calls are no-ops, so whoever calls first (e.g. the load
+    test pointing the SDK at its stub) decides the transport options.
+    """
+    global _gemini_configured
+    if _gemini_configured:
+        return True
+    with _lock:
+        if _gemini_configured:
+            return True
+        if not gemini_configured():
+            return False
+        import google.generativeai as genai
+
+        from core.log import get_logger
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"), **options)
+        get_logger(__name__).info("Gemini API configured.")
+        _gemini_configured = True
+        return True
+
+
+def warmup():
+    """Loads the lazily imported SDKs and builds the shared clients. Returns a report."""
+    from core.clients import warmup as warmup_clients
+
+    started = time.perf_counter()
+    report = {"modules": {}}
+    with _lock:
+        modules = list(_lazy_modules)
+    for module in modules:
+        try:
+            module.load()
+            report["modules"][module._name] = "ok"
+        except Exception as e:
+            report["modules"][module._name] = f"error: {e}"
+    if gemini_configured():
+        try:
+            configure_gemini()
+        except Exception as e:
+            report["gemini"] = f"error: {e}"
+    report["clients"] = warmup_clients()
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def start_warmup(mode=None):
+    """Runs warmup() once per process as configured by STARTUP_WARMUP."""
+    global _warmup_started
+    from core.log import get_logger
+
+    mode = (mode or STARTUP_WARMUP).lower()
+    with _lock:
+        if _warmup_started or mode == "off":
+            return
+        _warmup_started = True
+
+    def run():
+        get_logger(__name__).info("Startup warmup finished", extra={"warmup": warmup()})
+
+    if mode == "eager":
+        run()
+    else:
+        threading.Thread(target=run, name="startup-warmup", daemon=True).start()
@@ -0,0 +1,123 @@
+"""
+Request deadlines. The caller's time budget (the X-Request-Budget-Ms header
+the Node backend sends, or REQUEST_BUDGET_MS by default) becomes a deadline
+in a context variable, so every stage below the endpoint can ask how much
+time is left. contextvars.copy_context() carries it into the poster and LLM
+worker threads, where calls that would start after the deadline are skipped
+and the rest get their HTTP timeouts clamped to what remains.
+"""
+import os
+import time
+import contextlib
+import contextvars
+
+BUDGET_HEADER = "X-Request-Budget-Ms"
+REQUEST_BUDGET_MS = int(os.getenv("REQUEST_BUDGET_MS", 30000))
+MAX_BUDGET_MS = int(os.getenv("MAX_REQUEST_BUDGET_MS", 120000))
+# Share of a request's remaining budget its LLM stage may use; poster
+# lookups get the rest.
+LLM_BUDGET_SHARE = float(os.getenv("LLM_BUDGET_SHARE", 0.7))
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before this stage could finish."""
+
+
+def parse_budget(value):
+    """Seconds from a budget header value in milliseconds; the default when missing or invalid."""
+    try:
+        budget_ms = int(float(value))
+    except (TypeError, ValueError):
+        budget_ms = REQUEST_BUDGET_MS
+    if budget_ms <= 0:
+        budget_ms = REQUEST_BUDGET_MS
+    return min(budget_ms, MAX_BUDGET_MS) / 1000.0
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds):
+    """
+    Runs the block with a deadline `seconds` from now, or the enclosing
+    deadline if that is sooner. `seconds=None` keeps the enclosing one.
+    """
+    current = _deadline.get()
+    deadline = current
+    if seconds is not None:
+        deadline = time.monotonic() + max(0.0, seconds)
+        if current is not None:
+            deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def stage(share):
+    """Deadline scope for a stage allowed `share` (0-1) of the time left."""
+    left = remaining()
+    return deadline_scope(None if left is None else left * share)
+
+
+def run_with_budget(budget, fn, *args, **kwargs):
+    """Calls fn under a deadline of `budget` seconds; for executor-dispatched handlers."""
+    with deadline_scope(budget):
+        return fn(*args, **kwargs)
+
+
+def run_until(deadline, fn, *args, **kwargs):
+    """
+    Calls fn under an absolute time.monotonic() `deadline`, e.g. one fixed
+    when the request arrived, so time spent queued for a worker counts
+    against it. Raises DeadlineExceeded without calling fn once it passed.
+    """
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Deadline passed before a worker picked the request up")
+    with deadline_scope(left):
+        return fn(*args, **kwargs)
+
+
+def iter_with_budget(budget, iterable):
+    """
+    Iterates `iterable` under a deadline `budget` seconds from now; for
+    streamed responses. The scope is entered around each step because a
+    server may advance the stream from a different thread each time.
+    """
+    deadline = time.monotonic() + budget
+    iterator = iter(iterable)
+    while True:
+        with deadline_scope(max(0.0, deadline - time.monotonic())):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def remaining():
+    """Seconds left before the deadline (never negative), or None without one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check(stage_name="request"):
+    if expired():
+        raise DeadlineExceeded(f"Deadline exceeded before {stage_name}")
+
+
+def clamp(timeout):
+    """`timeout` cut to the time left; None stays None only when there is no deadline."""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
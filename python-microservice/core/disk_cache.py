@@ -0,0 +1,176 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(SERVICE_ROOT, ".cache"))
+
+_MISSING = object()
+
+
+def cache_path(filename):
+    os.makedirs(DEFAULT_CACHE_DIR, exist_ok=True)
+    return os.path.join(DEFAULT_CACHE_DIR, filename)
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value cache with per-entry TTLs and LRU eviction.
+
+    Entries are JSON-encoded so any plain value can be stored. A small
+    in-memory mirror answers repeat lookups without touching SQLite; access
+    times for those hits are flushed to disk in batches so the on-disk LRU
+    order stays close to the real one.
+    """
+
+    def __init__(self, path, max_entries=5000, memory_entries=1024, evict_every=64):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.evict_every = evict_every
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()
+        self._pending_touches = {}
+        self._writes_since_evict = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "expired": 0,
+            "sets": 0,
+            "evictions": 0,
+        }
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache(last_access)")
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._pending_touches[key] = now
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return default
+
+            raw_value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._pending_touches.pop(key, None)
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return default
+
+            value = json.loads(raw_value)
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            self._remember(key, value, expires_at)
+            self._counters["hits"] += 1
+            self._counters["disk_hits"] += 1
+            return value
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            self._pending_touches.pop(key, None)
+            self._remember(key, value, expires_at)
+            self._counters["sets"] += 1
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._pending_touches.pop(key, None)
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._pending_touches.clear()
+            self._conn.execute("DELETE FROM cache")
+
+    def entries(self, limit=None):
+        """Unexpired (key, value) pairs, most recently used first."""
+        with self._lock:
+            self._flush_touches()
+            rows = self._conn.execute(
+                "SELECT key, value FROM cache WHERE expires_at > ? ORDER BY last_access DESC LIMIT ?",
+                (time.time(), -1 if limit is None else limit),
+            ).fetchall()
+        return [(key, json.loads(raw_value)) for key, raw_value in rows]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touches(self):
+        if not self._pending_touches:
+            return
+        self._conn.executemany(
+            "UPDATE cache SET last_access = ? WHERE key = ?",
+            [(ts, key) for key, ts in self._pending_touches.items()],
+        )
+        self._pending_touches.clear()
+
+    def _evict(self):
+        self._writes_since_evict = 0
+        self._flush_touches()
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        cursor = self._conn.execute(
+            "DELETE FROM cache WHERE key IN ("
+            " SELECT key FROM cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        evicted = cursor.rowcount or 0
+        if evicted > 0:
+            self._counters["evictions"] += evicted
+            live_keys = {
+                row[0] for row in self._conn.execute("SELECT key FROM cache")
+            }
+            for key in [k for k in self._memory if k not in live_keys]:
+                del self._memory[key]
@@ -0,0 +1,58 @@
+"""
+Leveled, structured (JSON lines) logging with per-level sampling.
+
+LOG_LEVEL sets the threshold; LOG_SAMPLE_DEBUG / LOG_SAMPLE_INFO keep only
+that fraction of debug/info records so verbose diagnostics stay affordable
+under load. Warnings and errors are never sampled.
+"""
+import os
+import sys
+import json
+import random
+import logging
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+SAMPLE_RATES = {
+    logging.DEBUG: float(os.getenv("LOG_SAMPLE_DEBUG", 0.01)),
+    logging.INFO: float(os.getenv("LOG_SAMPLE_INFO", 1.0)),
+}
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        rate = SAMPLE_RATES.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Anything passed via `extra=` becomes a structured field.
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_root = logging.getLogger("dramapaglu")
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.addFilter(SamplingFilter())
+    _handler.setFormatter(
+        JSONFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(levelname)s %(name)s: %(message)s")
+    )
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+def get_logger(name):
+    return _root.getChild(name)
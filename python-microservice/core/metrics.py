@@ -0,0 +1,173 @@
+"""
+Minimal in-process metrics: labelled counters and latency histograms,
+rendered in the Prometheus text format for the /metrics endpoint.
+"""
+import time
+import bisect
+import functools
+import threading
+import contextlib
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "dramapaglu_"
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"buckets": cumulative, "sum": round(total, 4), "count": count}
+
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = []
+_help = {}
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def describe(name, help_text):
+    _help[name] = help_text
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    key = (name, _label_key(labels))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(key, LatencyHistogram())
+    histogram.observe(seconds)
+
+
+@contextlib.contextmanager
+def timer(stage, **labels):
+    """Records the block's duration under stage_seconds{stage=...}; errors also bump errors_total."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("errors_total", stage=stage, **labels)
+        raise
+    finally:
+        observe("stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+
+def timed_endpoint(endpoint):
+    """Decorator for handlers returning (payload, status, ...): records request latency by status."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            status = 500
+            try:
+                result = fn(*args, **kwargs)
+                status = result[1]
+                return result
+            finally:
+                elapsed = time.perf_counter() - started
+                observe("request_seconds", elapsed, endpoint=endpoint)
+                inc("requests_total", endpoint=endpoint, status=status)
+
+        return wrapper
+
+    return decorator
+
+
+def register_collector(collect):
+    """`collect()` returns [(name, labels, value)] gauges sampled at scrape time."""
+    _collectors.append(collect)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items(), key=lambda item: item[0])
+
+    seen = set()
+    for (name, labels), value in counters:
+        metric = PREFIX + name
+        if metric not in seen:
+            seen.add(metric)
+            if name in _help:
+                lines.append(f"# HELP {metric} {_help[name]}")
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    for (name, labels), histogram in histograms:
+        metric = PREFIX + name
+        if metric not in seen:
+            seen.add(metric)
+            if name in _help:
+                lines.append(f"# HELP {metric} {_help[name]}")
+            lines.append(f"# TYPE {metric} histogram")
+        snapshot = histogram.snapshot()
+        for bound, count in snapshot["buckets"].items():
+            lines.append(f"{metric}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {snapshot['sum']}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {snapshot['count']}")
+
+    gauges = {}
+    for collect in _collectors:
+        try:
+            samples = collect()
+        except Exception as e:
+            lines.append(f"# collector error: {e}")
+            continue
+        for name, labels, value in samples:
+            gauges.setdefault(PREFIX + name, []).append((_label_key(labels), value))
+    # The exposition format wants every sample of a metric family grouped together.
+    for metric, samples in gauges.items():
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} gauge")
+        for labels, value in samples:
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+describe("stage_seconds", "Latency of internal stages (LLM calls, poster providers, JSON parsing).")
+describe("request_seconds", "End-to-end handler latency per endpoint.")
+describe("requests_total", "Requests per endpoint and status.")
+describe("errors_total", "Errors raised inside timed stages.")
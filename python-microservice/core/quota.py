@@ -0,0 +1,268 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextlib
+import contextvars
+from datetime import datetime, timezone
+from core.deadline import DeadlineExceeded, clamp, expired
+from core.log import get_logger
+from core.metrics import observe, register_collector, timer
+
+logger = get_logger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+QUOTA_MAX_WAIT = float(os.getenv("QUOTA_MAX_WAIT", 30))
+QUOTA_BACKGROUND_MAX_WAIT = float(os.getenv("QUOTA_BACKGROUND_MAX_WAIT", 300))
+
+_priority = contextvars.ContextVar("quota_priority", default=INTERACTIVE)
+
+
+class QuotaExceeded(Exception):
+    """No request slot could be granted (daily cap reached or wait timed out)."""
+
+
+class AllowanceSpent(QuotaExceeded):
+    """The calling task already made every call its call_allowance() grants."""
+
+
+@contextlib.contextmanager
+def background_priority():
+    """Marks upstream calls made inside the block as background work."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_background():
+    return _priority.get() >= BACKGROUND
+
+
+class CallAllowance:
+    def __init__(self, limits):
+        self._left = dict(limits)
+        self._lock = threading.Lock()
+
+    def take(self, api):
+        with self._lock:
+            left = self._left.get(api)
+            if left is None:
+                return True
+            if left <= 0:
+                return False
+            self._left[api] = left - 1
+            return True
+
+    def refund(self, api):
+        with self._lock:
+            if api in self._left:
+                self._left[api] += 1
+
+    def spent(self, api):
+        with self._lock:
+            return self._left.get(api, 1) <= 0
+
+
+_allowance = contextvars.ContextVar("quota_allowance", default=None)
+
+
+@contextlib.contextmanager
+def call_allowance(**limits):
+    """
+    Caps how many calls per API (e.g. google_cse=20) the block may make,
+    including from threads running a copy of its context. Calls beyond the
+    cap raise AllowanceSpent without waiting for a slot.
+    """
+    allowance = CallAllowance(limits)
+    token = _allowance.set(allowance)
+    try:
+        yield allowance
+    finally:
+        _allowance.reset(token)
+
+
+def is_throttle_error(error):
+    """Recognizes 429 / quota responses from the Gemini, OpenAI and Google API clients."""
+    status = (
+        getattr(getattr(error, "resp", None), "status", None)
+        or getattr(error, "code", None)
+        or getattr(error, "status_code", None)
+    )
+    if status in (429, "429"):
+        return True
+    text = str(error)
+    return any(marker in text for marker in ("429", "Quota exceeded", "quotaExceeded", "RESOURCE_EXHAUSTED", "rateLimitExceeded"))
+
+
+class TokenBucket:
+    """
+    Per-API limiter: a requests-per-minute token bucket plus an optional
+    daily cap. Waiters are served strictly by (priority, arrival), and the
+    refill rate is cut on throttling responses and recovered additively on
+    success (AIMD), so sustained load settles just under the real quota.
+    A rate of 0 requests per minute disables the API: every call is refused.
+    """
+
+    def __init__(self, name, per_minute, per_day=0, min_per_minute=1.0):
+        self.name = name
+        self.disabled = per_minute <= 0
+        self.max_rate = max(per_minute, 0) / 60.0
+        self.min_rate = min(min_per_minute, max(per_minute, 0)) / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(1.0, per_minute / 6.0)
+        self.per_day = per_day
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._backoff = 1.0
+        self._day = self._today()
+        self._used_today = 0
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self.counters = {"granted": 0, "throttled": 0, "rejected": 0}
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        deadline = time.monotonic() + (timeout if timeout is not None else QUOTA_MAX_WAIT)
+        with self._cond:
+            if self.disabled:
+                self.counters["rejected"] += 1
+                raise QuotaExceeded(f"{self.name}: disabled (rate limit is 0 requests per minute)")
+            if self._today() != self._day:
+                self._day, self._used_today = self._today(), 0
+            if self.per_day and self._used_today >= self.per_day:
+                self.counters["rejected"] += 1
+                raise QuotaExceeded(f"{self.name}: daily cap of {self.per_day} requests reached")
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] == ticket and now >= self._blocked_until and self._tokens >= 1:
+                        self._tokens -= 1
+                        self._used_today += 1
+                        self.counters["granted"] += 1
+                        return
+                    if now >= deadline:
+                        self.counters["rejected"] += 1
+                        raise QuotaExceeded(f"{self.name}: no request slot within the wait budget")
+                    wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0.01)
+                    self._cond.wait(min(wait, deadline - now))
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def report_throttled(self):
+        with self._cond:
+            self.counters["throttled"] += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._blocked_until = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, 60.0)
+            self._tokens = 0
+        logger.warning(f"{self.name} throttled; rate cut to {self.rate * 60:.1f}/min, pausing {self._backoff / 2:.0f}s")
+
+    def report_success(self):
+        with self._cond:
+            self._backoff = 1.0
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "rate_per_minute": round(self.rate * 60, 2),
+                "max_per_minute": round(self.max_rate * 60, 2),
+                "used_today": self._used_today,
+                "daily_cap": self.per_day or None,
+                "waiting": len(self._waiters),
+                **self.counters,
+            }
+
+
+_buckets = {
+    "gemini": TokenBucket(
+        "gemini",
+        per_minute=float(os.getenv("GEMINI_RPM", 60)),
+        per_day=int(os.getenv("GEMINI_RPD", 0)),
+    ),
+    "google_cse": TokenBucket(
+        "google_cse",
+        per_minute=float(os.getenv("GOOGLE_CSE_RPM", 100)),
+        per_day=int(os.getenv("GOOGLE_CSE_RPD", 0)),
+    ),
+    "openai": TokenBucket(
+        "openai",
+        per_minute=float(os.getenv("OPENAI_RPM", 500)),
+        per_day=int(os.getenv("OPENAI_RPD", 0)),
+    ),
+}
+
+
+def get_bucket(api):
+    return _buckets[api]
+
+
+def call_with_quota(api, fn, *args, **kwargs):
+    """
+    Runs `fn` once a request slot for `api` is granted at the caller's
+    priority, feeding throttling responses back into the limiter.
+    """
+    bucket = _buckets[api]
+    priority = _priority.get()
+    timeout = clamp(QUOTA_BACKGROUND_MAX_WAIT if priority >= BACKGROUND else QUOTA_MAX_WAIT)
+    if expired():
+        raise DeadlineExceeded(f"Deadline exceeded before {api} call")
+    allowance = _allowance.get()
+    if allowance is not None and not allowance.take(api):
+        raise AllowanceSpent(f"{api}: call allowance for this task is spent")
+    started = time.perf_counter()
+    try:
+        bucket.acquire(priority, timeout)
+    except QuotaExceeded as e:
+        if allowance is not None:
+            allowance.refund(api)
+        if expired():
+            raise DeadlineExceeded(f"Deadline exceeded waiting for {api} quota") from e
+        raise
+    observe("stage_seconds", time.perf_counter() - started, stage="quota_wait", api=api)
+    try:
+        with timer("api_call", api=api):
+            result = fn(*args, **kwargs)
+    except Exception as e:
+        if is_throttle_error(e):
+            bucket.report_throttled()
+        raise
+    bucket.report_success()
+    return result
+
+
+def quota_stats():
+    return {name: bucket.stats() for name, bucket in _buckets.items()}
+
+
+def _collect_quota():
+    samples = []
+    for name, stats in quota_stats().items():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                samples.append((f"quota_{key}", {"api": name}, value))
+    return samples
+
+
+register_collector(_collect_quota)
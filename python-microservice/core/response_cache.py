@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+from core.disk_cache import DiskCache, cache_path
+from core.quota import background_priority
+from core.titles import normalize_title
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Fresh lifetime per drama status: ongoing shows gain episodes and ratings,
+# completed ones are effectively static.
+STATUS_TTLS = {
+    "ongoing": int(os.getenv("RESPONSE_CACHE_TTL_ONGOING", 6 * 3600)),
+    "upcoming": int(os.getenv("RESPONSE_CACHE_TTL_UPCOMING", 24 * 3600)),
+    "completed": int(os.getenv("RESPONSE_CACHE_TTL_COMPLETED", 30 * 24 * 3600)),
+}
+DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_TTL_DEFAULT", 24 * 3600))
+# How long past its fresh lifetime an entry may still be served while a
+# background refresh runs.
+STALE_TTL = int(os.getenv("RESPONSE_CACHE_STALE_TTL", 7 * 24 * 3600))
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _shared_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DiskCache(
+                os.getenv("RESPONSE_CACHE_PATH") or cache_path("responses.db"),
+                max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 20000)),
+                memory_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", 2048)),
+            )
+        return _store
+
+
+class ResponseCache:
+    """
+    Two-tier cache for drama detail responses. Entries are stored once under
+    the canonical title and reached through alias keys for the requested
+    title, the canonical title and every `altTitles` entry.
+    """
+
+    def __init__(self, namespace, store=None):
+        self.namespace = namespace
+        self.store = store or _shared_store()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def _alias_key(self, key):
+        return f"{self.namespace}:alias:{key}"
+
+    def _entry_key(self, key):
+        return f"{self.namespace}:entry:{key}"
+
+    def get(self, title):
+        """Returns (details, fresh) or (None, False) on a miss."""
+        key = normalize_title(title)
+        if not key:
+            return None, False
+        canonical = self.store.get(self._alias_key(key))
+        if canonical is None:
+            return None, False
+        entry = self.store.get(self._entry_key(canonical))
+        if entry is None:
+            return None, False
+        return entry["value"], entry["fresh_until"] > time.time()
+
+    def put(self, title, details):
+        canonical = normalize_title(details.get("title") or title)
+        if not canonical:
+            return
+        status = str(details.get("status") or "").lower()
+        ttl = STATUS_TTLS.get(status, DEFAULT_TTL)
+        self.store.set(
+            self._entry_key(canonical),
+            {"value": details, "fresh_until": time.time() + ttl},
+            ttl + STALE_TTL,
+        )
+
+        aliases = {normalize_title(title), canonical}
+        alt_titles = details.get("altTitles") or []
+        if isinstance(alt_titles, list):
+            aliases.update(normalize_title(alt) for alt in alt_titles if isinstance(alt, str))
+        for alias in aliases:
+            if alias:
+                self.store.set(self._alias_key(alias), canonical, ttl + STALE_TTL)
+
+    def refresh_in_background(self, title, compute):
+        """Runs `compute` once per title on a daemon thread; it is expected to put() on success."""
+        key = normalize_title(title)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                with background_priority():
+                    compute()
+            except Exception as e:
+                logger.info(f"Background refresh failed for '{title}': {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"refresh-{self.namespace}", daemon=True).start()
+
+    def stats(self):
+        return self.store.stats()
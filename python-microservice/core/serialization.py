@@ -0,0 +1,155 @@
+"""
+Response encoding shared by app.py and asgi.py so both servers send the
+same bytes:
+
+- dumps(): compact JSON, through orjson when it is installed;
+- ?fields=title,posterUrl: keeps only those keys of each listed drama (or
+  of the single object /fetch returns), for callers that render cards;
+- gzip or brotli chosen from Accept-Encoding for bodies of at least
+  COMPRESS_MIN_BYTES. Pre-encoded feed bodies are compressed once per ETag.
+"""
+import os
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from core.config import lazy_import
+from core.metrics import describe, inc
+
+orjson = lazy_import("orjson")
+brotli = lazy_import("brotli")
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+COMPRESS_CACHE_ENTRIES = int(os.getenv("COMPRESS_CACHE_ENTRIES", 256))
+MAX_FIELDS = 32
+
+# Keys whose list items a field projection applies to.
+LIST_KEYS = ("recommendations", "dramas", "similar", "results")
+
+_compressed = OrderedDict()
+_compressed_lock = threading.Lock()
+
+
+def dumps(payload):
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the stdlib encoder handles them
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def parse_fields(value):
+    """
+    Field names from a comma-separated string (or a list, from a JSON body);
+    None when no projection was asked for.
+    """
+    if not value:
+        return None
+    names = value.split(",") if isinstance(value, str) else value
+    fields = frozenset(name.strip() for name in names if isinstance(name, str) and name.strip())
+    if not fields or len(fields) > MAX_FIELDS:
+        return None
+    return fields
+
+
+def _project_item(item, fields):
+    if not isinstance(item, dict):
+        return item
+    return {key: value for key, value in item.items() if key in fields}
+
+
+def project(payload, fields):
+    """
+    Payload with each item of its drama list cut down to `fields`; a payload
+    without a list (a single drama) is projected itself. Error payloads are
+    returned unchanged.
+    """
+    if not fields or not isinstance(payload, dict) or "error" in payload:
+        return payload
+    lists = [key for key in LIST_KEYS if isinstance(payload.get(key), list)]
+    if not lists:
+        return _project_item(payload, fields)
+    projected = dict(payload)
+    for key in lists:
+        projected[key] = [_project_item(item, fields) for item in payload[key]]
+    return projected
+
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' or None, from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = ("br", "gzip") if brotli is not None else ("gzip",)
+    best = None
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (coding, quality)
+    return best[0] if best else None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compress_cached(body, encoding, cache_key):
+    key = (cache_key, encoding)
+    with _compressed_lock:
+        cached = _compressed.get(key)
+        if cached is not None:
+            _compressed.move_to_end(key)
+            return cached
+    compressed = _compress(body, encoding)
+    with _compressed_lock:
+        _compressed[key] = compressed
+        while len(_compressed) > COMPRESS_CACHE_ENTRIES:
+            _compressed.popitem(last=False)
+    return compressed
+
+
+def compress(body, accept_encoding, etag=None):
+    """
+    Returns (body, headers) with `body` compressed when the client accepts
+    it and it is big enough to be worth it. With an `etag` the compressed
+    body is cached, and the ETag comes back weakened (the bytes differ from
+    the identity encoding) for the caller to send instead.
+    """
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, {}
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None:
+        return body, headers
+    compressed = _compress_cached(body, encoding, etag) if etag else _compress(body, encoding)
+    inc("response_bytes_total", len(body), encoding="identity")
+    inc("response_bytes_total", len(compressed), encoding=encoding)
+    headers["Content-Encoding"] = encoding
+    if etag:
+        headers["ETag"] = etag if etag.startswith("W/") else f"W/{etag}"
+    return compressed, headers
+
+
+def encode(payload, fields=None, accept_encoding=None):
+    """(body, headers) for a handler's payload: projected, encoded and compressed."""
+    return compress(dumps(project(payload, fields)), accept_encoding)
+
+
+describe("response_bytes_total", "Bytes of compressed responses before (identity) and after encoding.")
@@ -0,0 +1,122 @@
+import os
+import copy
+import hashlib
+import functools
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: file-lock mode is unavailable.
+    fcntl = None
+
+from core.deadline import DeadlineExceeded, clamp, expired
+from core.disk_cache import DEFAULT_CACHE_DIR
+
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function, everyone else arriving while it is in flight waits and gets the
+    same result or exception.
+
+    With `lock_dir` set, the leader also holds an exclusive file lock for the
+    key, so leaders in other worker processes queue behind it instead of
+    starting a parallel upstream call. Once they get the lock they run the
+    function themselves, which is cheap when it sits behind a shared cache.
+    """
+
+    def __init__(self, name, lock_dir=None):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, *args, **kwargs):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.counters["coalesced"] += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    self.counters["leaders"] += 1
+                    leader = True
+            if leader:
+                break
+
+            # Followers give up at their own deadline; the leader carries on.
+            if not call.done.wait(clamp(None)):
+                raise DeadlineExceeded(f"Deadline exceeded waiting for {self.name}")
+            if isinstance(call.error, DeadlineExceeded) and not expired():
+                # The leader ran out of its own budget; this caller still has time.
+                continue
+            if call.error is not None:
+                raise call.error
+            # Each follower gets its own copy of the leader's snapshot.
+            return copy.deepcopy(call.result)
+
+        try:
+            result = self._run(key, fn, args, kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+            raise
+        with self._lock:
+            self._calls.pop(key, None)
+            waiters = call.waiters
+        if waiters:
+            # Copied before followers wake: the leader's caller routinely
+            # mutates the returned dicts (posterUrl etc.) right away.
+            call.result = copy.deepcopy(result)
+        call.done.set()
+        return result
+
+    def _run(self, key, fn, args, kwargs):
+        if not self.lock_dir:
+            return fn(*args, **kwargs)
+        digest = hashlib.sha1(f"{self.name}:{key}".encode("utf-8")).hexdigest()
+        with open(os.path.join(self.lock_dir, f"{digest}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def single_flight(name, key=None):
+    """
+    Decorator form of SingleFlight. `key` maps the call arguments to the
+    coalescing key and defaults to the repr of the arguments.
+    """
+    lock_dir = None
+    if SINGLEFLIGHT_LOCK_DIR:
+        lock_dir = SINGLEFLIGHT_LOCK_DIR if SINGLEFLIGHT_LOCK_DIR != "1" else os.path.join(DEFAULT_CACHE_DIR, "locks")
+    group = SingleFlight(name, lock_dir=lock_dir)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call_key = key(*args, **kwargs) if key else repr((args, sorted(kwargs.items())))
+            return group.do(call_key, fn, *args, **kwargs)
+
+        wrapper.single_flight = group
+        return wrapper
+
+    return decorator
@@ -0,0 +1,17 @@
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_title(title):
+    """
+    Folds a drama title into a stable lookup key: NFKC, lowercase,
+    punctuation removed and whitespace collapsed.
+    """
+    if not title:
+        return ""
+    folded = unicodedata.normalize("NFKC", str(title)).casefold()
+    folded = _NON_WORD.sub(" ", folded)
+    return _WHITESPACE.sub(" ", folded).strip()
@@ -0,0 +1,142 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from catalog.store import get_catalog
+from core.disk_cache import DiskCache, cache_path
+from core.quota import background_priority, call_allowance
+from core.titles import normalize_title
+from llm.recommendations import get_llm_recommendation_pool
+from scrapers.drama_scraper import find_poster
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+GENRE_POOL_ENABLED = os.getenv("GENRE_POOL_ENABLED", "1") != "0"
+GENRE_POOL_BATCH_SIZE = int(os.getenv("GENRE_POOL_BATCH_SIZE", 60))
+GENRE_POOL_MAX_SIZE = int(os.getenv("GENRE_POOL_MAX_SIZE", 200))
+GENRE_POOL_TTL = int(os.getenv("GENRE_POOL_TTL", 3 * 24 * 3600))
+# Refill once fewer than this many pool entries survive a request's exclusions.
+GENRE_POOL_LOW_WATER = int(os.getenv("GENRE_POOL_LOW_WATER", 20))
+GENRE_POOL_PREFILL = [g.strip() for g in os.getenv("GENRE_POOL_PREFILL", "").split(",") if g.strip()]
+UPCOMING_POSTER = "https://via.placeholder.com/500x750.png?text=Upcoming"
+# Refills run one at a time on their own thread, off the poster pool that
+# serves requests, and may spend at most this many upstream calls each;
+# titles left without a poster lookup wait for the next refill.
+GENRE_POOL_REFILL_WORKERS = int(os.getenv("GENRE_POOL_REFILL_WORKERS", 1))
+GENRE_POOL_REFILL_CSE_CALLS = int(os.getenv("GENRE_POOL_REFILL_CSE_CALLS", 20))
+GENRE_POOL_REFILL_LLM_CALLS = int(os.getenv("GENRE_POOL_REFILL_LLM_CALLS", 2))
+
+_refill_executor = ThreadPoolExecutor(max_workers=GENRE_POOL_REFILL_WORKERS, thread_name_prefix="pool-refill")
+
+
+class GenrePool:
+    """
+    Per-genre candidate pools filled ahead of time with large Gemini batches.
+    Requests are answered by filtering a pool against the caller's exclusions
+    and sampling, so prompt size no longer grows with the user's list.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._refilling = set()
+
+    def _key(self, genre):
+        return f"pool:{normalize_title(genre)}"
+
+    def _load(self, genre):
+        key = normalize_title(genre)
+        with self._lock:
+            pool = self._pools.get(key)
+        if pool is None:
+            entries = self.store.get(self._key(genre)) or []
+            pool = [(normalize_title(rec["title"]), rec) for rec in entries]
+            with self._lock:
+                self._pools[key] = pool
+        return pool
+
+    def sample(self, genre, exclude_titles, count=5):
+        """Returns `count` recommendations not in `exclude_titles`, or None if the pool can't cover it."""
+        pool = self._load(genre)
+        excluded = {normalize_title(t) for t in exclude_titles if isinstance(t, str)}
+        available = [rec for title_key, rec in pool if title_key not in excluded]
+
+        if len(available) < GENRE_POOL_LOW_WATER:
+            self.refill_in_background(genre)
+        if len(available) < count:
+            return None
+        return [dict(rec) for rec in random.sample(available, count)]
+
+    def refill(self, genre):
+        with call_allowance(
+            google_cse=GENRE_POOL_REFILL_CSE_CALLS,
+            gemini=GENRE_POOL_REFILL_LLM_CALLS,
+            openai=GENRE_POOL_REFILL_LLM_CALLS,
+        ) as allowance:
+            return self._refill(genre, allowance)
+
+    def _refill(self, genre, allowance):
+        pool = self._load(genre)
+        known_titles = [rec["title"] for _, rec in pool]
+        fresh = get_llm_recommendation_pool(genre, GENRE_POOL_BATCH_SIZE, known_titles)
+        known = {title_key for title_key, _ in pool}
+        candidates = [rec for rec in fresh if normalize_title(rec["title"]) not in known]
+
+        # Posters are looked up one title at a time on this thread, so a
+        # refill never holds more than one search slot at once.
+        additions = []
+        for rec in candidates:
+            if rec["status"] == "upcoming":
+                rec["posterUrl"] = UPCOMING_POSTER
+            elif allowance.spent("google_cse"):
+                continue
+            else:
+                rec["posterUrl"] = find_poster(rec["title"])
+            additions.append(rec)
+        if len(additions) < len(candidates):
+            logger.info(f"Genre pool '{genre}': search allowance spent, {len(candidates) - len(additions)} titles deferred.")
+        if not additions:
+            return 0
+
+        get_catalog().upsert_many(additions)
+        merged = (pool + [(normalize_title(rec["title"]), rec) for rec in additions])[-GENRE_POOL_MAX_SIZE:]
+        with self._lock:
+            self._pools[normalize_title(genre)] = merged
+        self.store.set(self._key(genre), [rec for _, rec in merged], GENRE_POOL_TTL)
+        logger.info(f"Genre pool '{genre}' now holds {len(merged)} titles (+{len(additions)}).")
+        return len(additions)
+
+    def refill_in_background(self, genre):
+        key = normalize_title(genre)
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+
+        def run():
+            try:
+                with background_priority():
+                    self.refill(genre)
+            except Exception as e:
+                logger.info(f"Genre pool refill failed for '{genre}': {e}")
+            finally:
+                with self._lock:
+                    self._refilling.discard(key)
+
+        _refill_executor.submit(run)
+
+
+_pool = GenrePool(DiskCache(os.getenv("GENRE_POOL_PATH") or cache_path("genre_pools.db"), max_entries=500))
+
+
+def recommend_from_pool(genre, exclude_titles, count=5):
+    if not GENRE_POOL_ENABLED:
+        return None
+    return _pool.sample(genre, exclude_titles or [], count)
+
+
+def prefill_genre_pools():
+    for genre in GENRE_POOL_PREFILL:
+        _pool.refill_in_background(genre)
@@ -0,0 +1,274 @@
+"""
+/new-releases feed. A background job asks Gemini which dramas premiered
+recently or are airing now, enriches only the titles the feed doesn't hold
+yet (catalog first, then one batched details prompt and a poster pass) and
+publishes the merged, date-sorted list as a snapshot. Requests page through
+an in-memory index of that snapshot with opaque cursors, so pages stay
+stable while new premieres are added at the top.
+"""
+import os
+import json
+import base64
+import bisect
+import hashlib
+import datetime
+import threading
+from catalog.store import get_catalog
+from core.disk_cache import DEFAULT_CACHE_DIR
+from core.metrics import inc
+from core.serialization import dumps, project
+from core.singleflight import single_flight
+from core.titles import normalize_title
+from feeds.snapshot import PeriodicRefresher, SnapshotStore
+from llm.drama_metadata import get_llm_drama_details_batch
+from llm.new_releases import get_new_releases_llm
+from scrapers.drama_scraper import find_posters
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+NEW_RELEASES_REFRESH_INTERVAL = int(os.getenv("NEW_RELEASES_REFRESH_INTERVAL", 3 * 3600))
+NEW_RELEASES_WINDOW_DAYS = int(os.getenv("NEW_RELEASES_WINDOW_DAYS", 90))
+NEW_RELEASES_DISCOVERY_COUNT = int(os.getenv("NEW_RELEASES_DISCOVERY_COUNT", 30))
+NEW_RELEASES_MAX_ITEMS = int(os.getenv("NEW_RELEASES_MAX_ITEMS", 300))
+NEW_RELEASES_PAGE_SIZE = int(os.getenv("NEW_RELEASES_PAGE_SIZE", 20))
+NEW_RELEASES_MAX_PAGE_SIZE = int(os.getenv("NEW_RELEASES_MAX_PAGE_SIZE", 100))
+UPCOMING_POSTER = "https://via.placeholder.com/500x750.png?text=Upcoming"
+# Discovery fields that may change between refreshes for a known title.
+TRACKED_FIELDS = ("status", "airDate", "network", "year")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _release_date(item):
+    # Titles without a known premiere date are placed by when the feed first saw them.
+    return item.get("airDate") or item.get("firstSeen") or ""
+
+
+def _sort_key(item):
+    return (_release_date(item), item["id"])
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Malformed cursor")
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(part, str) for part in key)):
+        raise InvalidCursor("Malformed cursor")
+    return tuple(key)
+
+
+def _details_failed(details):
+    description = (details or {}).get("description") or ""
+    return not details or description.startswith("Error") or description in ("Details unavailable.", "LLM service not configured.")
+
+
+def _enrich(discovered):
+    """
+    Full records for newly discovered titles: catalog hits first, then one
+    batched LLM pass. Titles the LLM could not describe (error, quota, the
+    request deadline on a cold build) come back as bare release entries
+    marked "enriched": False, for the next refresh to retry.
+    """
+    catalog = get_catalog()
+    records = [catalog.lookup(release["title"], require_details=True) for release in discovered]
+    missing = [index for index, record in enumerate(records) if record is None]
+    resolved = set()
+    if missing:
+        try:
+            batch = get_llm_drama_details_batch([discovered[i]["title"] for i in missing])
+        except Exception as e:
+            logger.warning(f"New releases: details for {len(missing)} titles failed: {e}")
+            batch = []
+        for index, details in zip(missing, batch):
+            if not _details_failed(details):
+                records[index] = details
+                resolved.add(index)
+
+    lookups = []
+    for index, release in enumerate(discovered):
+        record = dict(records[index] or {"title": release["title"]})
+        # Discovery is fresher than stored details for release fields.
+        for field in TRACKED_FIELDS:
+            if release.get(field) is not None:
+                record[field] = release[field]
+        records[index] = record
+        if record.get("status") == "upcoming":
+            record["posterUrl"] = UPCOMING_POSTER
+        elif not record.get("posterUrl"):
+            lookups.append(record)
+    for record, poster_url in zip(lookups, find_posters([record["title"] for record in lookups])):
+        record["posterUrl"] = poster_url
+
+    for index, record in enumerate(records):
+        # Records that came from the catalog only fill in fields it lacks.
+        catalog.upsert(record, aliases=[discovered[index]["title"]], overwrite=index in resolved)
+    for index in set(missing) - resolved:
+        records[index]["enriched"] = False
+    return records
+
+
+def _is_expired(item, cutoff):
+    return item.get("status") != "ongoing" and _release_date(item) < cutoff
+
+
+def build_new_releases(previous_items, discovered, today):
+    """
+    Merges one discovery pass into the previous feed items. Titles the feed
+    doesn't hold are enriched, as are items an earlier pass left
+    unenriched; known ones just take the updated release fields. Returns
+    (items sorted newest first, change counts).
+    """
+    items = {item["id"]: item for item in previous_items}
+    catalog = get_catalog()
+    new_releases, new_ids = [], []
+    changes = {"added": 0, "updated": 0, "enriched": 0, "expired": 0}
+
+    for release in discovered:
+        # Exact/alias matches only: a fuzzy hit could merge two different dramas.
+        known = catalog.lookup(release["title"])
+        item_id = normalize_title(known["title"] if known else release["title"])
+        if not item_id or item_id in new_ids:
+            continue
+        item = items.get(item_id)
+        if item is None:
+            new_releases.append(release)
+            new_ids.append(item_id)
+            continue
+        updated = {field: release[field] for field in TRACKED_FIELDS if release.get(field) not in (None, item.get(field))}
+        if updated:
+            items[item_id] = {**item, **updated}
+            changes["updated"] += 1
+
+    if new_releases:
+        first_seen = today.isoformat()
+        for item_id, record in zip(new_ids, _enrich(new_releases)):
+            items[item_id] = {**record, "id": item_id, "firstSeen": first_seen}
+        changes["added"] = len(new_releases)
+
+    retry_ids = [item_id for item_id, item in items.items() if item.get("enriched") is False and item_id not in new_ids]
+    if retry_ids:
+        retried = _enrich([items[item_id] for item_id in retry_ids])
+        for item_id, record in zip(retry_ids, retried):
+            items[item_id] = {**record, "id": item_id, "firstSeen": items[item_id].get("firstSeen")}
+            if record.get("enriched") is not False:
+                changes["enriched"] += 1
+
+    cutoff = (today - datetime.timedelta(days=NEW_RELEASES_WINDOW_DAYS)).isoformat()
+    kept = [item for item in items.values() if not _is_expired(item, cutoff)]
+    kept.sort(key=_sort_key, reverse=True)
+    kept = kept[:NEW_RELEASES_MAX_ITEMS]
+    changes["expired"] = len(items) - len(kept)
+    return kept, changes
+
+
+def _build_payload():
+    previous = _store.current(reload=True)
+    previous_items = previous.payload.get("dramas", []) if previous else []
+    today = datetime.date.today()
+    discovered = get_new_releases_llm(today, NEW_RELEASES_WINDOW_DAYS, NEW_RELEASES_DISCOVERY_COUNT)
+    if not discovered:
+        return None
+    items, changes = build_new_releases(previous_items, discovered, today)
+    for change, count in changes.items():
+        if count:
+            inc("new_releases_changes_total", count, change=change)
+    logger.info(
+        f"New releases refresh: {changes['added']} added, {changes['updated']} updated, "
+        f"{changes['enriched']} enriched, {changes['expired']} expired, {len(items)} in feed."
+    )
+    return {"dramas": items}
+
+
+class ReleaseIndex:
+    """
+    Sorted view of one feed snapshot: sort keys for cursor lookups and each
+    item pre-encoded once, so a page is a bisect plus a byte join.
+    """
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.generated_at = snapshot.generated_at
+        items = sorted(snapshot.payload.get("dramas", []), key=_sort_key)
+        self._keys = [_sort_key(item) for item in items]
+        self._items = items
+        self._encoded = [dumps(item) for item in items]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def page(self, cursor_key, limit, fields=None):
+        """
+        Returns (encoded items newest first, next cursor key or None) for the
+        items older than `cursor_key`. Items projected to `fields` are
+        encoded on the fly.
+        """
+        end = len(self._keys) if cursor_key is None else bisect.bisect_left(self._keys, cursor_key)
+        start = max(0, end - limit)
+        next_key = self._keys[start] if start > 0 else None
+        if fields:
+            return [dumps(project(item, fields)) for item in self._items[start:end][::-1]], next_key
+        return self._encoded[start:end][::-1], next_key
+
+
+_store = SnapshotStore(os.path.join(DEFAULT_CACHE_DIR, "snapshots"), "new_releases")
+_refresher = PeriodicRefresher(
+    _store,
+    _build_payload,
+    NEW_RELEASES_REFRESH_INTERVAL,
+    is_valid=lambda payload: bool(payload and payload.get("dramas")),
+)
+_index = None
+_index_lock = threading.Lock()
+
+
+def start_new_releases_refresher():
+    _refresher.start()
+
+
+@single_flight("new_releases_cold_start", key=lambda: "new_releases")
+def _build_first_snapshot():
+    return _refresher.refresh(wait=True) or _store.current()
+
+
+def _current_index():
+    global _index
+    snapshot = _store.current()
+    if snapshot is None:
+        _refresher.start()
+        snapshot = _build_first_snapshot()
+    if snapshot is None:
+        return None
+    with _index_lock:
+        if _index is None or _index.version != snapshot.version:
+            _index = ReleaseIndex(snapshot)
+        return _index
+
+
+def get_new_releases_page(cursor=None, limit=None, fields=None):
+    """
+    Returns (body bytes, etag) for one page of the feed, its items cut down
+    to `fields` when given. Raises InvalidCursor for a cursor this feed
+    didn't issue.
+    """
+    cursor_key = decode_cursor(cursor) if cursor else None
+    limit = max(1, min(limit or NEW_RELEASES_PAGE_SIZE, NEW_RELEASES_MAX_PAGE_SIZE))
+    index = _current_index()
+    if index is None:
+        return b'{"dramas":[],"nextCursor":null}', None
+
+    items, next_key = index.page(cursor_key, limit, fields)
+    next_cursor = encode_cursor(next_key) if next_key else None
+    body = (
+        b'{"dramas":[' + b",".join(items) + b'],"nextCursor":' + json.dumps(next_cursor).encode("utf-8")
+        + b',"total":' + str(len(index)).encode("ascii")
+        + b',"updatedAt":' + json.dumps(index.generated_at).encode("utf-8") + b"}"
+    )
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
@@ -0,0 +1,208 @@
+import os
+import json
+import glob
+import time
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: every worker refreshes on its own.
+    fcntl = None
+
+from core.deadline import remaining
+from core.quota import background_priority
+from core.serialization import dumps
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_RELOAD_CHECK = float(os.getenv("SNAPSHOT_RELOAD_CHECK", 30))
+# First retry after a failed build; doubles per consecutive failure up to
+# the refresh interval, so an upstream outage isn't hammered.
+SNAPSHOT_RETRY_DELAY = float(os.getenv("SNAPSHOT_RETRY_DELAY", 30))
+_LOCK_POLL = 0.05
+
+
+class Snapshot:
+    def __init__(self, version, generated_at, payload):
+        self.version = version
+        self.generated_at = generated_at
+        self.payload = payload
+        # Pre-encoded once so serving is a memory read.
+        self.body = dumps(payload)
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+
+
+class SnapshotStore:
+    """
+    Versioned JSON snapshots on disk (`<name>.v<version>.json`), written
+    atomically via rename. The newest version is kept in memory and reloaded
+    when another worker process publishes a newer one.
+    """
+
+    def __init__(self, directory, name, keep_versions=3):
+        self.directory = directory
+        self.name = name
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._current = None
+        self._last_reload_check = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, version):
+        return os.path.join(self.directory, f"{self.name}.v{version}.json")
+
+    def _versions(self):
+        versions = []
+        for path in glob.glob(os.path.join(self.directory, f"{self.name}.v*.json")):
+            suffix = os.path.basename(path)[len(self.name) + 2:-len(".json")]
+            if suffix.isdigit():
+                versions.append(int(suffix))
+        return sorted(versions)
+
+    def current(self, reload=False):
+        now = time.monotonic()
+        if reload or self._current is None or now - self._last_reload_check >= SNAPSHOT_RELOAD_CHECK:
+            self._last_reload_check = now
+            self._reload()
+        return self._current
+
+    def _reload(self):
+        versions = self._versions()
+        if not versions:
+            return
+        latest = versions[-1]
+        if self._current is not None and self._current.version >= latest:
+            return
+        try:
+            with open(self._path(latest), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.info(f"Could not load snapshot '{self.name}' v{latest}: {e}")
+            return
+        with self._lock:
+            self._current = Snapshot(stored["version"], stored["generated_at"], stored["payload"])
+
+    def publish(self, payload):
+        with self._lock:
+            versions = self._versions()
+            version = (versions[-1] if versions else 0) + 1
+            snapshot = Snapshot(version, time.time(), payload)
+            tmp_path = self._path(version) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": version, "generated_at": snapshot.generated_at, "payload": payload},
+                    f,
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(version))
+            self._current = snapshot
+
+            for old in self._versions()[:-self.keep_versions]:
+                try:
+                    os.remove(self._path(old))
+                except OSError:
+                    pass
+        return snapshot
+
+    def age(self, reload=False):
+        snapshot = self.current(reload)
+        return None if snapshot is None else time.time() - snapshot.generated_at
+
+
+class PeriodicRefresher:
+    """
+    Rebuilds a snapshot on a fixed interval on a daemon thread. A file lock
+    makes sure only one worker process runs the build at a time; the others
+    pick up the published file.
+    """
+
+    def __init__(self, store, build, interval, is_valid=None):
+        self.store = store
+        self.build = build
+        self.interval = interval
+        self.is_valid = is_valid or bool
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._lock_path = os.path.join(store.directory, f"{store.name}.lock")
+        self.failures = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name=f"refresh-{self.store.name}", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            age = self.store.age()
+            if age is None or age >= self.interval:
+                with background_priority():
+                    self.refresh()
+                age = self.store.age()
+            time.sleep(max(self.next_wait(age), 1))
+
+    def next_wait(self, age):
+        """Seconds until the next refresh attempt for a snapshot `age` seconds old (None: no snapshot)."""
+        if age is not None and age < self.interval:
+            return self.interval - age
+        if self.failures:
+            return min(self.interval, SNAPSHOT_RETRY_DELAY * 2 ** (self.failures - 1))
+        # Skipped while another worker builds: check back for its snapshot.
+        return min(self.interval, SNAPSHOT_RETRY_DELAY)
+
+    def _lock_file(self, lock_file, wait):
+        """Takes the cross-process build lock; with `wait`, only until the caller's deadline."""
+        if fcntl is None:
+            return True
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                left = remaining()
+                if not wait or (left is not None and left <= 0):
+                    return False
+                time.sleep(_LOCK_POLL if left is None else min(_LOCK_POLL, left))
+
+    def refresh(self, wait=False):
+        """
+        Builds and publishes a new snapshot; returns it, or None if skipped or
+        invalid. With `wait`, a build already running in this or another
+        process is waited for (up to the request deadline) and its snapshot
+        returned instead.
+        """
+        if wait:
+            left = remaining()
+            acquired = self._refresh_lock.acquire(timeout=-1 if left is None else left)
+        else:
+            acquired = self._refresh_lock.acquire(blocking=False)
+        if not acquired:
+            return None
+        try:
+            with open(self._lock_path, "w") as lock_file:
+                if not self._lock_file(lock_file, wait):
+                    return None
+                if wait:
+                    age = self.store.age(reload=True)
+                    if age is not None and age < self.interval:
+                        return self.store.current()
+                payload = self.build()
+                if not self.is_valid(payload):
+                    self.failures += 1
+                    logger.info(f"Snapshot build for '{self.store.name}' returned no usable data; keeping previous version.")
+                    return None
+                snapshot = self.store.publish(payload)
+                self.failures = 0
+                logger.info(f"Published snapshot '{self.store.name}' v{snapshot.version}")
+                return snapshot
+        except Exception as e:
+            self.failures += 1
+            logger.info(f"Snapshot refresh for '{self.store.name}' failed: {e}")
+            return None
+        finally:
+            self._refresh_lock.release()
@@ -0,0 +1,71 @@
+import os
+import time
+from catalog.store import get_catalog
+from core.deadline import expired
+from core.disk_cache import DEFAULT_CACHE_DIR
+from core.singleflight import single_flight
+from feeds.snapshot import PeriodicRefresher, Snapshot, SnapshotStore
+from llm.top_dramas import get_top_dramas_llm
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+TOP_DRAMAS_REFRESH_INTERVAL = int(os.getenv("TOP_DRAMAS_REFRESH_INTERVAL", 6 * 3600))
+# How long a cold-start build cut short by the request deadline is served
+# while the background refresher builds the real snapshot.
+TOP_DRAMAS_DEGRADED_TTL = int(os.getenv("TOP_DRAMAS_DEGRADED_TTL", 60))
+
+_degraded = None
+
+
+def _build_top_dramas():
+    global _degraded
+    payload = get_top_dramas_llm()
+    if expired():
+        # Posters timed out into placeholders: serve this build briefly but
+        # don't publish it for TOP_DRAMAS_REFRESH_INTERVAL.
+        if payload.get("dramas"):
+            _degraded = Snapshot(0, time.time(), payload)
+        logger.info("Top dramas build ran past the request deadline; not publishing it.")
+        return None
+    get_catalog().upsert_many(payload.get("dramas", []))
+    return payload
+
+
+_store = SnapshotStore(os.path.join(DEFAULT_CACHE_DIR, "snapshots"), "top_dramas")
+_refresher = PeriodicRefresher(
+    _store,
+    _build_top_dramas,
+    TOP_DRAMAS_REFRESH_INTERVAL,
+    is_valid=lambda payload: bool(payload and payload.get("dramas")),
+)
+
+
+def start_top_dramas_refresher():
+    _refresher.start()
+
+
+def _fresh_degraded():
+    snapshot = _degraded
+    if snapshot is not None and time.time() - snapshot.generated_at < TOP_DRAMAS_DEGRADED_TTL:
+        return snapshot
+    return None
+
+
+@single_flight("top_dramas_cold_start", key=lambda: "top_dramas")
+def _build_first_snapshot():
+    return _refresher.refresh(wait=True) or _store.current() or _fresh_degraded()
+
+
+def get_top_dramas_snapshot():
+    """
+    Returns the latest published top-dramas Snapshot. Only a cold start with
+    nothing on disk builds one on the request path; if that build runs out
+    of request time it is served unpublished for TOP_DRAMAS_DEGRADED_TTL
+    while the refresher thread, which has no deadline, retries.
+    """
+    snapshot = _store.current() or _fresh_degraded()
+    if snapshot is None:
+        _refresher.start()
+        snapshot = _build_first_snapshot()
+    return snapshot
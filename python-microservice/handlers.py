@@ -0,0 +1,437 @@
+"""
+Framework-independent endpoint logic shared by the Flask app (app.py) and
+the ASGI app (asgi.py). Every handler returns a (payload, status) pair so
+both servers produce identical JSON.
+"""
+import os
+import json
+import hashlib
+from llm.drama_metadata import get_llm_drama_details, get_llm_drama_details_batch
+from llm.url_metadata import get_structured_data_for_title_from_asianwiki
+from scrapers.drama_scraper import find_poster as find_poster_url, find_posters, poster_cache_stats, start_poster_recheck
+from scrapers.poster_validation import live_poster_url, probe_stats
+from media import image_proxy
+from llm.recommendations import get_llm_recommendations_for_genre, iter_llm_recommendations_for_genre
+from feeds.genre_pool import prefill_genre_pools, recommend_from_pool
+from feeds.top_dramas import get_top_dramas_snapshot, start_top_dramas_refresher
+from feeds.new_releases import InvalidCursor, get_new_releases_page, start_new_releases_refresher
+from core.response_cache import ResponseCache
+from catalog.store import get_catalog
+from catalog.similarity import SIMILARITY_ENABLED, similar_for_genre, similar_to, start_similarity_indexer
+from core.config import start_warmup
+from core.deadline import LLM_BUDGET_SHARE, expired, stage
+from core.log import get_logger
+from core.serialization import dumps, project
+from core.metrics import register_collector, timed_endpoint
+
+logger = get_logger(__name__)
+
+_details_cache = ResponseCache("fetch")
+_url_details_cache = ResponseCache("fetch-from-url")
+
+FETCH_BATCH_MAX_TITLES = int(os.getenv("FETCH_BATCH_MAX_TITLES", 100))
+
+def _collect_cache_metrics():
+    samples = []
+    # Both response caches share one store, so it is reported once.
+    for cache, stats in (
+        ("response", _details_cache.stats()),
+        ("poster", poster_cache_stats()),
+        ("poster_probe", probe_stats()),
+    ):
+        for key, value in stats.items():
+            samples.append((f"cache_{key}", {"cache": cache}, value))
+    return samples
+
+register_collector(_collect_cache_metrics)
+
+def _fallback_details(title, poster_url):
+    return {
+        "title": title, # Use original title
+        "posterUrl": poster_url,
+        "description": "Details unavailable.",
+        # Add other fields as null or default if needed by frontend
+        "year": None,
+        "genres": [],
+        "status": "unknown",
+        "altTitles": [],
+        "country": "Unknown",
+        "cast": [],
+        "rating": None,
+        "sourceUrl": None,
+        "type": "drama"
+    }
+
+def _with_live_poster(details):
+    # Cached details may still carry a poster the recheck job found dead.
+    poster_url = details.get("posterUrl")
+    live_url = live_poster_url(poster_url)
+    return details if live_url == poster_url else {**details, "posterUrl": live_url}
+
+def _llm_details_failed(details):
+    return not details or details.get("description", "").startswith("Error")
+
+def _fetch_details(title):
+    # The LLM gets a share of the request's budget; the poster search the rest.
+    with stage(LLM_BUDGET_SHARE):
+        llm_details = get_llm_drama_details(title)
+    if _llm_details_failed(llm_details):
+         logger.info(f"LLM failed to provide details for '{title}'.")
+         # Fallback: Still try to find poster with original title
+         # Return the fallback with a 200 OK but indicate partial data.
+         # Fallbacks are not cached so the next request retries the LLM.
+         return _fallback_details(title, find_poster_url(title)), 200
+
+    # If LLM details are good, find poster using the (potentially corrected) LLM title
+    poster_url = find_poster_url(llm_details.get("title", title))
+    final_details = llm_details
+    final_details["posterUrl"] = poster_url
+    logger.info(f"Combined details for '{title}': Poster found - {'Yes' if poster_url and not poster_url.startswith('[https://via.placeholder](https://via.placeholder)') else 'No'}")
+    # Past the deadline the poster may be a stand-in; serve it but don't keep it.
+    if final_details.get("description") != "LLM service not configured." and not expired():
+        _details_cache.put(title, final_details)
+        get_catalog().upsert(final_details, aliases=[title])
+    return final_details, 200
+
+def _fetch_details_from_url(title):
+    with stage(LLM_BUDGET_SHARE):
+        llm_details = get_structured_data_for_title_from_asianwiki(title)
+
+    if llm_details.get("error"):
+        # If LLM failed, return the error
+        return llm_details, 500
+
+    # If LLM details are good, find poster using the extracted title
+    extracted_title = llm_details.get("title", title)
+    poster_url = find_poster_url(extracted_title)
+
+    llm_details["posterUrl"] = poster_url
+
+    logger.info(f"URL Fetch successful for '{extracted_title}': Poster found - {'Yes' if poster_url and not poster_url.startswith('[https://via.placeholder](https://via.placeholder)') else 'No'}")
+    if not expired():
+        _url_details_cache.put(title, llm_details)
+        get_catalog().upsert(llm_details, aliases=[title])
+    return llm_details, 200
+
+@timed_endpoint("fetch")
+def fetch(title):
+    if not title:
+        return {"error": "Title parameter is required"}, 400
+    try:
+        cached, fresh = _details_cache.get(title)
+        if cached is not None:
+            if not fresh:
+                _details_cache.refresh_in_background(title, lambda: _fetch_details(title))
+            return _with_live_poster(cached), 200
+
+        # Known drama under another spelling, alias or with a typo
+        known = get_catalog().lookup(title, require_details=True)
+        if known is not None:
+            return _with_live_poster(known), 200
+
+        return _fetch_details(title)
+    except Exception as e:
+        logger.exception(f"Error in /fetch endpoint processing '{title}': {e}")
+        return {"error": "Internal server error during detail fetching"}, 500
+
+@timed_endpoint("fetch_batch")
+def fetch_batch(titles):
+    """
+    Resolves many titles at once: cached entries are answered locally, the
+    rest share a few batched Gemini prompts and one concurrent poster pass.
+    Returns {"results": [...]} aligned with the input titles.
+    """
+    if not isinstance(titles, list) or not titles:
+        return {"error": "A non-empty 'titles' list is required"}, 400
+    if len(titles) > FETCH_BATCH_MAX_TITLES:
+        return {"error": f"At most {FETCH_BATCH_MAX_TITLES} titles can be fetched per request"}, 400
+    if not all(isinstance(title, str) and title.strip() for title in titles):
+        return {"error": "Every title must be a non-empty string"}, 400
+
+    try:
+        results = [None] * len(titles)
+        pending = []
+        for index, title in enumerate(titles):
+            cached, fresh = _details_cache.get(title)
+            if cached is None:
+                cached, fresh = get_catalog().lookup(title, require_details=True), True
+            if cached is None:
+                pending.append(index)
+                continue
+            if not fresh:
+                _details_cache.refresh_in_background(title, lambda title=title: _fetch_details(title))
+            results[index] = _with_live_poster(cached)
+
+        if pending:
+            logger.info(f"Batch fetch: {len(titles) - len(pending)} cached, {len(pending)} to resolve.")
+            with stage(LLM_BUDGET_SHARE):
+                batch_details = get_llm_drama_details_batch([titles[i] for i in pending])
+            for index, details in zip(pending, batch_details):
+                results[index] = _fallback_details(titles[index], None) if _llm_details_failed(details) else details
+
+            posters = find_posters([results[i].get("title") or titles[i] for i in pending])
+            complete = not expired()
+            for index, poster_url in zip(pending, posters):
+                details = results[index]
+                details["posterUrl"] = poster_url
+                if complete and details.get("description") not in ("Details unavailable.", "LLM service not configured."):
+                    _details_cache.put(titles[index], details)
+                    get_catalog().upsert(details, aliases=[titles[index]])
+
+        return {"results": results}, 200
+    except Exception as e:
+        logger.exception(f"Error in /fetch/batch endpoint for {len(titles)} titles: {e}")
+        return {"error": "Internal server error during batch detail fetching"}, 500
+
+@timed_endpoint("catalog_search")
+def catalog_search(query, limit):
+    if not query:
+        return {"error": "q parameter is required"}, 400
+    try:
+        limit = max(1, min(int(limit or 10), 50))
+    except ValueError:
+        return {"error": "limit must be a number"}, 400
+    return {"results": get_catalog().search(query, limit)}, 200
+
+@timed_endpoint("fetch_from_url")
+def fetch_from_url(title):
+    if not title:
+        return {"error": "Title parameter is required"}, 400
+
+    try:
+        cached, fresh = _url_details_cache.get(title)
+        if cached is not None:
+            if not fresh:
+                _url_details_cache.refresh_in_background(title, lambda: _fetch_details_from_url(title))
+            return _with_live_poster(cached), 200
+
+        return _fetch_details_from_url(title)
+
+    except Exception as e:
+        logger.exception(f"Error in /fetch-from-url endpoint processing '{title}': {e}")
+        return {"error": "Internal server error during structured detail fetching"}, 500
+
+def parse_exclude_titles(exclude_titles_str):
+    """Exclusion list from a JSON-encoded string (GET query) or an already decoded list (POST body)."""
+    if isinstance(exclude_titles_str, list):
+        return [title for title in exclude_titles_str if isinstance(title, str)]
+    exclude_titles = []
+    if exclude_titles_str:
+        try:
+            exclude_titles = json.loads(exclude_titles_str) # Parse JSON string
+            if not isinstance(exclude_titles, list):
+                 logger.warning("exclude_titles parameter was not a valid JSON list.")
+                 exclude_titles = []
+        except json.JSONDecodeError:
+            logger.warning("Could not decode exclude_titles JSON.")
+            exclude_titles = [] # Default to empty list on error
+    return exclude_titles
+
+@timed_endpoint("similar")
+def similar(title, limit, exclude_titles_str):
+    """Catalog dramas most like `title`, from the local similarity index (no LLM call)."""
+    if not title:
+        return {"error": "Title parameter is required"}, 400
+    if not SIMILARITY_ENABLED:
+        return {"error": "Similarity search is not available"}, 503
+    try:
+        limit = max(1, min(int(limit or 10), 50))
+    except ValueError:
+        return {"error": "limit must be a number"}, 400
+    try:
+        record, results = similar_to(title, limit, parse_exclude_titles(exclude_titles_str))
+    except Exception as e:
+        logger.exception(f"Error in /similar endpoint for '{title}': {e}")
+        return {"error": "Failed to find similar dramas"}, 500
+    if record is None:
+        return {"error": f"'{title}' is not in the catalog"}, 404
+    return {"title": record["title"], "similar": [_with_live_poster(rec) for rec in results]}, 200
+
+def _local_recommendations(genre, exclude_titles, mode):
+    # mode=similar answers from the similarity index, seeded by the caller's titles.
+    if mode != "similar" or not SIMILARITY_ENABLED:
+        return None
+    try:
+        return similar_for_genre(genre, exclude_titles)
+    except Exception as e:
+        logger.error(f"Similarity recommendations failed for genre '{genre}': {e}")
+        return None
+
+@timed_endpoint("recommend")
+def recommend(genre, exclude_titles_str, mode=None):
+    if not genre:
+        return {"error": "Genre parameter is required"}, 400
+
+    exclude_titles = parse_exclude_titles(exclude_titles_str)
+
+    try:
+        local = _local_recommendations(genre, exclude_titles, mode)
+        if local:
+            return {"recommendations": [_with_live_poster(rec) for rec in local]}, 200
+        pooled = recommend_from_pool(genre, exclude_titles)
+        if pooled:
+            return {"recommendations": [_with_live_poster(rec) for rec in pooled]}, 200
+        # Pool is cold or exhausted for this user: ask the LLM directly
+        recommendations = get_llm_recommendations_for_genre(genre, exclude_titles)
+        get_catalog().upsert_many(recommendations.get("recommendations", []))
+        return recommendations, 200
+    except Exception as e:
+        logger.exception(f"Error in /recommend endpoint for genre '{genre}': {e}")
+        return {"error": "Failed to generate recommendations"}, 500
+
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def stream_format(stream_param, accept_header):
+    """Picks 'ndjson' or 'sse' from ?stream= or the Accept header; None means a regular JSON response."""
+    if stream_param in STREAM_FORMATS:
+        return stream_param
+    accept_header = accept_header or ""
+    if "text/event-stream" in accept_header:
+        return "sse"
+    if "application/x-ndjson" in accept_header:
+        return "ndjson"
+    return None
+
+def _encode_event(fmt, event, data):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+    return dumps({"event": event, **data}).decode("utf-8") + "\n"
+
+def recommend_stream(genre, exclude_titles_str, fmt, mode=None):
+    """
+    Streams recommendations as NDJSON lines or SSE events: an "item" event per
+    recommendation as soon as it is parsed, a "poster" event patching its
+    posterUrl when the lookup finishes, then "done" (or "error").
+    """
+    exclude_titles = parse_exclude_titles(exclude_titles_str)
+
+    def generate():
+        count = 0
+        try:
+            pooled = _local_recommendations(genre, exclude_titles, mode) or recommend_from_pool(genre, exclude_titles)
+            if pooled:
+                for index, rec in enumerate(pooled):
+                    yield _encode_event(fmt, "item", {"index": index, "recommendation": _with_live_poster(rec)})
+                yield _encode_event(fmt, "done", {"count": len(pooled)})
+                return
+            for event, index, data in iter_llm_recommendations_for_genre(genre, exclude_titles):
+                if event == "item":
+                    count += 1
+                    get_catalog().upsert(data, overwrite=False)
+                    yield _encode_event(fmt, "item", {"index": index, "recommendation": data})
+                else:
+                    yield _encode_event(fmt, "poster", {"index": index, "posterUrl": data})
+            yield _encode_event(fmt, "done", {"count": count})
+        except Exception as e:
+            logger.exception(f"Error in streaming /recommend for genre '{genre}': {e}")
+            yield _encode_event(fmt, "error", {"error": "Failed to generate recommendations"})
+
+    return generate(), STREAM_FORMATS[fmt]
+
+def top_dramas_stream(fmt):
+    def generate():
+        try:
+            snapshot = get_top_dramas_snapshot()
+        except Exception as e:
+            logger.exception(f"Error in streaming /top-dramas: {e}")
+            yield _encode_event(fmt, "error", {"error": "Failed to fetch top dramas"})
+            return
+        dramas = snapshot.payload.get("dramas", []) if snapshot else []
+        for index, drama in enumerate(dramas):
+            yield _encode_event(fmt, "item", {"index": index, "drama": drama})
+        yield _encode_event(fmt, "done", {"count": len(dramas)})
+
+    return generate(), STREAM_FORMATS[fmt]
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def _projected_etag(etag, fields):
+    digest = hashlib.sha1(",".join(sorted(fields)).encode("utf-8")).hexdigest()[:12]
+    return f'{etag[:-1]}-{digest}"'
+
+@timed_endpoint("top_dramas")
+def top_dramas(if_none_match=None, fields=None):
+    """
+    Serves the pre-built top-dramas snapshot. Returns (body, status, headers)
+    with the body already encoded as JSON bytes; a `fields` projection is
+    encoded per request under its own ETag.
+    """
+    try:
+        snapshot = get_top_dramas_snapshot()
+    except Exception as e:
+        logger.exception(f"Error in /top-dramas endpoint: {e}")
+        return json.dumps({"error": "Failed to fetch top dramas"}).encode("utf-8"), 500, {}
+
+    if snapshot is None:
+        return json.dumps({"dramas": []}).encode("utf-8"), 200, {}
+
+    etag = _projected_etag(snapshot.etag, fields) if fields else snapshot.etag
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if _etag_matches(if_none_match, etag):
+        return b"", 304, headers
+    return (dumps(project(snapshot.payload, fields)) if fields else snapshot.body), 200, headers
+
+@timed_endpoint("new_releases")
+def new_releases(cursor=None, limit=None, if_none_match=None, fields=None):
+    """
+    Serves one page of the materialized new-releases feed, newest premiere
+    first. Pass the response's nextCursor back as `cursor` for the next page.
+    Returns (body, status, headers) with the body encoded as JSON bytes.
+    """
+    try:
+        limit = int(limit) if limit else None
+    except ValueError:
+        return json.dumps({"error": "limit must be a number"}).encode("utf-8"), 400, {}
+    try:
+        body, etag = get_new_releases_page(cursor, limit, fields)
+    except InvalidCursor as e:
+        return json.dumps({"error": str(e)}).encode("utf-8"), 400, {}
+    except Exception as e:
+        logger.exception(f"Error in /new-releases endpoint: {e}")
+        return json.dumps({"error": "Failed to fetch new releases"}).encode("utf-8"), 500, {}
+
+    if etag is None:
+        return body, 200, {}
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if _etag_matches(if_none_match, etag):
+        return b"", 304, headers
+    return body, 200, headers
+
+def poster_image(signature, token, size, accept, if_none_match=None):
+    """
+    Serves a resized poster variant through the image proxy. Returns
+    (file_path, status, headers) on success, (error_payload, status, headers)
+    otherwise; the body is empty (None) for 304.
+    """
+    url = image_proxy.verify_token(signature, token)
+    if url is None:
+        return {"error": "Invalid image signature"}, 403, {}
+    fmt = image_proxy.negotiate_format(accept)
+    try:
+        path, content_type, etag = image_proxy.get_variant(url, size or image_proxy.IMAGE_PROXY_DEFAULT_SIZE, fmt)
+    except image_proxy.ImageProxyError as e:
+        logger.warning(f"Image proxy failed for {url}: {e}")
+        return {"error": str(e)}, e.status, {}
+    except Exception as e:
+        logger.exception(f"Image proxy error for {url}: {e}")
+        return {"error": "Failed to load image"}, 502, {}
+
+    headers = image_proxy.cache_headers(etag)
+    if _etag_matches(if_none_match, etag):
+        return None, 304, headers
+    headers["Content-Type"] = content_type
+    return path, 200, headers
+
+def start_background_jobs():
+    # SDK imports and client construction run off the startup path (STARTUP_WARMUP).
+    start_warmup()
+    start_top_dramas_refresher()
+    start_new_releases_refresher()
+    start_similarity_indexer()
+    start_poster_recheck()
+    prefill_genre_pools()
@@ -1,100 +1,137 @@
 import os
-import google.generativeai as genai
 import json
-from dotenv import load_dotenv
+from core.config import llm_configured
+from core.singleflight import single_flight
+from core.titles import normalize_title
+from llm.json_utils import DRAMA_DETAILS_SCHEMA, LLMJSONError, parse_llm_json
+from llm.prompts import generate
 import datetime
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from core.log import get_logger
 
-load_dotenv()
-
-GEMINI_API_CONFIGURED = False 
-try:
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in environment variables.")
-    genai.configure(api_key=api_key)
-    print("Gemini API configured successfully.")
-    GEMINI_API_CONFIGURED = True 
-except Exception as e:
-    print(f"Error configuring Gemini API: {e}")
-
-JSON_STRUCTURE_TEMPLATE = """
-{
-  "title": "string (The official English title)",
-  "altTitles": ["string (Native language title)", "string (Romanized title)"],
-  "year": "number (Year of first broadcast)",
-  "country": "string (Country of origin, e.g., 'South Korea')",
-  "genres": ["string (List of genres)"],
-  "posterUrl": "string (Leave empty, will be filled separately)",
-  "description": "string (A concise synopsis, 2-3 sentences)",
-  "cast": ["string (List of main actors, max 5-7)"],
-  "rating": "string (Overall rating if available, e.g., '8.5/10 (Source)', otherwise null)",
-  "sourceUrl": "string (A relevant MyDramaList or TMDB link if easily found, otherwise null)",
-  "type": "string ('drama' or 'movie')",
-  "status": "string ('completed', 'ongoing', or 'upcoming')"
-}
-"""
+logger = get_logger(__name__)
 
-def get_llm_drama_details(title):
-    if not GEMINI_API_CONFIGURED:
-         print("Gemini API not configured. Cannot fetch details.")
-         fallback_details = json.loads(JSON_STRUCTURE_TEMPLATE.replace('"string (Leave empty, will be filled separately)"', 'null'))
-         fallback_details['title'] = title
-         fallback_details['description'] = "LLM service not configured."
-         return fallback_details
-
-    model = genai.GenerativeModel('gemini-2.5-flash') 
+def _fallback_details(title, description):
+    details = DRAMA_DETAILS_SCHEMA({"title": title, "description": description})
+    details["posterUrl"] = None
+    return details
 
-    current_year = datetime.datetime.now().year
-
-    prompt = f"""
-    You are a precise K-drama information extractor.
+@single_flight("llm_drama_details", key=normalize_title)
+def get_llm_drama_details(title):
+    if not llm_configured():
+         logger.info("No LLM provider configured. Cannot fetch details.")
+         return _fallback_details(title, "LLM service not configured.")
 
-    Task:
-    Return verified metadata for the Korean drama or movie titled "{title}".
-    If multiple exist, choose the most recent (prioritize releases from {current_year}; if unavailable, include the most notable version from the past 5 years).
+    # The extraction rules and output schema are sent as the task's system
+    # instruction / response schema (llm/prompts.py).
+    prompt = f'Title: "{title}"\nCurrent year: {datetime.datetime.now().year}'
 
-    Rules:
-    - Use verified and recent information (cross-check MyDramaList, TMDB, or official Korean sources).
-    - Output only a single, valid JSON object—no extra text, no markdown, no explanations.
-    - The JSON must strictly follow the provided structure.
-    - Leave `"posterUrl"` as an empty string "".
-    - Do not include speculative, upcoming, or rumored information unless officially confirmed.
-    - Ensure `year` is the year of first broadcast or film release.
+    try:
+        logger.info(f"Sending prompt to Gemini for title: {title}")
+        logger.debug(f"Prompt:\n{prompt}\n")
+        response = generate("details", prompt)
 
-    Structure:
-    {JSON_STRUCTURE_TEMPLATE}
+        logger.debug(f"Gemini Raw Response:\n{response.text}")
 
-    Return ONLY the JSON object below, nothing else.
-    """
+        details = parse_llm_json(response.text, DRAMA_DETAILS_SCHEMA, expect="object")
 
-    try:
-        print(f"Sending prompt to Gemini for title: {title}")
-        print(f"Prompt:\n{prompt}\n")
-        response = model.generate_content(prompt)
+        logger.info(f"Successfully parsed Gemini response for '{title}'")
+        return details
 
-        cleaned_response = response.text.strip().lstrip('```json').rstrip('```').strip()
+    except LLMJSONError as e:
+        logger.error(f"Error decoding JSON response from LLM for '{title}': {e}")
+        logger.debug(f"Problematic response text: {response.text}")
+        return _fallback_details(title, "Error fetching details from LLM.")
+    except Exception as e:
+        logger.error(f"Error calling Gemini API for '{title}': {e}")
+        return _fallback_details(title, "Error connecting to LLM service.")
 
-        print(f"Gemini Raw Response:\n{response.text}") 
-        print(f"Cleaned Response:\n{cleaned_response}") 
+# Rough output size of one details object; used to pack as many titles per
+# prompt as the output token budget allows.
+DETAILS_TOKENS_PER_ITEM = int(os.getenv("DETAILS_TOKENS_PER_ITEM", 450))
+DETAILS_BATCH_OUTPUT_TOKENS = int(os.getenv("DETAILS_BATCH_OUTPUT_TOKENS", 16000))
+DETAILS_BATCH_WORKERS = int(os.getenv("DETAILS_BATCH_WORKERS", 4))
 
-        details = json.loads(cleaned_response)
 
-        if not isinstance(details, dict) or "title" not in details:
-             raise ValueError("LLM response is not a valid JSON object with a title.")
+def _chunk_titles(titles):
+    per_prompt = max(1, DETAILS_BATCH_OUTPUT_TOKENS // DETAILS_TOKENS_PER_ITEM)
+    return [titles[i:i + per_prompt] for i in range(0, len(titles), per_prompt)]
 
-        print(f"Successfully parsed Gemini response for '{title}'")
-        return details
 
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response from LLM for '{title}': {e}")
-        print(f"Problematic response text: {cleaned_response}")
-        fallback_details = json.loads(JSON_STRUCTURE_TEMPLATE.replace('"string (Leave empty, will be filled separately)"', 'null'))
-        fallback_details['title'] = title 
-        fallback_details['description'] = "Error fetching details from LLM."
-        return fallback_details
-    except Exception as e:
-        print(f"Error calling Gemini API for '{title}': {e}")
-        fallback_details = json.loads(JSON_STRUCTURE_TEMPLATE.replace('"string (Leave empty, will be filled separately)"', 'null'))
-        fallback_details['title'] = title
-        fallback_details['description'] = "Error connecting to LLM service."
-        return fallback_details
\ No newline at end of file
+def _request_details_chunk(titles):
+    """
+    Asks Gemini for several titles at once; returns {normalized query: details}.
+    Elements are matched to titles only by their echoed `query`: one without
+    it, or echoing a title that wasn't asked for, is dropped rather than
+    guessed from its position, and its title counts as missed.
+    """
+    queries = json.dumps(titles, ensure_ascii=False)
+    prompt = f"Titles: {queries}\nCurrent year: {datetime.datetime.now().year}"
+
+    logger.info(f"Sending batch details prompt to Gemini for {len(titles)} titles")
+    response = generate("details_batch", prompt, generation_config={"max_output_tokens": DETAILS_BATCH_OUTPUT_TOKENS})
+    items = parse_llm_json(response.text, expect="array")
+    if not isinstance(items, list):
+        raise LLMJSONError("LLM batch response is not a JSON array.")
+
+    requested = {normalize_title(title) for title in titles}
+    results = {}
+    for index, item in enumerate(items):
+        try:
+            item = DRAMA_DETAILS_SCHEMA(item)
+        except LLMJSONError as e:
+            logger.warning(f"Dropping invalid batch element {index}: {e}")
+            continue
+        query = item.pop("query", None)
+        key = normalize_title(query) if isinstance(query, str) else None
+        if key not in requested:
+            logger.warning(f"Dropping batch element {index}: query {query!r} matches no requested title")
+            continue
+        if key not in results:
+            results[key] = item
+    return results
+
+
+def get_llm_drama_details_batch(titles):
+    """
+    Resolves details for many titles with as few Gemini prompts as the output
+    token budget allows. Entries the batch response missed or garbled are
+    retried one by one through get_llm_drama_details; a title whose retry
+    fails too gets an error entry. Returns a list aligned with `titles`.
+    """
+    if not llm_configured():
+        return [get_llm_drama_details(title) for title in titles]
+
+    unique_titles = []
+    seen = set()
+    for title in titles:
+        key = normalize_title(title)
+        if key and key not in seen:
+            seen.add(key)
+            unique_titles.append(title)
+
+    resolved = {}
+    chunks = _chunk_titles(unique_titles)
+    with ThreadPoolExecutor(max_workers=min(DETAILS_BATCH_WORKERS, len(chunks) or 1)) as executor:
+        # Each worker runs in a copy of the caller's context, which carries its deadline.
+        futures = [executor.submit(contextvars.copy_context().run, _request_details_chunk, chunk) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            try:
+                resolved.update(future.result())
+            except Exception as e:
+                logger.info(f"Batch details prompt failed for {len(chunk)} titles, falling back to single calls: {e}")
+
+    missing = [title for title in unique_titles if normalize_title(title) not in resolved]
+    if missing:
+        logger.info(f"Batch response missed {len(missing)} titles; fetching them individually.")
+        with ThreadPoolExecutor(max_workers=DETAILS_BATCH_WORKERS) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, get_llm_drama_details, title) for title in missing]
+            for title, future in zip(missing, futures):
+                try:
+                    resolved[normalize_title(title)] = future.result()
+                except Exception as e:
+                    logger.error(f"Details lookup failed for '{title}': {e}")
+                    resolved[normalize_title(title)] = _fallback_details(title, "Error fetching details from LLM.")
+
+    return [resolved.get(normalize_title(title)) for title in titles]
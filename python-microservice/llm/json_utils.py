@@ -0,0 +1,354 @@
+"""
+Shared parsing for Gemini JSON responses: locate the JSON value in the raw
+text in one linear scan, repair the usual defects (code fences, prose around
+the JSON, trailing commas, output truncated mid-array) and validate it
+against compiled per-endpoint schemas with coercion.
+"""
+import re
+import json
+from core.log import get_logger
+from core.metrics import timer
+
+logger = get_logger(__name__)
+
+_CLOSERS = {"{": "}", "[": "]"}
+_YEAR_PATTERN = re.compile(r"(1[89]\d\d|20\d\d)")
+
+
+class LLMJSONError(ValueError):
+    """The LLM response held no usable JSON, or it failed schema validation."""
+
+
+def extract_json(text, expect=None):
+    """
+    Returns the first JSON object/array found in `text`. `expect` may be
+    "object" or "array" to skip stray brackets in leading prose.
+    Raises LLMJSONError when nothing parseable can be recovered.
+    """
+    if not text:
+        raise LLMJSONError("LLM response was empty.")
+    openers = {"object": "{", "array": "["}.get(expect, "{[")
+    start = next((i for i, char in enumerate(text) if char in openers), None)
+    if start is None:
+        raise LLMJSONError("No JSON value found in LLM response.")
+
+    out = []
+    stack = []
+    # For each open array: the output length right after its last complete
+    # element, so a truncated tail can be cut back to a valid point.
+    safe_points = []
+    in_string = False
+    escaped = False
+    complete = False
+
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+            safe_points.append(len(out) if char == "[" else None)
+        elif char in "}]":
+            if not stack or _CLOSERS[stack[-1]] != char:
+                raise LLMJSONError("Mismatched brackets in LLM response.")
+            _strip_trailing_comma(out)
+            out.append(char)
+            stack.pop()
+            safe_points.pop()
+            if not stack:
+                complete = True
+                break
+            if stack[-1] == "[":
+                safe_points[-1] = len(out)
+        elif char == ",":
+            if stack[-1] == "[":
+                safe_points[-1] = len(out)
+            out.append(char)
+        else:
+            out.append(char)
+
+    if not complete:
+        out = _repair_truncated(out, stack, safe_points)
+
+    try:
+        return json.loads("".join(out))
+    except json.JSONDecodeError as e:
+        raise LLMJSONError(f"Could not decode LLM JSON: {e}") from e
+
+
+def _strip_trailing_comma(out):
+    index = len(out) - 1
+    while index >= 0 and out[index] in " \t\r\n":
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index]
+
+
+def _repair_truncated(out, stack, safe_points):
+    # Cut back to the last complete element of the innermost open array and
+    # close everything from there outwards.
+    for depth in range(len(stack) - 1, -1, -1):
+        if stack[depth] == "[" and safe_points[depth] is not None:
+            out = out[:safe_points[depth]]
+            _strip_trailing_comma(out)
+            return out + [_CLOSERS[opener] for opener in reversed(stack[:depth + 1])]
+    raise LLMJSONError("LLM response was truncated before any complete element.")
+
+
+def iter_array_objects(text_chunks):
+    """
+    Incrementally scans streamed JSON text and yields each object element of
+    the first array as soon as its closing brace arrives.
+    """
+    buffer = ""
+    depth = 0
+    array_depth = None
+    object_start = None
+    in_string = False
+    escaped = False
+    position = 0
+
+    for chunk in text_chunks:
+        buffer += chunk
+        while position < len(buffer):
+            char = buffer[position]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "[{":
+                depth += 1
+                if char == "[" and array_depth is None:
+                    array_depth = depth
+                elif char == "{" and array_depth is not None and depth == array_depth + 1:
+                    object_start = position
+            elif char in "]}":
+                if char == "}" and object_start is not None and depth == array_depth + 1:
+                    try:
+                        yield extract_json(buffer[object_start:position + 1], expect="object")
+                    except LLMJSONError as e:
+                        logger.warning(f"Skipping malformed streamed object: {e}")
+                    object_start = None
+                elif char == "]" and depth == array_depth:
+                    return
+                depth -= 1
+            position += 1
+
+
+# --- Schema validation -----------------------------------------------------
+
+def _coerce_str(value):
+    if value is None:
+        return None
+    if isinstance(value, (str, int, float)):
+        return str(value).strip()
+    raise ValueError(f"expected a string, got {type(value).__name__}")
+
+
+def _coerce_int(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    match = _YEAR_PATTERN.search(str(value)) or re.search(r"-?\d+", str(value))
+    if not match:
+        raise ValueError(f"expected a number, got '{value}'")
+    return int(match.group(0))
+
+
+def _coerce_str_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    if not isinstance(value, list):
+        raise ValueError(f"expected a list, got {type(value).__name__}")
+    return [str(item).strip() for item in value if isinstance(item, (str, int, float)) and str(item).strip()]
+
+
+_COERCERS = {str: _coerce_str, int: _coerce_int, list: _coerce_str_list}
+
+
+class Field:
+    def __init__(self, kind, required=False, default=None, choices=None, description=None):
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.choices = choices
+        # Shown to the model via response_schema() / field_template().
+        self.description = description
+
+
+def compile_schema(fields, name):
+    """
+    Builds a validator for a flat object schema once. The validator coerces
+    each declared field in place, fills defaults, keeps undeclared keys and
+    raises LLMJSONError if the value isn't an object or a required field is
+    missing or unusable.
+    """
+    plan = [(key, _COERCERS[field.kind], field) for key, field in fields.items()]
+
+    def validate(value):
+        if not isinstance(value, dict):
+            raise LLMJSONError(f"{name}: expected a JSON object.")
+        for key, coerce, field in plan:
+            raw = value.get(key)
+            try:
+                coerced = coerce(raw)
+            except ValueError as e:
+                if field.required:
+                    raise LLMJSONError(f"{name}: invalid '{key}' ({e}).") from e
+                coerced = None
+            if coerced is not None and field.choices is not None:
+                coerced = coerced.lower()
+                if coerced not in field.choices:
+                    coerced = None
+            if coerced in (None, "") and field.required:
+                raise LLMJSONError(f"{name}: missing required '{key}'.")
+            if coerced is None:
+                coerced = field.default() if callable(field.default) else field.default
+            value[key] = coerced
+        return value
+
+    validate.schema_name = name
+    return validate
+
+
+def compile_list_schema(key, item_validator, name):
+    """Validator for {key: [items]} envelopes; invalid items are dropped, not fatal."""
+
+    def validate(value):
+        if not isinstance(value, dict) or not isinstance(value.get(key), list):
+            raise LLMJSONError(f"{name}: expected an object with a '{key}' list.")
+        value[key] = validate_items(value[key], item_validator)
+        return value
+
+    validate.schema_name = name
+    return validate
+
+
+_SCHEMA_TYPES = {str: "string", int: "integer", list: "array"}
+
+
+def response_schema(fields, extra=None):
+    """
+    OpenAPI-style schema for Gemini's structured output mode, built from the
+    same Field declarations the validators use. `extra` adds fields that are
+    only needed in the response (e.g. a batch item's "query").
+    """
+    properties = {}
+    required = []
+    for key, field in {**fields, **(extra or {})}.items():
+        prop = {"type": _SCHEMA_TYPES[field.kind]}
+        if field.kind is list:
+            prop["items"] = {"type": "string"}
+        if field.choices:
+            prop["enum"] = list(field.choices)
+        if field.description:
+            prop["description"] = field.description
+        if field.required:
+            required.append(key)
+        else:
+            prop["nullable"] = True
+        properties[key] = prop
+    return {"type": "object", "properties": properties, "required": required}
+
+
+def list_response_schema(key, fields):
+    return {"type": "object", "properties": {key: {"type": "array", "items": response_schema(fields)}}, "required": [key]}
+
+
+def field_template(fields):
+    """Compact JSON-shaped description of `fields`, for prompts that can't use structured output."""
+    lines = []
+    for key, field in fields.items():
+        kind = _SCHEMA_TYPES[field.kind] if field.kind is not list else "string[]"
+        if field.choices:
+            kind = " | ".join(repr(choice) for choice in field.choices)
+        hint = f" ({field.description})" if field.description else ""
+        lines.append(f'  "{key}": {kind}{hint}')
+    return "{\n" + ",\n".join(lines) + "\n}"
+
+
+def validate_items(items, item_validator):
+    valid = []
+    for item in items:
+        try:
+            valid.append(item_validator(item))
+        except LLMJSONError as e:
+            logger.warning(f"Dropping invalid item: {e}")
+    return valid
+
+
+def parse_llm_json(text, validator=None, expect=None):
+    """extract_json + optional schema validation in one call."""
+    with timer("json_parse"):
+        value = extract_json(text, expect=expect)
+        return validator(value) if validator else value
+
+
+STATUSES = ("completed", "ongoing", "upcoming")
+
+DRAMA_DETAILS_FIELDS = {
+    "title": Field(str, required=True, description="official English title"),
+    "altTitles": Field(list, default=list, description="native and romanized titles"),
+    "year": Field(int, description="year of first broadcast or release"),
+    "country": Field(str, description="country of origin"),
+    "genres": Field(list, default=list),
+    "description": Field(str, default="", description="concise synopsis, 2-3 sentences"),
+    "cast": Field(list, default=list, description="main actors, at most 7"),
+    "rating": Field(str, description="overall rating with source, e.g. '8.5/10 (MyDramaList)'"),
+    "sourceUrl": Field(str, description="AsianWiki, MyDramaList or TMDB page"),
+    "type": Field(str, default="drama", choices=("drama", "movie")),
+    "status": Field(str, default="completed", choices=STATUSES),
+}
+
+RECOMMENDATION_FIELDS = {
+    "title": Field(str, required=True),
+    "year": Field(int),
+    "reason": Field(str, default="", description="1-2 sentences on the similarity or appeal"),
+    "genres": Field(list, default=list),
+    "status": Field(str, default="completed", choices=STATUSES),
+}
+
+TOP_DRAMA_FIELDS = {
+    "title": Field(str, required=True),
+    "year": Field(int),
+    "description": Field(str, default="", description="one sentence"),
+    "status": Field(str, default="completed", choices=STATUSES),
+}
+
+NEW_RELEASE_FIELDS = {
+    "title": Field(str, required=True),
+    "year": Field(int),
+    "airDate": Field(str, description="premiere date as YYYY-MM-DD"),
+    "network": Field(str, description="broadcaster or streaming platform"),
+    "status": Field(str, default="ongoing", choices=STATUSES),
+}
+
+DRAMA_DETAILS_SCHEMA = compile_schema(DRAMA_DETAILS_FIELDS, "drama details")
+RECOMMENDATION_SCHEMA = compile_schema(RECOMMENDATION_FIELDS, "recommendation")
+TOP_DRAMA_SCHEMA = compile_schema(TOP_DRAMA_FIELDS, "top drama")
+NEW_RELEASE_SCHEMA = compile_schema(NEW_RELEASE_FIELDS, "new release")
+
+RECOMMENDATIONS_RESPONSE_SCHEMA = compile_list_schema("recommendations", RECOMMENDATION_SCHEMA, "recommendations")
+TOP_DRAMAS_RESPONSE_SCHEMA = compile_list_schema("dramas", TOP_DRAMA_SCHEMA, "top dramas")
+NEW_RELEASES_RESPONSE_SCHEMA = compile_list_schema("dramas", NEW_RELEASE_SCHEMA, "new releases")
@@ -0,0 +1,34 @@
+from core.config import llm_configured
+from llm.prompts import generate
+from llm.json_utils import NEW_RELEASES_RESPONSE_SCHEMA, LLMJSONError, parse_llm_json
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+def get_new_releases_llm(today, window_days, count):
+    """
+    Asks Gemini which dramas premiered in the `window_days` before `today`
+    (a datetime.date) or are airing now. Returns a list of
+    {"title", "year", "airDate", "network", "status"}; enrichment is up to
+    the caller.
+    """
+    if not llm_configured():
+        logger.info("No LLM provider configured. Cannot discover new releases.")
+        return []
+
+    prompt = f"Date: {today.isoformat()}\nWindow: {window_days} days\nCount: up to {count}"
+
+    response = None
+    try:
+        logger.info("Sending new releases prompt to Gemini...")
+        response = generate("new_releases", prompt)
+        data = parse_llm_json(response.text, NEW_RELEASES_RESPONSE_SCHEMA, expect="object")
+        logger.info(f"Gemini listed {len(data['dramas'])} new releases.")
+        return data["dramas"]
+    except LLMJSONError as e:
+        logger.error(f"Error decoding JSON response from LLM for new releases: {e}")
+        logger.debug(f"Problematic response text: {getattr(response, 'text', '')}")
+        return []
+    except Exception as e:
+        logger.error(f"Error calling Gemini API for new releases: {e}")
+        return []
@@ -0,0 +1,174 @@
+"""
+Prompt management for the LLM tasks. Each task's static instructions
+live here and are sent as the model's system instruction, so a request only
+carries what changes (the title, genre, exclusions). Tasks that can use
+structured output get a response schema built from the validator
+fields in llm/json_utils instead of a JSON template restated in the prompt;
+with GEMINI_STRUCTURED_OUTPUT=0 the details prompts spell the template out.
+
+With PROMPT_CONTEXT_CACHE=1 the static instructions are also stored as
+provider-side cached content where the API accepts them (it has a minimum
+size); otherwise the stable prefix still benefits from implicit caching.
+Input, output and cached token counts are recorded per task in /metrics.
+Which provider and model answers a task is decided by llm/router.py.
+"""
+import os
+from core.config import lazy_import
+from core.metrics import describe, inc, timer
+from llm import router
+from llm.json_utils import (
+    DRAMA_DETAILS_FIELDS,
+    NEW_RELEASE_FIELDS,
+    RECOMMENDATION_FIELDS,
+    TOP_DRAMA_FIELDS,
+    Field,
+    field_template,
+    list_response_schema,
+    response_schema,
+)
+
+genai = lazy_import("google.generativeai")
+
+GEMINI_STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "1") != "0"
+
+
+class PromptSpec:
+    def __init__(self, task, instructions, schema=None, cacheable=True):
+        self.task = task
+        self.instructions = instructions.strip()
+        self.schema = schema
+        # Requests that pass tools can't be combined with cached content.
+        self.cacheable = cacheable
+
+    def generation_config(self, **overrides):
+        if not (GEMINI_STRUCTURED_OUTPUT and self.schema):
+            return genai.GenerationConfig(**overrides) if overrides else None
+        return genai.GenerationConfig(response_mime_type="application/json", response_schema=self.schema, **overrides)
+
+
+_DETAILS_RULES = """
+- Use verified and recent information (cross-check MyDramaList, TMDB, or official Korean sources).
+- If several productions share a title, choose the most recent, preferring the current year, otherwise the most notable of the past 5 years.
+- Do not include speculative, upcoming, or rumored information unless officially confirmed.
+- `year` is the year of first broadcast or film release. Use null for anything unknown.
+"""
+
+
+def _output_template(shape, fields):
+    """The JSON template a prompt spells out when no response schema is sent with it."""
+    if GEMINI_STRUCTURED_OUTPUT:
+        return ""
+    return f"""
+Output ONLY {shape}, no markdown and no explanations:
+{field_template(fields)}
+"""
+
+
+_BATCH_ITEM_FIELDS = {
+    "query": Field(str, required=True, description="the input title exactly as given"),
+    **DRAMA_DETAILS_FIELDS,
+}
+
+PROMPTS = {
+    "details": PromptSpec(
+        "details",
+        f"""
+You are a precise K-drama information extractor. Given a Korean drama or movie title, return its verified metadata as a single JSON object.
+
+Rules:{_DETAILS_RULES}{_output_template("a single valid JSON object with this structure", DRAMA_DETAILS_FIELDS)}""",
+        schema=response_schema(DRAMA_DETAILS_FIELDS),
+    ),
+    "details_batch": PromptSpec(
+        "details_batch",
+        f"""
+You are a precise K-drama information extractor. Given a JSON list of Korean drama or movie titles, return a JSON array with one metadata object per input title, in the same order. Each object's `query` field holds the input title exactly as given.
+
+Rules:{_DETAILS_RULES}{_output_template("a valid JSON array of objects with this structure", _BATCH_ITEM_FIELDS)}""",
+        schema={
+            "type": "array",
+            "items": response_schema(DRAMA_DETAILS_FIELDS, extra={"query": Field(str, required=True)}),
+        },
+    ),
+    "url_details": PromptSpec(
+        "url_details",
+        f"""
+You are a precise web content extractor. Open the given AsianWiki URL and extract the K-drama's metadata (plot, cast, profile). If the URL is non-specific or leads to an index, use the given title to find the best match on AsianWiki. Set `sourceUrl` to the URL you were given.
+
+Output ONLY a single valid JSON object with this structure, no markdown and no explanations:
+{field_template(DRAMA_DETAILS_FIELDS)}
+""",
+        # The search tool rules out structured output, hence the template above.
+        cacheable=False,
+    ),
+    "recommendations": PromptSpec(
+        "recommendations",
+        """
+You recommend K-dramas. Given a genre, recommend well-regarded or popular K-dramas similar to the most popular dramas in that genre. Never recommend a title from the exclusion list, and never repeat a title. Prefer completed or currently ongoing dramas over upcoming ones; default `status` to 'completed' when unsure.
+
+Respond with a JSON object {"recommendations": [...]}.
+""",
+        schema=list_response_schema("recommendations", RECOMMENDATION_FIELDS),
+    ),
+    "recommendation_pool": PromptSpec(
+        "recommendation_pool",
+        """
+You list K-dramas for a genre catalogue. Given a genre and a count, list that many different well-regarded or popular K-dramas in the genre, each with a brief reason explaining its appeal to fans of the genre. Never list a title from the known list. Prefer completed or currently ongoing dramas over upcoming ones; default `status` to 'completed' when unsure.
+
+Respond with a JSON object {"recommendations": [...]}.
+""",
+        schema=list_response_schema("recommendations", RECOMMENDATION_FIELDS),
+    ),
+    "top_dramas": PromptSpec(
+        "top_dramas",
+        """
+You track K-drama popularity. List the requested number of currently popular or highly-rated K-dramas, most popular first.
+
+Respond with a JSON object {"dramas": [...]}.
+""",
+        schema=list_response_schema("dramas", TOP_DRAMA_FIELDS),
+    ),
+    "new_releases": PromptSpec(
+        "new_releases",
+        """
+You track K-drama releases. List Korean dramas that premiered within the given number of days before the given date, or are airing now, newest premiere first. Only include officially confirmed titles; leave `airDate` null rather than guessing it.
+
+Respond with a JSON object {"dramas": [...]}.
+""",
+        schema=list_response_schema("dramas", NEW_RELEASE_FIELDS),
+    ),
+}
+
+
+def record_usage(task, response):
+    """Adds the response's token counts to llm_tokens_total{task, kind}."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    inc("llm_calls_total", task=task)
+    for kind, attribute in (
+        ("input", "prompt_token_count"),
+        ("output", "candidates_token_count"),
+        ("cached", "cached_content_token_count"),
+    ):
+        count = getattr(usage, attribute, 0) or 0
+        if count:
+            inc("llm_tokens_total", count, task=task, kind=kind)
+
+
+def generate(task, prompt, stream=False, generation_config=None, **kwargs):
+    """
+    Sends `prompt` for `task` with the task's system instruction and response
+    schema, on whichever provider the router picks. `generation_config` holds
+    plain overrides such as max_output_tokens. Streaming callers should pass
+    the response to record_usage() once they have consumed it.
+    """
+    spec = PROMPTS[task]
+    with timer("llm", task=task):
+        response = router.generate(spec, prompt, stream=stream, generation_config=generation_config, **kwargs)
+    if not stream:
+        record_usage(task, response)
+    return response
+
+
+describe("llm_tokens_total", "LLM tokens per task and kind (input, output, cached).")
+describe("llm_calls_total", "LLM calls with usage metadata, per task.")
@@ -0,0 +1,247 @@
+"""
+LLM provider adapters used by the router (llm/router.py). Each provider
+sends one prompt for a PromptSpec to one model and returns an LLMResponse
+(or an LLMStream when streaming), so callers see the same `.text`,
+`usage_metadata` and chunk iteration whichever backend answered.
+"""
+import os
+import datetime
+import threading
+from core.clients import get_client, get_gemini_model
+from core.config import configure_gemini, gemini_configured, openai_configured
+from core.quota import call_with_quota
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+PROMPT_CONTEXT_CACHE = os.getenv("PROMPT_CONTEXT_CACHE", "0") == "1"
+PROMPT_CONTEXT_CACHE_TTL = int(os.getenv("PROMPT_CONTEXT_CACHE_TTL", 3600))
+
+
+class LLMProviderError(Exception):
+    """The provider could not produce a completion (refused, blocked or malformed reply)."""
+
+
+class Usage:
+    """Token counts under Gemini's usage_metadata attribute names, which record_usage() reads."""
+
+    def __init__(self, prompt_tokens=0, output_tokens=0, cached_tokens=0):
+        self.prompt_token_count = prompt_tokens or 0
+        self.candidates_token_count = output_tokens or 0
+        self.cached_content_token_count = cached_tokens or 0
+
+
+class LLMResponse:
+    def __init__(self, text, provider, model, usage=None, finish_reason=None, prompt_feedback=None):
+        self.text = text or ""
+        self.provider = provider
+        self.model = model
+        self.usage_metadata = usage
+        self.finish_reason = finish_reason
+        self.prompt_feedback = prompt_feedback
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class LLMStream:
+    """
+    Iterates text chunks (objects with `.text`). `usage_metadata` is filled in
+    once the stream has been consumed.
+    """
+
+    def __init__(self, chunks, provider, model):
+        self._chunks = chunks
+        self.provider = provider
+        self.model = model
+        self.usage_metadata = None
+
+    def __iter__(self):
+        for text, usage in self._chunks:
+            if usage is not None:
+                self.usage_metadata = usage
+            if text:
+                yield _Chunk(text)
+
+
+def _openai_schema(schema):
+    """Converts the OpenAPI-style response schema (nullable flags) to JSON Schema."""
+    if not isinstance(schema, dict):
+        return schema
+    converted = {}
+    for key, value in schema.items():
+        if key == "nullable":
+            continue
+        if key == "properties":
+            converted[key] = {name: _openai_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            converted[key] = _openai_schema(value)
+        else:
+            converted[key] = value
+    if schema.get("nullable"):
+        converted["type"] = [schema["type"], "null"]
+        if "enum" in converted:
+            converted["enum"] = [*converted["enum"], None]
+    return converted
+
+
+class GeminiProvider:
+    name = "gemini"
+    quota = "gemini"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cached = {}
+        self._cache_unsupported = set()
+
+    def configured(self):
+        return gemini_configured()
+
+    def _cached_model(self, spec, model_name):
+        """Model bound to provider-side cached content for the task's instructions, or None."""
+        key = (spec.task, model_name)
+        if key in self._cache_unsupported:
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            entry = self._cached.get(key)
+            if entry is not None and entry[1] > now + datetime.timedelta(seconds=60):
+                return entry[0]
+            try:
+                import google.generativeai as genai
+
+                cached = genai.caching.CachedContent.create(
+                    model=f"models/{model_name}",
+                    display_name=f"dramapaglu-{spec.task}",
+                    system_instruction=spec.instructions,
+                    ttl=datetime.timedelta(seconds=PROMPT_CONTEXT_CACHE_TTL),
+                )
+            except Exception as e:
+                # Usually the instructions are below the API's minimum cacheable size.
+                logger.info(f"Context caching unavailable for '{spec.task}', using implicit caching: {e}")
+                self._cache_unsupported.add(key)
+                return None
+            model = genai.GenerativeModel.from_cached_content(cached)
+            self._cached[key] = (model, now + datetime.timedelta(seconds=PROMPT_CONTEXT_CACHE_TTL))
+            return model
+
+    def _model(self, spec, model_name):
+        if PROMPT_CONTEXT_CACHE and spec.cacheable:
+            model = self._cached_model(spec, model_name)
+            if model is not None:
+                return model
+        return get_gemini_model(model_name, system_instruction=spec.instructions)
+
+    @staticmethod
+    def _usage(metadata):
+        if metadata is None:
+            return None
+        return Usage(
+            getattr(metadata, "prompt_token_count", 0),
+            getattr(metadata, "candidates_token_count", 0),
+            getattr(metadata, "cached_content_token_count", 0),
+        )
+
+    @staticmethod
+    def _text(response):
+        # .text raises when the candidate was blocked or carries no parts.
+        try:
+            return response.text
+        except ValueError:
+            return ""
+
+    def generate(self, spec, model_name, prompt, stream=False, generation_config=None, timeout=None, tools=None):
+        kwargs = {}
+        config = spec.generation_config(**(generation_config or {}))
+        if config is not None:
+            kwargs["generation_config"] = config
+        if tools:
+            kwargs["tools"] = tools
+        if timeout:
+            kwargs["request_options"] = {"timeout": timeout}
+        configure_gemini()
+        model = self._model(spec, model_name)
+        response = call_with_quota(self.quota, model.generate_content, prompt, stream=stream, **kwargs)
+
+        if stream:
+            def chunks():
+                for chunk in response:
+                    yield self._text(chunk), self._usage(getattr(chunk, "usage_metadata", None))
+
+            return LLMStream(chunks(), self.name, model_name)
+
+        candidates = getattr(response, "candidates", None) or []
+        finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+        return LLMResponse(
+            self._text(response),
+            self.name,
+            model_name,
+            usage=self._usage(getattr(response, "usage_metadata", None)),
+            finish_reason=getattr(finish_reason, "name", finish_reason),
+            prompt_feedback=getattr(response, "prompt_feedback", None),
+        )
+
+
+class OpenAIProvider:
+    name = "openai"
+    quota = "openai"
+
+    def configured(self):
+        return openai_configured()
+
+    @staticmethod
+    def _usage(usage):
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        return Usage(usage.prompt_tokens, usage.completion_tokens, getattr(details, "cached_tokens", 0))
+
+    def generate(self, spec, model_name, prompt, stream=False, generation_config=None, timeout=None, tools=None):
+        if tools:
+            # Gemini's search grounding has no equivalent here; the model
+            # answers from what it knows.
+            logger.debug(f"OpenAI route for '{spec.task}' runs without the Gemini tools.")
+        kwargs = {
+            "model": model_name,
+            "messages": [{"role": "system", "content": spec.instructions}, {"role": "user", "content": prompt}],
+        }
+        if spec.schema:
+            kwargs["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": spec.task, "schema": _openai_schema(spec.schema), "strict": False},
+            }
+        max_tokens = (generation_config or {}).get("max_output_tokens")
+        if max_tokens:
+            kwargs["max_completion_tokens"] = max_tokens
+        if timeout:
+            kwargs["timeout"] = timeout
+        client = get_client("openai")
+
+        if stream:
+            response = call_with_quota(
+                self.quota, client.chat.completions.create, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+
+            def chunks():
+                for chunk in response:
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    yield text, self._usage(getattr(chunk, "usage", None))
+
+            return LLMStream(chunks(), self.name, model_name)
+
+        response = call_with_quota(self.quota, client.chat.completions.create, **kwargs)
+        if not response.choices:
+            raise LLMProviderError("OpenAI returned no choices")
+        choice = response.choices[0]
+        return LLMResponse(
+            choice.message.content,
+            self.name,
+            model_name,
+            usage=self._usage(response.usage),
+            finish_reason=(choice.finish_reason or "").upper() or None,
+        )
+
+
+PROVIDERS = {provider.name: provider for provider in (GeminiProvider(), OpenAIProvider())}
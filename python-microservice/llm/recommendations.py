@@ -1,161 +1,204 @@
-import os
-import google.generativeai as genai
 import json
-from dotenv import load_dotenv
-from scrapers.drama_scraper import find_poster
-import traceback 
+from core.config import llm_configured
+from core.deadline import LLM_BUDGET_SHARE, stage
+from core.singleflight import single_flight
+from core.titles import normalize_title
+from llm.json_utils import (
+    RECOMMENDATION_SCHEMA,
+    RECOMMENDATIONS_RESPONSE_SCHEMA,
+    LLMJSONError,
+    iter_array_objects,
+    parse_llm_json,
+)
+from llm.prompts import generate, record_usage
+from scrapers.drama_scraper import find_posters, iter_completed_posters, submit_poster_lookup
+from core.log import get_logger
+
+logger = get_logger(__name__)
 
-load_dotenv()
-GEMINI_API_CONFIGURED = False
 PLACEHOLDER_POSTER = "https://via.placeholder.com/500x750.png?text=Poster+Not+Found"
 
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if api_key:
-        genai.configure(api_key=api_key)
-        GEMINI_API_CONFIGURED = True
-        print("Gemini API Key configured.")
-    else:
-        print("Warning: GEMINI_API_KEY not found in environment variables.")
-except Exception as e:
-    print(f"Error configuring Gemini API: {e}")
 
 
+def _build_recommendation_prompt(genre, exclude_titles, count=5):
+    # Instructions and output schema are the task's system instruction /
+    # response schema (llm/prompts.py); only the variable part is sent here.
+    prompt = f"Genre: {genre}\nCount: exactly {count} unique recommendations"
+    if exclude_titles:
+        prompt += f"\nExclusion list: {json.dumps(exclude_titles, ensure_ascii=False)}"
+    return prompt
+
+def _normalize_recommendation(rec):
+    # Coerces year/genres/status in place; raises LLMJSONError without a title.
+    return RECOMMENDATION_SCHEMA(rec)
 
+def _recommendation_key(genre, exclude_titles=None):
+    excluded = sorted({normalize_title(t) for t in exclude_titles or [] if isinstance(t, str)})
+    return (normalize_title(genre), tuple(excluded))
+
+@single_flight("llm_recommendations", key=_recommendation_key)
 def get_llm_recommendations_for_genre(genre, exclude_titles=None):
-    if not GEMINI_API_CONFIGURED:
-         print("Gemini API not configured. Cannot fetch recommendations.")
+    if not llm_configured():
+         logger.info("No LLM provider configured. Cannot fetch recommendations.")
          return {"recommendations": []}
 
     if exclude_titles is None:
         exclude_titles = []
 
-    exclusion_prompt_part = ""
-    if exclude_titles:
-        formatted_titles = ", ".join([json.dumps(title) for title in exclude_titles])
-        exclusion_prompt_part = f"\n\nCRITICAL: Do NOT include any of the following titles in your recommendations, even if they fit the genre: {formatted_titles}."
-    prompt = f"""
-    Please recommend exactly 5 K-dramas similar to popular dramas in the **{genre}** genre.
-    Focus on dramas that are generally well-regarded or popular within that genre.
-    For each recommendation, provide the title, the release year (as a number), a brief reason (1-2 sentences explaining the similarity or appeal),
-    the main genres (as a list of strings), and the status ('completed', 'ongoing', or 'upcoming') if known (default to 'completed' if unsure, verify if possible).
-    Leave posterUrl null for now.
-    {exclusion_prompt_part}
-
-    Format the response strictly as a JSON object with a single key "recommendations",
-    which is a list of exactly 5 objects, each having "title" (string), "year" (number or null), "reason" (string), "genres" (list of strings or null), "status" (string: 'completed', 'ongoing', or 'upcoming'), and "posterUrl" (null).
-
-    Example structure for a recommendation object:
-    {{
-      "title": "Example Drama Title",
-      "year": 2023,
-      "reason": "This drama features similar thrilling plot twists and a strong female lead.",
-      "genres": ["Thriller", "Romance"],
-      "status": "completed",
-      "posterUrl": null
-    }}
-
-    Ensure the output is ONLY the JSON object, starting with {{ and ending with }},
-    with no introductory text, explanations, or markdown formatting like ```json ```.
-    Make sure to provide exactly 5 unique recommendations that are not in the exclusion list. Prioritize dramas that are already completed or currently ongoing over upcoming ones if possible.
-    """
-
-    model = genai.GenerativeModel('gemini-2.5-flash') 
+    prompt = _build_recommendation_prompt(genre, exclude_titles)
 
     try:
-        print(f"Sending recommendation prompt to Gemini for genre: {genre}. Excluding {len(exclude_titles)} titles.")
-        response = model.generate_content(prompt)
+        logger.info(f"Sending recommendation prompt to Gemini for genre: {genre}. Excluding {len(exclude_titles)} titles.")
+        # Posters get whatever budget the LLM leaves (core/deadline.py).
+        with stage(LLM_BUDGET_SHARE):
+            response = generate("recommendations", prompt)
 
         if not hasattr(response, 'text') or not response.text:
-             print("LLM response was empty.")
+             logger.info("LLM response was empty.")
              safety_feedback = getattr(response, 'prompt_feedback', None)
              if safety_feedback:
-                 print(f"Safety Feedback: {safety_feedback}")
-             finish_reason = getattr(response, 'candidates', [{}])[0].get('finish_reason', 'UNKNOWN')
-             print(f"Finish Reason: {finish_reason}")
+                 logger.debug(f"Safety Feedback: {safety_feedback}")
+             finish_reason = getattr(response, 'finish_reason', None) or 'UNKNOWN'
+             logger.debug(f"Finish Reason: {finish_reason}")
              if finish_reason != 'STOP':
                  raise ValueError(f"LLM response potentially blocked or stopped unexpectedly. Reason: {finish_reason}")
              else:
                 raise ValueError("LLM response was empty.")
 
 
-        cleaned_response = response.text.strip().lstrip('```json').rstrip('```').strip()
-
-        print(f"Cleaned Rec Response:\n{cleaned_response}")
-
-        recommendations_data = json.loads(cleaned_response)
-
-        if not isinstance(recommendations_data, dict) or "recommendations" not in recommendations_data or not isinstance(recommendations_data["recommendations"], list):
-             raise ValueError("LLM response for recommendations is not in the expected format (missing 'recommendations' list).")
+        # Items without a usable title are dropped; year/genres/status are coerced.
+        recommendations_data = parse_llm_json(response.text, RECOMMENDATIONS_RESPONSE_SCHEMA, expect="object")
 
         exclude_titles_lower = {title.lower() for title in exclude_titles}
         filtered_recs = []
         titles_seen = set()
         for rec in recommendations_data.get("recommendations", []):
-            title = rec.get("title")
-            if title:
-                 title_lower = title.lower()
-                 if title_lower not in exclude_titles_lower and title_lower not in titles_seen:
-                      if all(k in rec for k in ["title", "year", "reason", "status", "posterUrl", "genres"]):
-                           filtered_recs.append(rec)
-                           titles_seen.add(title_lower)
-                      else:
-                          print(f"Warning: Recommendation for '{title}' missing expected keys, skipping.")
-            else:
-                 print("Warning: Recommendation found with no title.")
+            title_lower = rec["title"].lower()
+            if title_lower not in exclude_titles_lower and title_lower not in titles_seen:
+                 filtered_recs.append(rec)
+                 titles_seen.add(title_lower)
 
 
         if len(filtered_recs) < len(recommendations_data.get("recommendations", [])):
-             print(f"Filtered out {len(recommendations_data.get('recommendations', [])) - len(filtered_recs)} recommendations based on exclusion list or duplicates.")
+             logger.info(f"Filtered out {len(recommendations_data.get('recommendations', [])) - len(filtered_recs)} recommendations based on exclusion list or duplicates.")
         if len(filtered_recs) < 5 :
-             print(f"Warning: LLM provided fewer than 5 unique, non-excluded recommendations ({len(filtered_recs)} found).")
+             logger.warning(f"LLM provided fewer than 5 unique, non-excluded recommendations ({len(filtered_recs)} found).")
 
 
-        print(f"Successfully parsed {len(filtered_recs)} valid Gemini recommendations for '{genre}'")
+        logger.info(f"Successfully parsed {len(filtered_recs)} valid Gemini recommendations for '{genre}'")
 
         updated_recs = []
+        poster_lookups = []
         for rec in filtered_recs:
             title = rec.get("title")
-            status = str(rec.get("status", "completed")).lower()
-            if status not in ['completed', 'ongoing', 'upcoming']:
-                 status = 'completed'
-            rec['status'] = status
-
-            year = rec.get('year')
-            if year is not None:
-                try:
-                    rec['year'] = int(year)
-                except (ValueError, TypeError):
-                    print(f"Warning: Invalid year '{year}' for title '{title}', setting to null.")
-                    rec['year'] = None
-            else:
-                 rec['year'] = None
-
-            genres_list = rec.get('genres')
-            if genres_list is None:
-                rec['genres'] = []
-            elif not isinstance(genres_list, list):
-                print(f"Warning: Invalid genres format '{genres_list}' for title '{title}', setting to empty list.")
-                rec['genres'] = []
-            else:
-                rec['genres'] = [str(g) for g in genres_list if isinstance(g, (str, int, float))]
-
+            status = rec["status"]
 
             if status == 'upcoming':
                  rec["posterUrl"] = "https://via.placeholder.com/500x750.png?text=Upcoming"
             elif title:
-                rec["posterUrl"] = find_poster(title)
+                poster_lookups.append(rec)
             else:
                  rec["posterUrl"] = PLACEHOLDER_POSTER
             updated_recs.append(rec)
 
+        posters = find_posters([rec["title"] for rec in poster_lookups])
+        for rec, poster_url in zip(poster_lookups, posters):
+            rec["posterUrl"] = poster_url
+
         return {"recommendations": updated_recs}
 
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response from LLM for '{genre}' recommendations: {e}")
-        print(f"Problematic response text: {cleaned_response}")
+    except LLMJSONError as e:
+        logger.error(f"Error decoding JSON response from LLM for '{genre}' recommendations: {e}")
+        logger.debug(f"Problematic response text: {response.text}")
         return {"recommendations": []}
     except Exception as e:
-        print(f"Error calling Gemini API or processing recommendations for '{genre}': {e}")
-        traceback.print_exc()
-        return {"recommendations": []}
\ No newline at end of file
+        logger.exception(f"Error calling Gemini API or processing recommendations for '{genre}': {e}")
+        return {"recommendations": []}
+
+def iter_llm_recommendations_for_genre(genre, exclude_titles=None):
+    """
+    Streaming variant of get_llm_recommendations_for_genre. Yields
+    ("item", index, rec) for each recommendation as soon as Gemini has emitted
+    it (posterUrl still null unless upcoming), then ("poster", index,
+    posterUrl) as each poster lookup finishes.
+    """
+    if not llm_configured():
+         logger.info("No LLM provider configured. Cannot fetch recommendations.")
+         return
+
+    if exclude_titles is None:
+        exclude_titles = []
+
+    prompt = _build_recommendation_prompt(genre, exclude_titles)
+
+    logger.info(f"Streaming recommendation prompt to Gemini for genre: {genre}. Excluding {len(exclude_titles)} titles.")
+    response = generate("recommendations", prompt, stream=True)
+
+    exclude_titles_lower = {title.lower() for title in exclude_titles if isinstance(title, str)}
+    titles_seen = set()
+    poster_futures = {}
+    index = 0
+    for rec in iter_array_objects(chunk.text for chunk in response if getattr(chunk, "text", None)):
+        title = rec.get("title") if isinstance(rec, dict) else None
+        if not title:
+            logger.warning("Recommendation found with no title.")
+            continue
+        title_lower = title.lower()
+        if title_lower in exclude_titles_lower or title_lower in titles_seen:
+            continue
+        titles_seen.add(title_lower)
+
+        try:
+            rec = _normalize_recommendation(rec)
+        except LLMJSONError as e:
+            logger.warning(f"Skipping streamed recommendation: {e}")
+            continue
+        if rec["status"] == 'upcoming':
+            rec["posterUrl"] = "https://via.placeholder.com/500x750.png?text=Upcoming"
+        else:
+            rec["posterUrl"] = None
+            poster_futures[index] = submit_poster_lookup(title)
+        yield "item", index, rec
+        index += 1
+    record_usage("recommendations", response)
+
+    for item_index, poster_url in iter_completed_posters(poster_futures):
+        yield "poster", item_index, poster_url
+
+
+def get_llm_recommendation_pool(genre, size, known_titles=None):
+    """
+    Asks Gemini for a large batch of recommendations for a genre, used to
+    fill the local genre pool. Posters are not resolved here.
+    """
+    if not llm_configured():
+         logger.info("No LLM provider configured. Cannot fill recommendation pool.")
+         return []
+
+    prompt = f"Genre: {genre}\nCount: {size}"
+    if known_titles:
+        prompt += f"\nKnown list: {json.dumps(list(known_titles), ensure_ascii=False)}"
+
+    response = None
+    try:
+        logger.info(f"Sending pool prompt to Gemini for genre: {genre} ({size} titles).")
+        response = generate("recommendation_pool", prompt)
+        # A truncated pool response still yields every complete element.
+        pool_data = parse_llm_json(response.text, RECOMMENDATIONS_RESPONSE_SCHEMA, expect="object")
+
+        pool = []
+        titles_seen = set()
+        for rec in pool_data["recommendations"]:
+            if rec["title"].lower() in titles_seen:
+                continue
+            titles_seen.add(rec["title"].lower())
+            pool.append(rec)
+        logger.info(f"Parsed {len(pool)} pool recommendations for '{genre}'")
+        return pool
+    except LLMJSONError as e:
+        logger.error(f"Error decoding JSON pool response for '{genre}': {e}")
+        logger.debug(f"Problematic response text: {getattr(response, 'text', '')}")
+        return []
+    except Exception as e:
+        logger.exception(f"Error filling recommendation pool for '{genre}': {e}")
+        return []
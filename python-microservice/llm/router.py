@@ -0,0 +1,359 @@
+"""
+Routes each LLM task to a provider and model (llm/providers.py).
+
+Every task has an ordered list of routes ("provider:model"). Routes whose
+provider is unconfigured or whose circuit is open are skipped; the rest are
+ranked by a rolling latency average plus their recent error rate, with the
+configured order breaking ties. The best route gets the task's timeout; if it
+has not answered after the hedge delay (or fails) the next route is started,
+and the first successful answer wins. Background work (see
+core.quota.background_priority) uses the cheaper route tier and only fails
+over, never hedges. Within a request the timeouts are clamped to its
+deadline (core/deadline.py), and calls still queued when it passes are dropped.
+
+Routes are overridden per task with LLM_ROUTES and LLM_BACKGROUND_ROUTES,
+e.g. "details=openai:gpt-4o-mini,gemini:gemini-2.5-flash;top_dramas=gemini:gemini-2.5-flash-lite".
+"""
+import os
+import time
+import queue
+import functools
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from core.breaker import BREAKER_STATES, CircuitBreaker
+from core.clients import DEFAULT_GEMINI_MODEL
+from core.deadline import DeadlineExceeded, clamp, expired
+from core.log import get_logger
+from core.metrics import describe, inc, observe, register_collector
+from core.quota import QuotaExceeded, is_background
+from llm.providers import PROVIDERS
+
+logger = get_logger(__name__)
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", DEFAULT_GEMINI_MODEL)
+GEMINI_CHEAP_MODEL = os.getenv("GEMINI_CHEAP_MODEL", "gemini-2.5-flash-lite")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_CHEAP_MODEL = os.getenv("OPENAI_CHEAP_MODEL", "gpt-4o-mini")
+
+LLM_HEDGE_FACTOR = float(os.getenv("LLM_HEDGE_FACTOR", 2.0))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 4.0))
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", 50))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 3))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 60))
+
+# Seconds one provider call may take, per task.
+TASK_TIMEOUTS = {
+    "details": 20.0,
+    "url_details": 45.0,
+    "recommendations": 25.0,
+    "details_batch": 90.0,
+    "recommendation_pool": 90.0,
+    "top_dramas": 60.0,
+    "new_releases": 90.0,
+}
+DEFAULT_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))
+
+_INTERACTIVE_ROUTES = [("gemini", GEMINI_MODEL), ("openai", OPENAI_MODEL)]
+_BACKGROUND_ROUTES = [("gemini", GEMINI_CHEAP_MODEL), ("openai", OPENAI_CHEAP_MODEL)]
+
+
+class LLMUnavailable(Exception):
+    """No route could answer the task (none configured, all circuits open, or all failed)."""
+
+
+def _parse_routes(spec):
+    routes = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(";"))):
+        task, _, targets = part.partition("=")
+        parsed = []
+        for target in filter(None, (t.strip() for t in targets.split(","))):
+            provider, _, model = target.partition(":")
+            if provider not in PROVIDERS or not model:
+                logger.warning(f"Ignoring unknown LLM route '{target}' for task '{task.strip()}'")
+                continue
+            parsed.append((provider, model))
+        if parsed:
+            routes[task.strip()] = parsed
+    return routes
+
+
+_route_overrides = _parse_routes(os.getenv("LLM_ROUTES"))
+_background_overrides = _parse_routes(os.getenv("LLM_BACKGROUND_ROUTES"))
+
+
+class RouteStats:
+    """Rolling latency and outcome window for one provider/model pair."""
+
+    def __init__(self, window=LLM_STATS_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self.counters = {"calls": 0, "errors": 0, "timeouts": 0, "hedged": 0, "skipped": 0, "wins": 0}
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.counters["calls"] += 1
+            if ok:
+                self._latencies.append(seconds)
+            else:
+                self.counters["errors"] += 1
+            self._outcomes.append(ok)
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def mean_latency(self):
+        with self._lock:
+            return sum(self._latencies) / len(self._latencies) if self._latencies else None
+
+    def error_rate(self):
+        with self._lock:
+            return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def score(self, timeout):
+        """
+        Expected seconds to an answer: mean latency, with each failure costing
+        a timeout. None until the route has been called.
+        """
+        latency = self.mean_latency()
+        if latency is None and not self._outcomes:
+            return None
+        return (latency or 0.0) + self.error_rate() * timeout
+
+    def snapshot(self):
+        latency = self.mean_latency()
+        return {
+            "mean_latency": round(latency, 3) if latency is not None else None,
+            "error_rate": round(self.error_rate(), 3),
+            **self.counters,
+        }
+
+
+_stats_lock = threading.Lock()
+_stats = {}
+_breakers = {name: CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN) for name in PROVIDERS}
+LLM_ROUTER_WORKERS = int(os.getenv("LLM_ROUTER_WORKERS", 16))
+_executor = ThreadPoolExecutor(max_workers=LLM_ROUTER_WORKERS, thread_name_prefix="llm-route")
+
+
+def _route_stats(route):
+    stats = _stats.get(route)
+    if stats is None:
+        with _stats_lock:
+            stats = _stats.setdefault(route, RouteStats())
+    return stats
+
+
+def routes_for(task, background=None):
+    """Configured routes for `task` in preference order, before health ranking."""
+    background = is_background() if background is None else background
+    if background:
+        return _background_overrides.get(task) or _route_overrides.get(task) or _BACKGROUND_ROUTES
+    return _route_overrides.get(task) or _INTERACTIVE_ROUTES
+
+
+def task_timeout(task):
+    return TASK_TIMEOUTS.get(task, DEFAULT_TIMEOUT)
+
+
+def _ranked_routes(task, timeout):
+    scored = []
+    previous = 0.0
+    for route in routes_for(task):
+        if not PROVIDERS[route[0]].configured():
+            continue
+        score = _route_stats(route).score(timeout)
+        # An untried route ranks level with the one configured before it, so
+        # a backup is not promoted just for lacking samples. sorted() is
+        # stable, so ties keep the configured order.
+        previous = previous if score is None else score
+        scored.append((previous, route))
+    return [route for _, route in sorted(scored, key=lambda item: item[0])]
+
+
+def _hedge_delay(route, timeout):
+    latency = _route_stats(route).mean_latency()
+    if latency is None:
+        return max(LLM_HEDGE_MIN_DELAY, timeout / 2)
+    return min(timeout, max(LLM_HEDGE_MIN_DELAY, latency * LLM_HEDGE_FACTOR))
+
+
+def _call_route(route, spec, prompt, timeout, **kwargs):
+    try:
+        return _generate_on_route(route, spec, prompt, timeout, **kwargs)
+    finally:
+        # No-op after record_success/record_failure; otherwise (deadline,
+        # refused quota) frees a half-open probe so the provider isn't
+        # dropped for good.
+        _breakers[route[0]].release_probe()
+
+
+def _on_done(results, route, future):
+    if future.cancelled():
+        # Never ran, so _call_route could not release its probe slot.
+        _breakers[route[0]].release_probe()
+    else:
+        results.put((route, future))
+
+
+def _generate_on_route(route, spec, prompt, timeout, **kwargs):
+    provider_name, model = route
+    if expired():
+        # Queued until the caller had already given up.
+        raise DeadlineExceeded(f"Deadline exceeded before {provider_name} call for '{spec.task}'")
+    provider = PROVIDERS[provider_name]
+    stats = _route_stats(route)
+    started = time.perf_counter()
+    try:
+        response = provider.generate(spec, model, prompt, timeout=timeout, **kwargs)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if expired():
+            # Cut short by the caller's deadline; not the provider's fault.
+            raise DeadlineExceeded(f"Deadline exceeded during {provider_name} call for '{spec.task}'") from e
+        elapsed = time.perf_counter() - started
+        stats.record(elapsed, ok=False)
+        if elapsed >= timeout:
+            stats.count("timeouts")
+        # A refused quota slot says nothing about the provider's health.
+        if not isinstance(e, QuotaExceeded):
+            _breakers[provider_name].record_failure()
+        inc("llm_route_errors_total", task=spec.task, provider=provider_name, model=model)
+        raise
+    finally:
+        observe("stage_seconds", time.perf_counter() - started, stage="llm_provider", provider=provider_name)
+    stats.record(time.perf_counter() - started, ok=True)
+    _breakers[provider_name].record_success()
+    return response
+
+
+def _next_allowed(remaining):
+    for route in remaining:
+        if _breakers[route[0]].allow():
+            return route
+        _route_stats(route).count("skipped")
+    return None
+
+
+def generate(spec, prompt, stream=False, **kwargs):
+    """
+    Answers `prompt` for the task described by `spec` on the best available
+    route, hedging to the next one when it is slow and failing over when it
+    errors. Raises LLMUnavailable when no route produced an answer.
+    """
+    timeout = clamp(task_timeout(spec.task))
+    if timeout <= 0:
+        raise DeadlineExceeded(f"No time left for '{spec.task}'")
+    remaining = iter(_ranked_routes(spec.task, task_timeout(spec.task)))
+
+    if stream:
+        # A stream can't be raced or replayed, so only the initial call fails over.
+        errors = []
+        while (route := _next_allowed(remaining)) is not None:
+            try:
+                return _call_route(route, spec, prompt, timeout, stream=True, **kwargs)
+            except Exception as e:
+                logger.warning(f"LLM route {route[0]}:{route[1]} failed for '{spec.task}': {e}")
+                errors.append(e)
+        raise LLMUnavailable(f"No LLM route answered '{spec.task}': {errors[-1] if errors else 'none configured'}")
+
+    hedge = not is_background()
+    results = queue.Queue()
+    futures = []
+    last_error = None
+    deadline = time.monotonic() + timeout
+
+    def launch_next():
+        route = _next_allowed(remaining)
+        if route is None:
+            return None
+        # Hedges get what is left of the task's budget; the caller's quota
+        # priority is carried into the worker thread.
+        budget = max(1.0, deadline - time.monotonic())
+        future = _executor.submit(contextvars.copy_context().run, _call_route, route, spec, prompt, budget, **kwargs)
+        future.add_done_callback(functools.partial(_on_done, results, route))
+        futures.append(future)
+        return route
+
+    current = launch_next()
+    if current is None:
+        raise LLMUnavailable(f"No LLM route available for '{spec.task}'")
+    pending = 1
+
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            wait = deadline - now
+            if hedge and current is not None:
+                wait = min(wait, _hedge_delay(current, timeout))
+            try:
+                route, future = results.get(timeout=wait)
+            except queue.Empty:
+                if not hedge or current is None:
+                    continue
+                # The current route is slow: race the next one against it.
+                logger.info(f"LLM route {current[0]}:{current[1]} slow for '{spec.task}', hedging")
+                _route_stats(current).count("hedged")
+                current = launch_next()
+                if current is not None:
+                    pending += 1
+                continue
+
+            pending -= 1
+            error = future.exception()
+            if error is None:
+                _route_stats(route).count("wins")
+                inc("llm_route_calls_total", task=spec.task, provider=route[0], model=route[1])
+                return future.result()
+            last_error = error
+            logger.warning(f"LLM route {route[0]}:{route[1]} failed for '{spec.task}': {error}")
+            started = launch_next()
+            if started is not None:
+                current = started
+                pending += 1
+    finally:
+        # Calls still queued for a worker are dropped; running ones end at
+        # their provider timeout, which was clamped to the deadline.
+        for future in futures:
+            future.cancel()
+
+    if expired():
+        raise DeadlineExceeded(f"Deadline exceeded waiting for '{spec.task}'")
+    if pending:
+        raise LLMUnavailable(f"No LLM route answered '{spec.task}' within {timeout:.0f}s")
+    raise LLMUnavailable(f"All LLM routes failed for '{spec.task}': {last_error}")
+
+
+def router_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "breakers": {name: breaker.state() for name, breaker in _breakers.items()},
+        "routes": {f"{provider}:{model}": s.snapshot() for (provider, model), s in stats.items()},
+    }
+
+
+def _collect_router_metrics():
+    samples = []
+    for name, breaker in _breakers.items():
+        samples.append(("llm_provider_breaker_state", {"provider": name}, BREAKER_STATES[breaker.state()]))
+    with _stats_lock:
+        stats = dict(_stats)
+    for (provider, model), route in stats.items():
+        labels = {"provider": provider, "model": model}
+        snapshot = route.snapshot()
+        samples.append(("llm_route_error_rate", labels, snapshot["error_rate"]))
+        if snapshot["mean_latency"] is not None:
+            samples.append(("llm_route_mean_latency_seconds", labels, snapshot["mean_latency"]))
+    return samples
+
+
+register_collector(_collect_router_metrics)
+describe("llm_route_calls_total", "LLM answers per task and the provider/model that won.")
+describe("llm_route_errors_total", "Failed LLM provider calls per task, provider and model.")
@@ -0,0 +1,304 @@
+"""
+Poster image proxy. Source images are downloaded once, stored under the
+SHA-256 of their bytes, and resized into a few fixed-width WebP/JPEG
+variants that are served straight from disk. The cache directory is
+bounded in size; least recently served files are evicted first.
+
+Proxy URLs carry the source URL and an HMAC of it, so the endpoint cannot
+be used to fetch arbitrary URLs. Resizing needs Pillow; without it the
+original bytes are served unchanged.
+"""
+import os
+import hmac
+import base64
+import hashlib
+import secrets
+import tempfile
+import threading
+from io import BytesIO
+from urllib.parse import quote
+from core.clients import get_client
+from core.config import lazy_import
+from core.disk_cache import DEFAULT_CACHE_DIR, DiskCache, cache_path
+from core.metrics import inc, register_collector, timer
+from core.singleflight import SingleFlight
+from scrapers.poster_validation import live_poster_url
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Pillow is optional; variants fall back to the original.
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+# Public base URL of this service as seen by browsers. Proxying is off
+# (posters keep their third-party URLs) until it is set.
+IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "").rstrip("/")
+IMAGE_PROXY_SECRET = os.getenv("IMAGE_PROXY_SECRET", "")
+IMAGE_PROXY_DEFAULT_SIZE = os.getenv("IMAGE_PROXY_DEFAULT_SIZE", "card")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or os.path.join(DEFAULT_CACHE_DIR, "images")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_SOURCE_MAX_BYTES = int(os.getenv("IMAGE_SOURCE_MAX_BYTES", 10 * 1024 * 1024))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", 10))
+IMAGE_MAX_AGE = int(os.getenv("IMAGE_MAX_AGE", 30 * 24 * 3600))
+# Browser cache lifetime. Kept short because a proxy URL names the source
+# poster, not its content: the recheck job can swap a dead poster for its
+# replacement behind the same URL. Revalidation is cheap through the ETag.
+IMAGE_CLIENT_MAX_AGE = int(os.getenv("IMAGE_CLIENT_MAX_AGE", 24 * 3600))
+
+# Poster widths in pixels; height follows the source aspect ratio.
+SIZES = {"thumb": 185, "card": 342, "full": 780}
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+
+class ImageProxyError(Exception):
+    def __init__(self, message, status=502):
+        super().__init__(message)
+        self.status = status
+
+
+def _load_secret():
+    if IMAGE_PROXY_SECRET:
+        return IMAGE_PROXY_SECRET.encode("utf-8")
+    # Persist a generated key so proxy URLs stored in caches survive restarts.
+    path = cache_path("image_proxy.key")
+    try:
+        with open(path, "x", encoding="utf-8") as f:
+            f.write(secrets.token_hex(32))
+    except FileExistsError:
+        pass
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip().encode("utf-8")
+
+
+_secret = None
+
+
+def _sign(url):
+    global _secret
+    if _secret is None:
+        _secret = _load_secret()
+    return hmac.new(_secret, url.encode("utf-8"), hashlib.sha256).hexdigest()[:20]
+
+
+def _encode_url(url):
+    return base64.urlsafe_b64encode(url.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_url(token):
+    try:
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def proxy_url(url, size=None):
+    """Proxy URL for a poster, or `url` unchanged when proxying is off or it isn't http(s)."""
+    if not IMAGE_PROXY_BASE_URL or not url or not url.startswith(("http://", "https://")):
+        return url
+    size = size or IMAGE_PROXY_DEFAULT_SIZE
+    return f"{IMAGE_PROXY_BASE_URL}/poster-image/{_sign(url)}/{_encode_url(url)}?size={quote(size)}"
+
+
+def verify_token(signature, token):
+    """The source URL behind a proxy path, or None if the signature doesn't match."""
+    url = _decode_url(token)
+    if url is None or not hmac.compare_digest(_sign(url), signature or ""):
+        return None
+    return url
+
+
+class ImageStore:
+    """
+    Content-addressed files under `directory`: originals as <sha>.orig and
+    variants as <sha>.<size>.<ext>, sharded by the first two hex digits.
+    Serving a file bumps its mtime, which drives LRU eviction.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+        self.counters = {"fetches": 0, "variants": 0, "hits": 0, "evicted_files": 0}
+
+    def path(self, digest, suffix):
+        return os.path.join(self.directory, digest[:2], f"{digest}.{suffix}")
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    yield os.path.join(root, name)
+
+    def write(self, digest, suffix, data):
+        path = self.path(digest, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total is not None:
+                self._total += len(data)
+        self._evict_if_needed()
+        return path
+
+    def touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def total_bytes(self):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(os.path.getsize(p) for p in self._files())
+            return self._total
+
+    def _evict_if_needed(self):
+        if self.total_bytes() <= self.max_bytes:
+            return
+        with self._lock:
+            files = []
+            for path in self._files():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            # Evict down to 90% so every write near the limit doesn't rescan.
+            target = self.max_bytes * 0.9
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.counters["evicted_files"] += 1
+            self._total = total
+
+    def stats(self):
+        return {"bytes": self.total_bytes(), "max_bytes": self.max_bytes, **self.counters}
+
+
+_store = ImageStore(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+# source URL -> {"digest": ..., "contentType": ...}
+_sources = DiskCache(os.getenv("IMAGE_SOURCES_PATH") or cache_path("image_sources.db"), max_entries=50000)
+_fetch_flight = SingleFlight("image_fetch")
+_variant_flight = SingleFlight("image_variant")
+
+
+def _download(url):
+    session = get_client("http")
+    with timer("image_fetch"):
+        response = session.get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True, headers={"Accept": "image/*"})
+        try:
+            if not response.ok:
+                raise ImageProxyError(f"Source returned HTTP {response.status_code}")
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/"):
+                raise ImageProxyError(f"Source is not an image ({content_type or 'no content type'})")
+            chunks, size = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > IMAGE_SOURCE_MAX_BYTES:
+                    raise ImageProxyError("Source image is too large")
+                chunks.append(chunk)
+        finally:
+            response.close()
+    return b"".join(chunks), content_type
+
+
+def _fetch_original(url):
+    """Returns (digest, content_type) for a source URL, downloading it if needed."""
+    entry = _sources.get(url)
+    if entry and os.path.exists(_store.path(entry["digest"], "orig")):
+        return entry["digest"], entry["contentType"]
+
+    data, content_type = _download(url)
+    digest = hashlib.sha256(data).hexdigest()
+    _store.write(digest, "orig", data)
+    _store.counters["fetches"] += 1
+    _sources.set(url, {"digest": digest, "contentType": content_type}, IMAGE_MAX_AGE)
+    return digest, content_type
+
+
+def _render_variant(digest, size, fmt):
+    original = _store.path(digest, "orig")
+    pil_format, _ = FORMATS[fmt]
+    with timer("image_resize"):
+        with Image.open(original) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGB")
+            width = SIZES[size]
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            buffer = BytesIO()
+            if pil_format == "WEBP":
+                image.save(buffer, format=pil_format, quality=80, method=4)
+            else:
+                image.save(buffer, format=pil_format, quality=82, optimize=True, progressive=True)
+    _store.counters["variants"] += 1
+    return _store.write(digest, f"{size}.{fmt}", buffer.getvalue())
+
+
+def negotiate_format(accept_header):
+    return "webp" if "image/webp" in (accept_header or "") else "jpeg"
+
+
+def get_variant(url, size, fmt):
+    """
+    Returns (path, content_type, etag) for the `size`/`fmt` variant of the
+    poster at `url`, fetching and resizing on first use.
+    """
+    if size not in SIZES:
+        raise ImageProxyError(f"Unknown size '{size}'", status=400)
+
+    # Posters the recheck job found dead are served from their replacement.
+    url = live_poster_url(url)
+    digest, content_type = _fetch_flight.do(url, _fetch_original, url)
+
+    if Image is None:
+        path = _store.path(digest, "orig")
+        if not _store.touch(path):
+            _sources.delete(url)
+            digest, content_type = _fetch_flight.do(url, _fetch_original, url)
+            path = _store.path(digest, "orig")
+        return path, content_type, f'"{digest}"'
+
+    path = _store.path(digest, f"{size}.{fmt}")
+    if _store.touch(path):
+        _store.counters["hits"] += 1
+    else:
+        try:
+            path = _variant_flight.do((digest, size, fmt), _render_variant, digest, size, fmt)
+        except FileNotFoundError:
+            # Original was evicted between lookup and resize.
+            _sources.delete(url)
+            digest, _ = _fetch_flight.do(url, _fetch_original, url)
+            path = _variant_flight.do((digest, size, fmt), _render_variant, digest, size, fmt)
+        except OSError as e:
+            raise ImageProxyError(f"Could not decode source image: {e}")
+    inc("image_proxy_variants_total", size=size, format=fmt)
+    return path, FORMATS[fmt][1], f'"{digest}-{size}-{fmt}"'
+
+
+def cache_headers(etag):
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={IMAGE_CLIENT_MAX_AGE}",
+        "Vary": "Accept",
+    }
+
+
+def image_store_stats():
+    return _store.stats()
+
+
+register_collector(lambda: [(f"image_cache_{key}", {}, value) for key, value in image_store_stats().items()])
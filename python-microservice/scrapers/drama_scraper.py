@@ -1,104 +1,294 @@
 import os
 import time
-import re
-from ddgs import DDGS
-from googleapiclient.discovery import build
-from dotenv import load_dotenv
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from core.clients import get_client
+from core.config import lazy_import
+from core.deadline import DeadlineExceeded, clamp, expired
+from core.disk_cache import DiskCache, cache_path
+from core.quota import AllowanceSpent, QuotaExceeded, background_priority, call_with_quota
+from core.singleflight import single_flight
+from core.titles import normalize_title
+from scrapers.poster_providers import PosterProviderError, register_provider, search_hedged
+from media.image_proxy import proxy_url
+from scrapers.poster_validation import cached_verdict, choose_poster, probe_poster, record_replacement
+from core.log import get_logger
 
-load_dotenv()
+logger = get_logger(__name__)
+
+ddgs_module = lazy_import("ddgs")
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_SEARCH_API_KEY")
 GOOGLE_CSE_ID = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
 PLACEHOLDER_POSTER = "https://via.placeholder.com/500x750.png?text=Poster+Not+Found"
 
+# Posters rarely change, so found URLs live for a week; placeholders are
+# retried sooner in case the search backends were only briefly unavailable.
+POSTER_CACHE_TTL = int(os.getenv("POSTER_CACHE_TTL", 7 * 24 * 3600))
+POSTER_CACHE_NEGATIVE_TTL = int(os.getenv("POSTER_CACHE_NEGATIVE_TTL", 3600))
+POSTER_CACHE_MAX_ENTRIES = int(os.getenv("POSTER_CACHE_MAX_ENTRIES", 20000))
+
+POSTER_WORKERS = int(os.getenv("POSTER_WORKERS", 8))
+POSTER_TITLE_TIMEOUT = float(os.getenv("POSTER_TITLE_TIMEOUT", 8))
+POSTER_BATCH_DEADLINE = float(os.getenv("POSTER_BATCH_DEADLINE", 12))
+DDGS_TIMEOUT = float(os.getenv("DDGS_TIMEOUT", 5))
+
+# Cached posters whose liveness verdict has expired are re-probed in the
+# background; dead ones are searched again before users hit them.
+POSTER_RECHECK_INTERVAL = float(os.getenv("POSTER_RECHECK_INTERVAL", 900))
+POSTER_RECHECK_BATCH = int(os.getenv("POSTER_RECHECK_BATCH", 100))
+
+_poster_executor = ThreadPoolExecutor(max_workers=POSTER_WORKERS, thread_name_prefix="poster")
+
+_poster_cache = DiskCache(
+    os.getenv("POSTER_CACHE_PATH") or cache_path("posters.db"),
+    max_entries=POSTER_CACHE_MAX_ENTRIES,
+)
+
 def find_poster_google(title):
     if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
-        print("[ERROR] Google Search API Key or Engine ID not configured.")
-        print(f"[DEBUG] API Key present: {bool(GOOGLE_API_KEY)}")
-        print(f"[DEBUG] CSE ID present: {bool(GOOGLE_CSE_ID)}")
+        logger.error("Google Search API Key or Engine ID not configured.")
+        logger.debug(f"API Key present: {bool(GOOGLE_API_KEY)}")
+        logger.debug(f"CSE ID present: {bool(GOOGLE_CSE_ID)}")
         return None
 
-    print(f"[INFO] Searching Google Images for: {title}")
+    logger.info(f"Searching Google Images for: {title}")
     try:
-        service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-       
+        service = get_client("google_cse")
+
         query = f"{title} K-Drama poster cover"
-        res = service.cse().list(
+        request = service.cse().list(
             q=query,
             cx=GOOGLE_CSE_ID,
             searchType='image',
             num=5,
             imgSize='LARGE',
             safe='high'
-        ).execute()
+        )
+        res = call_with_quota("google_cse", request.execute, http=get_client("google_cse_http"))
 
         items = res.get('items', [])
-        print(f"[INFO] Google Image Results for '{query}': {len(items)} found") 
+        logger.info(f"Google Image Results for '{query}': {len(items)} found")
 
         if not items:
-            print("[WARN] No Google image results found")
+            logger.warning("No Google image results found")
             return None
 
-        preferred_sources = ['pinterest.com', 'mydramalist.com', 'themoviedb.org', 'asianwiki.com', 'imdb.com', 'tvdb.com']
-        for item in items:
-            link = item.get('link')
-            if link and any(source in link for source in preferred_sources):
-                print(f"[SUCCESS] Found preferred Google poster: {link}")
-                return link
-
-        first_result_link = items[0].get('link')
-        print(f"[INFO] Using first Google image result as fallback: {first_result_link}")
-        return first_result_link
+        # Ranking by source and resolution happens once candidates are probed.
+        return [
+            {
+                "url": item.get('link'),
+                "width": item.get('image', {}).get('width'),
+                "height": item.get('image', {}).get('height'),
+            }
+            for item in items
+            if item.get('link')
+        ]
 
+    except AllowanceSpent as e:
+        # The caller's own budget, not Google's quota: no breaker failure.
+        logger.info(f"Google Search request not sent: {e}")
+        return None
+    except QuotaExceeded as e:
+        logger.warning(f"Google Search request not sent: {e}")
+        raise PosterProviderError(str(e), quota=True)
     except Exception as e:
-        print(f"[ERROR] Error searching Google Images: {e}")
-        if "Quota exceeded" in str(e) or "quotaExceeded" in str(e):
-            print("[ERROR] Google Search Quota likely exceeded.")
+        logger.error(f"Error searching Google Images: {e}")
+        if "Quota exceeded" in str(e) or "quotaExceeded" in str(e) or "403" in str(e):
+            logger.error("Google Search Quota likely exceeded.")
+            raise PosterProviderError(str(e), quota=True)
         elif "invalid" in str(e).lower():
-            print("[ERROR] Invalid API credentials. Please check your API key and CSE ID.")
+            logger.error("Invalid API credentials. Please check your API key and CSE ID.")
         return None
 
 
 def find_poster_ddgs(title):
-    print(f"[INFO] Searching DuckDuckGo Images for: {title}")
-    time.sleep(0.5) 
+    logger.info(f"Searching DuckDuckGo Images for: {title}")
     try:
-        with DDGS() as ddgs:
+        with ddgs_module.DDGS(timeout=clamp(DDGS_TIMEOUT)) as ddgs:
             query = f"{title} K-Drama poster cover"
             results = list(ddgs.images(query, max_results=10))
-            print(f"[INFO] DDGS Image Results for '{query}': {len(results)} found")
+            logger.info(f"DDGS Image Results for '{query}': {len(results)} found")
             if results:
-                preferred_sources = ['pinterest.com', 'mydramalist.com', 'themoviedb.org', 'asianwiki.com', 'imdb.com', 'tvdb.com']
-                results.sort(key=lambda x: x.get('width', 0) * x.get('height', 0), reverse=True)
-                for res in results:
-                    image_url = res.get('image', '')
-                    if any(source in image_url for source in preferred_sources):
-                        print(f"[SUCCESS] Found preferred DDGS poster: {image_url}")
-                        return image_url
-                first_result_url = results[0].get('image')
-                print(f"[INFO] Using first DDGS image result as fallback: {first_result_url}")
-                return first_result_url
-            print("[WARN] No DDGS image results found.")
+                return [
+                    {"url": res.get('image'), "width": res.get('width'), "height": res.get('height')}
+                    for res in results
+                    if res.get('image')
+                ]
+            logger.warning("No DDGS image results found.")
     except Exception as e:
         if "403" in str(e) or "Ratelimit" in str(e):
-            print(f"[ERROR] DuckDuckGo Image Search Rate Limited: {e}")
+            logger.error(f"DuckDuckGo Image Search Rate Limited: {e}")
+            raise PosterProviderError(str(e), quota=True)
         else:
-            print(f"[ERROR] Error searching DuckDuckGo Images: {e}")
+            logger.error(f"Error searching DuckDuckGo Images: {e}")
     return None
 
-def find_poster(title):
-    poster_url = find_poster_google(title)
+register_provider("google", find_poster_google, priority=10)
+register_provider("ddgs", find_poster_ddgs, priority=20)
 
-    if not poster_url:
-        print("[INFO] Google search failed or yielded no results, trying DDGS...")
-        poster_url = find_poster_ddgs(title)
+def _select_poster(result):
+    return choose_poster([result] if isinstance(result, str) else result)
+
+def _search_poster(title):
+    poster_url = search_hedged(title, select=_select_poster)
 
     if not poster_url:
-        print("[WARN] All image searches failed, returning placeholder.")
+        if expired():
+            # Out of time rather than out of results: don't cache a miss.
+            raise DeadlineExceeded(f"Poster search for '{title}' ran out of time")
+        logger.warning("All image searches failed, returning placeholder.")
+        return PLACEHOLDER_POSTER
+
+    return poster_url
+
+@single_flight("find_poster", key=normalize_title)
+def _lookup_poster(title):
+    """Source URL of the poster for `title` (cached), or the placeholder."""
+    key = normalize_title(title)
+    if not key:
         return PLACEHOLDER_POSTER
-    
-    if not poster_url or not re.match(r'^https?://.*\.(jpg|jpeg|png|webp|gif)(\?.*)?$', poster_url, re.IGNORECASE):
-        print(f"[WARN] Found URL '{poster_url}' doesn't look like a valid image URL. Returning placeholder.")
+
+    cached = _poster_cache.get(key)
+    if cached is not None:
+        return cached
+
+    poster_url = _search_poster(title)
+    ttl = POSTER_CACHE_NEGATIVE_TTL if poster_url == PLACEHOLDER_POSTER else POSTER_CACHE_TTL
+    _poster_cache.set(key, poster_url, ttl)
+    return poster_url
+
+def find_poster(title):
+    """
+    Poster URL for `title`, routed through the image proxy when it is
+    enabled. The placeholder stands in once the request's deadline is spent.
+    """
+    try:
+        poster_url = _lookup_poster(title)
+    except DeadlineExceeded as e:
+        logger.info(f"{e}; using placeholder poster.")
         return PLACEHOLDER_POSTER
+    return poster_url if poster_url == PLACEHOLDER_POSTER else proxy_url(poster_url)
+
+def poster_cache_stats():
+    return _poster_cache.stats()
+
+def recheck_cached_posters(limit=None):
+    """
+    Re-probes cached posters (most used first) whose verdict has expired and
+    searches again for the dead ones. Returns the number replaced.
+    """
+    limit = POSTER_RECHECK_BATCH if limit is None else limit
+    probed = replaced = 0
+    for key, url in _poster_cache.entries():
+        if probed >= limit:
+            break
+        if url == PLACEHOLDER_POSTER:
+            continue
+        verdict = cached_verdict(url)
+        if verdict is None:
+            verdict = probe_poster(url)
+            probed += 1
+        if verdict["ok"] or verdict.get("replacement"):
+            continue
+
+        logger.info(f"Cached poster for '{key}' is dead ({verdict.get('reason')}), searching again.")
+        _poster_cache.delete(key)
+        replacement = _lookup_poster(key)
+        record_replacement(url, replacement)
+        replaced += 1
+    if probed:
+        logger.info(f"Poster recheck: probed {probed}, replaced {replaced}.")
+    return replaced
+
+def _recheck_loop():
+    with background_priority():
+        while True:
+            time.sleep(POSTER_RECHECK_INTERVAL)
+            try:
+                recheck_cached_posters()
+            except Exception as e:
+                logger.error(f"Poster recheck failed: {e}")
+
+_recheck_started = False
+_recheck_lock = threading.Lock()
+
+def start_poster_recheck():
+    global _recheck_started
+    if POSTER_RECHECK_INTERVAL <= 0:
+        return
+    with _recheck_lock:
+        if _recheck_started:
+            return
+        _recheck_started = True
+    threading.Thread(target=_recheck_loop, name="poster-recheck", daemon=True).start()
 
-    return poster_url
\ No newline at end of file
+def find_posters(titles, title_timeout=None, deadline=None):
+    """
+    Resolves posters for many titles concurrently on a bounded thread pool.
+    Results come back in input order; a title whose lookup exceeds its own
+    timeout or the overall deadline gets the placeholder poster.
+    """
+    title_timeout = POSTER_TITLE_TIMEOUT if title_timeout is None else title_timeout
+    deadline = clamp(POSTER_BATCH_DEADLINE if deadline is None else deadline)
+    batch_deadline = time.monotonic() + deadline
+
+    started_at = {}
+    started_lock = threading.Lock()
+
+    def run(key, title):
+        with started_lock:
+            started_at[key] = time.monotonic()
+        return find_poster(title)
+
+    futures = {}
+    for title in titles:
+        key = normalize_title(title)
+        if key and key not in futures:
+            futures[key] = _poster_executor.submit(contextvars.copy_context().run, run, key, title)
+
+    resolved = {}
+    for key, future in futures.items():
+        now = time.monotonic()
+        wait_for = batch_deadline - now
+        with started_lock:
+            started = started_at.get(key)
+        if started is not None:
+            wait_for = min(wait_for, started + title_timeout - now)
+        try:
+            resolved[key] = future.result(timeout=max(wait_for, 0))
+        except FutureTimeoutError:
+            logger.warning(f"Poster lookup timed out for key '{key}', using placeholder.")
+            future.cancel()
+            resolved[key] = PLACEHOLDER_POSTER
+        except Exception as e:
+            logger.error(f"Poster lookup failed for key '{key}': {e}")
+            resolved[key] = PLACEHOLDER_POSTER
+
+    return [resolved.get(normalize_title(title), PLACEHOLDER_POSTER) for title in titles]
+
+def submit_poster_lookup(title):
+    return _poster_executor.submit(contextvars.copy_context().run, find_poster, title)
+
+def iter_completed_posters(futures, deadline=None):
+    """
+    Yields (key, poster_url) from a {key: future} mapping as lookups finish.
+    Lookups still running at the deadline yield the placeholder poster.
+    """
+    deadline = clamp(POSTER_BATCH_DEADLINE if deadline is None else deadline)
+    keys_by_future = {future: key for key, future in futures.items()}
+    try:
+        for future in as_completed(keys_by_future, timeout=deadline):
+            key = keys_by_future.pop(future)
+            try:
+                yield key, future.result()
+            except Exception as e:
+                logger.error(f"Poster lookup failed for '{key}': {e}")
+                yield key, PLACEHOLDER_POSTER
+    except FutureTimeoutError:
+        logger.warning(f"{len(keys_by_future)} poster lookups missed the deadline, using placeholders.")
+    for future, key in keys_by_future.items():
+        future.cancel()
+        yield key, PLACEHOLDER_POSTER
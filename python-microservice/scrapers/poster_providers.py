@@ -0,0 +1,200 @@
+import os
+import time
+import queue
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from core.breaker import BREAKER_STATES, CircuitBreaker
+from core.deadline import clamp, expired
+from core.log import get_logger
+from core.metrics import LatencyHistogram, observe, register_collector
+
+logger = get_logger(__name__)
+
+POSTER_HEDGE_DELAY = float(os.getenv("POSTER_HEDGE_DELAY", 1.5))
+POSTER_SEARCH_TIMEOUT = float(os.getenv("POSTER_SEARCH_TIMEOUT", 10))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("POSTER_BREAKER_THRESHOLD", 3))
+BREAKER_COOLDOWN = float(os.getenv("POSTER_BREAKER_COOLDOWN", 300))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.5, 5.0, 10.0)
+
+
+class PosterProviderError(Exception):
+    """Raised by a provider when the backend refused the request (quota, 403, rate limit)."""
+
+    def __init__(self, message, quota=False):
+        super().__init__(message)
+        self.quota = quota
+
+
+class PosterProvider:
+    def __init__(self, name, search, priority):
+        self.name = name
+        self.search = search
+        self.priority = priority
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+        self.latency = LatencyHistogram(LATENCY_BUCKETS)
+        self.counters = {"calls": 0, "results": 0, "empty": 0, "errors": 0, "skipped": 0}
+
+
+_providers = []
+_providers_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("POSTER_PROVIDER_WORKERS", 16)), thread_name_prefix="poster-provider"
+)
+
+
+def register_provider(name, search, priority=100):
+    """
+    Registers a poster search backend. `search(title)` returns a URL, a list
+    of candidates ({"url", "width", "height"}) or None, and raises
+    PosterProviderError for quota/403 style refusals. Lower priority values
+    are tried first.
+    """
+    with _providers_lock:
+        _providers[:] = [p for p in _providers if p.name != name]
+        _providers.append(PosterProvider(name, search, priority))
+        _providers.sort(key=lambda p: p.priority)
+
+
+def unregister_provider(name):
+    with _providers_lock:
+        _providers[:] = [p for p in _providers if p.name != name]
+
+
+def provider_stats():
+    with _providers_lock:
+        providers = list(_providers)
+    return {
+        p.name: {
+            "priority": p.priority,
+            "breaker": p.breaker.state(),
+            "latency": p.latency.snapshot(),
+            **p.counters,
+        }
+        for p in providers
+    }
+
+
+def _collect_provider_metrics():
+    samples = []
+    for name, stats in provider_stats().items():
+        samples.append(("poster_provider_breaker_state", {"provider": name}, BREAKER_STATES[stats["breaker"]]))
+        for key in ("calls", "results", "empty", "errors", "skipped"):
+            samples.append((f"poster_provider_{key}", {"provider": name}, stats[key]))
+    return samples
+
+
+register_collector(_collect_provider_metrics)
+
+
+def _call_provider(provider, title):
+    try:
+        return _search_provider(provider, title)
+    finally:
+        # No-op after record_success/record_failure; otherwise frees a
+        # half-open probe so the provider isn't shut out for good.
+        provider.breaker.release_probe()
+
+
+def _search_provider(provider, title):
+    if expired():
+        # Queued behind other searches until the request gave up on it.
+        provider.counters["skipped"] += 1
+        return None
+    provider.counters["calls"] += 1
+    started = time.monotonic()
+    try:
+        result = provider.search(title)
+    except PosterProviderError as e:
+        provider.counters["errors"] += 1
+        if e.quota:
+            provider.breaker.record_failure()
+            if provider.breaker.state() == "open":
+                logger.warning(f"Poster provider '{provider.name}' circuit opened for {provider.breaker.cooldown}s")
+        return None
+    except Exception as e:
+        provider.counters["errors"] += 1
+        logger.error(f"Poster provider '{provider.name}' failed: {e}")
+        return None
+    finally:
+        elapsed = time.monotonic() - started
+        provider.latency.observe(elapsed)
+        observe("stage_seconds", elapsed, stage="poster_provider", provider=provider.name)
+
+    provider.breaker.record_success()
+    provider.counters["results" if result else "empty"] += 1
+    return result
+
+
+def _on_done(results, provider, future):
+    if future.cancelled():
+        # Never ran, so _call_provider could not release its probe slot.
+        provider.breaker.release_probe()
+    else:
+        results.put((provider, future.result()))
+
+
+def search_hedged(title, select=None, hedge_delay=None, timeout=None):
+    """
+    Queries providers in priority order, starting the next one after
+    `hedge_delay` seconds (or as soon as the current one comes back empty).
+    `select(result)` turns a provider's result into the poster URL to use,
+    or None to reject it; the first accepted result wins.
+    """
+    hedge_delay = POSTER_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    timeout = clamp(POSTER_SEARCH_TIMEOUT if timeout is None else timeout)
+    deadline = time.monotonic() + timeout
+
+    with _providers_lock:
+        candidates = list(_providers)
+
+    results = queue.Queue()
+    pending = 0
+    remaining = iter(candidates)
+    futures = []
+
+    def launch_next():
+        for provider in remaining:
+            if not provider.breaker.allow():
+                provider.counters["skipped"] += 1
+                continue
+            # Carry the caller's quota priority into the provider thread.
+            future = _hedge_executor.submit(contextvars.copy_context().run, _call_provider, provider, title)
+            future.add_done_callback(functools.partial(_on_done, results, provider))
+            futures.append(future)
+            return True
+        return False
+
+    if launch_next():
+        pending += 1
+
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            try:
+                provider, result = results.get(timeout=min(hedge_delay, deadline - now))
+            except queue.Empty:
+                # Current providers are slow: hedge with the next backend.
+                if launch_next():
+                    pending += 1
+                continue
+
+            pending -= 1
+            accepted = (select(result) if select else result) if result else None
+            if accepted:
+                return accepted
+            if result:
+                logger.warning(f"Provider '{provider.name}' returned no usable poster for '{title}'.")
+            if launch_next():
+                pending += 1
+    finally:
+        # Searches that never got a worker are dropped; running ones finish
+        # under their own client timeouts.
+        for future in futures:
+            future.cancel()
+
+    return None
@@ -0,0 +1,236 @@
+"""
+Poster candidate validation: probes candidate image URLs over the pooled
+HTTP client, checks status, content type, size and pixel dimensions, and
+ranks the survivors by source preference and resolution. Verdicts are
+cached per URL so a candidate is probed at most once per TTL.
+"""
+import os
+import re
+import struct
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+from core.clients import get_client
+from core.deadline import clamp
+from core.disk_cache import DiskCache, cache_path
+from core.metrics import inc, timer
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+POSTER_PROBE_ENABLED = os.getenv("POSTER_PROBE_ENABLED", "1") != "0"
+# "range" reads the first bytes with a ranged GET so dimensions can be
+# checked; "head" only checks status, type and size.
+POSTER_PROBE_METHOD = os.getenv("POSTER_PROBE_METHOD", "range").lower()
+POSTER_PROBE_RANGE_BYTES = int(os.getenv("POSTER_PROBE_RANGE_BYTES", 65536))
+POSTER_PROBE_TIMEOUT = float(os.getenv("POSTER_PROBE_TIMEOUT", 4))
+POSTER_PROBE_MAX_CANDIDATES = int(os.getenv("POSTER_PROBE_MAX_CANDIDATES", 5))
+POSTER_PROBE_WORKERS = int(os.getenv("POSTER_PROBE_WORKERS", 16))
+POSTER_PROBE_REFERER = os.getenv("POSTER_PROBE_REFERER", "")
+POSTER_PROBE_TTL = int(os.getenv("POSTER_PROBE_TTL", 24 * 3600))
+POSTER_PROBE_NEGATIVE_TTL = int(os.getenv("POSTER_PROBE_NEGATIVE_TTL", 6 * 3600))
+# Dead posters keep pointing at their replacement for as long as cached
+# responses may still carry the old URL.
+POSTER_REPLACEMENT_TTL = int(os.getenv("POSTER_REPLACEMENT_TTL", 7 * 24 * 3600))
+POSTER_MIN_BYTES = int(os.getenv("POSTER_MIN_BYTES", 2048))
+POSTER_MIN_WIDTH = int(os.getenv("POSTER_MIN_WIDTH", 150))
+POSTER_MIN_HEIGHT = int(os.getenv("POSTER_MIN_HEIGHT", 200))
+
+PREFERRED_SOURCES = ['mydramalist.com', 'themoviedb.org', 'asianwiki.com', 'imdb.com', 'tvdb.com', 'pinterest.com']
+
+_verdicts = DiskCache(os.getenv("POSTER_PROBE_CACHE_PATH") or cache_path("poster_probes.db"), max_entries=50000)
+_probe_executor = ThreadPoolExecutor(max_workers=POSTER_PROBE_WORKERS, thread_name_prefix="poster-probe")
+
+
+def has_image_extension(url):
+    return bool(url and re.match(r'^https?://.*\.(jpg|jpeg|png|webp|gif)(\?.*)?$', url, re.IGNORECASE))
+
+
+def image_dimensions(data):
+    """(width, height) read from the header of a JPEG, PNG, GIF or WebP; None if unknown."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            return 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little")
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+    if data[:2] == b"\xff\xd8":
+        index = 2
+        while index + 9 < len(data):
+            if data[index] != 0xFF:
+                index += 1
+                continue
+            marker = data[index + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                index += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack(">H", data[index + 2:index + 4])[0]
+            # SOF0-SOF15 carry the frame size; C4/C8/CC are DHT/JPG/DAC.
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[index + 5:index + 9])
+                return width, height
+            index += 2 + length
+    return None
+
+
+def _total_size(response):
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+        return int(content_range.rsplit("/", 1)[1])
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def _probe(url):
+    headers = {"Accept": "image/*"}
+    if POSTER_PROBE_REFERER:
+        # Hotlink-protected hosts answer differently depending on the referer.
+        headers["Referer"] = POSTER_PROBE_REFERER
+    verdict = {"ok": False, "status": None, "contentType": None, "bytes": None, "width": None, "height": None}
+    session = get_client("http")
+    try:
+        if POSTER_PROBE_METHOD == "head":
+            response = session.head(url, headers=headers, timeout=POSTER_PROBE_TIMEOUT, allow_redirects=True)
+            head = b""
+        else:
+            headers["Range"] = f"bytes=0-{POSTER_PROBE_RANGE_BYTES - 1}"
+            response = session.get(url, headers=headers, timeout=POSTER_PROBE_TIMEOUT, stream=True)
+            try:
+                head = response.raw.read(POSTER_PROBE_RANGE_BYTES, decode_content=True) if response.ok else b""
+            finally:
+                response.close()
+    except Exception as e:
+        verdict["reason"] = f"unreachable: {type(e).__name__}"
+        return verdict
+
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    dimensions = image_dimensions(head) if head else None
+    verdict.update(status=response.status_code, contentType=content_type or None, bytes=_total_size(response))
+    if dimensions:
+        verdict["width"], verdict["height"] = dimensions
+
+    if not response.ok:
+        verdict["reason"] = f"http {response.status_code}"
+    elif not content_type.startswith("image/") and not dimensions:
+        verdict["reason"] = f"not an image ({content_type or 'no content type'})"
+    elif verdict["bytes"] is not None and verdict["bytes"] < POSTER_MIN_BYTES:
+        verdict["reason"] = "too small"
+    elif dimensions and (dimensions[0] < POSTER_MIN_WIDTH or dimensions[1] < POSTER_MIN_HEIGHT):
+        verdict["reason"] = "low resolution"
+    else:
+        verdict["ok"] = True
+    return verdict
+
+
+def cached_verdict(url):
+    return _verdicts.get(url)
+
+
+def probe_poster(url, use_cache=True):
+    """Returns the verdict dict for `url` ("ok", "status", "contentType", "bytes", "width", "height", "reason")."""
+    if use_cache:
+        verdict = _verdicts.get(url)
+        if verdict is not None:
+            return verdict
+    with timer("poster_probe"):
+        verdict = _probe(url)
+    inc("poster_probes_total", result="ok" if verdict["ok"] else "rejected")
+    if not verdict["ok"]:
+        logger.info(f"Poster candidate rejected ({verdict['reason']}): {url}")
+    _verdicts.set(url, verdict, POSTER_PROBE_TTL if verdict["ok"] else POSTER_PROBE_NEGATIVE_TTL)
+    return verdict
+
+
+def record_replacement(url, replacement):
+    """Marks `url` dead and points it at `replacement` for live_poster_url()."""
+    verdict = dict(_verdicts.get(url) or {}, ok=False, replacement=replacement)
+    verdict.setdefault("reason", "dead")
+    _verdicts.set(url, verdict, POSTER_REPLACEMENT_TTL)
+
+
+def live_poster_url(url):
+    """`url`, or the poster that replaced it after it was found dead."""
+    if not url:
+        return url
+    verdict = _verdicts.get(url)
+    if verdict and not verdict["ok"] and verdict.get("replacement"):
+        return verdict["replacement"]
+    return url
+
+
+def _normalize_candidate(candidate):
+    if isinstance(candidate, str):
+        return {"url": candidate, "width": None, "height": None}
+    return {"url": candidate.get("url"), "width": candidate.get("width"), "height": candidate.get("height")}
+
+
+def _source_rank(url):
+    host = urlparse(url).netloc.lower()
+    for rank, source in enumerate(PREFERRED_SOURCES):
+        if host == source or host.endswith("." + source) or source in url:
+            return rank
+    return len(PREFERRED_SOURCES)
+
+
+def _rank_key(candidate):
+    width, height = candidate.get("width") or 0, candidate.get("height") or 0
+    landscape = 1 if width and height and width > height else 0
+    return (landscape, _source_rank(candidate["url"]), -(width * height))
+
+
+def choose_poster(candidates):
+    """
+    Picks the best live poster from provider candidates (URLs or dicts with
+    "url", "width", "height"). Candidates are probed concurrently; those that
+    pass are ranked portrait-first, then by source preference and resolution.
+    Returns the chosen URL or None.
+    """
+    seen = set()
+    normalized = []
+    for candidate in candidates or []:
+        candidate = _normalize_candidate(candidate)
+        url = candidate["url"]
+        if url and url.startswith(("http://", "https://")) and url not in seen:
+            seen.add(url)
+            normalized.append(candidate)
+    normalized.sort(key=_rank_key)
+
+    if not POSTER_PROBE_ENABLED:
+        return next((c["url"] for c in normalized if has_image_extension(c["url"])), None)
+
+    normalized = normalized[:POSTER_PROBE_MAX_CANDIDATES]
+    futures = {
+        _probe_executor.submit(contextvars.copy_context().run, probe_poster, c["url"]): c for c in normalized
+    }
+    # Probes cut off by the deadline keep running so their verdicts still
+    # get cached; only the wait for them is shortened.
+    done, not_done = wait(futures, timeout=clamp(POSTER_PROBE_TIMEOUT + 1))
+    for future in not_done:
+        future.cancel()
+
+    accepted = []
+    for future in done:
+        candidate = futures[future]
+        try:
+            verdict = future.result()
+        except Exception as e:
+            logger.error(f"Poster probe failed for {candidate['url']}: {e}")
+            continue
+        if verdict["ok"]:
+            accepted.append(dict(candidate, width=verdict["width"] or candidate["width"], height=verdict["height"] or candidate["height"]))
+
+    if not accepted:
+        return None
+    return min(accepted, key=_rank_key)["url"]
+
+
+def probe_stats():
+    return _verdicts.stats()
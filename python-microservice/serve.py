@@ -0,0 +1,45 @@
+"""
+Production launcher (no debug reloader).
+
+SERVER_MODE=asgi (default) serves asgi.py with uvicorn; SERVER_MODE=wsgi
+serves the Flask app with waitress.
+
+Settings: PYTHON_HOST, PYTHON_PORT, WEB_CONCURRENCY (worker processes),
+WSGI_THREADS (waitress threads) and ASGI_WORKER_THREADS (threads running
+the blocking handlers in ASGI mode). Upstream calls are synchronous in
+both modes, so WSGI_THREADS / ASGI_WORKER_THREADS bound how many requests
+do upstream work at once per process. ASGI_WORKER_THREADS defaults to
+LLM_ROUTER_WORKERS + POSTER_WORKERS (24), the most upstream calls the
+service makes at once; raise those pools and the quotas
+(GEMINI_RPM, GOOGLE_CSE_RPM, OPENAI_RPM) together with it.
+"""
+import os
+from core import config  # noqa: F401  (loads .env before anything reads settings)
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def main():
+    mode = os.getenv("SERVER_MODE", "asgi").lower()
+    host = os.getenv("PYTHON_HOST", "0.0.0.0")
+    port = int(os.getenv("PYTHON_PORT", 8000))
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+
+    if mode == "asgi":
+        import uvicorn
+
+        uvicorn.run("asgi:app", host=host, port=port, workers=workers, reload=False, log_level="info")
+    elif mode == "wsgi":
+        from waitress import serve
+        import handlers
+        from app import app
+
+        handlers.start_background_jobs()
+        serve(app, host=host, port=port, threads=int(os.getenv("WSGI_THREADS", 16)))
+    else:
+        raise SystemExit(f"Unknown SERVER_MODE '{mode}' (expected 'asgi' or 'wsgi')")
+
+
+if __name__ == "__main__":
+    main()
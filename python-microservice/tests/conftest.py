@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+# Set before any service module is imported: caches go to a scratch
+# directory and no upstream is ever configured (load_dotenv() never
+# overrides variables that are already set).
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="dramapaglu-tests-")
+for name in ("GEMINI_API_KEY", "OPENAI_API_KEY", "GOOGLE_SEARCH_API_KEY", "GOOGLE_SEARCH_ENGINE_ID"):
+    os.environ[name] = ""
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("STARTUP_WARMUP", "off")
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from core.breaker import CircuitBreaker
+from core.deadline import deadline_scope
+from core.quota import QuotaExceeded
+from scrapers import poster_providers
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.01)
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+
+def test_opens_after_threshold_and_refuses_during_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.state() == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = half_open_breaker()
+    assert breaker.state() == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_probe_success_closes():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state() == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_probe_failure_reopens():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state() == "open"
+    assert not breaker.allow()
+
+
+def test_release_probe_frees_the_slot_without_a_verdict():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state() == "half-open"
+    assert breaker.allow()
+
+
+def _provider(search):
+    provider = poster_providers.PosterProvider("test", search, priority=0)
+    provider.breaker = half_open_breaker()
+    assert provider.breaker.allow()
+    return provider
+
+
+def test_poster_probe_released_when_skipped_past_deadline():
+    provider = _provider(lambda title: "https://example.com/p.jpg")
+    with deadline_scope(0):
+        assert poster_providers._call_provider(provider, "Title") is None
+    assert provider.counters["skipped"] == 1
+    assert provider.breaker.allow()
+
+
+@pytest.mark.parametrize("error", [RuntimeError("boom"), QuotaExceeded("no slot"), poster_providers.PosterProviderError("bad")])
+def test_poster_probe_released_after_errors_that_are_not_failures(error):
+    def search(title):
+        raise error
+
+    provider = _provider(search)
+    assert poster_providers._call_provider(provider, "Title") is None
+    assert provider.breaker.state() == "half-open"
+    assert provider.breaker.allow()
+
+
+def test_poster_probe_released_when_future_is_cancelled():
+    provider = _provider(lambda title: None)
+    future = Future()
+    future.cancel()
+    poster_providers._on_done(None, provider, future)
+    assert provider.breaker.allow()
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from catalog import store
+from catalog.store import DramaCatalog
+
+DETAILS = {"description": "A drama.", "cast": ["Someone"], "country": "South Korea"}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = DramaCatalog(str(tmp_path / "catalog.db"))
+    catalog.upsert({"title": "Love Next Door", "altTitles": ["Eomma Chingu Adeul"], **DETAILS})
+    catalog.upsert({"title": "Squid Game", **DETAILS}, aliases=["Squid Game Season 1"])
+    catalog.upsert({"title": "Lovely Runner", "year": 2024})
+    return catalog
+
+
+@pytest.mark.parametrize("query, title", [
+    ("Love Next Door", "Love Next Door"),
+    ("love next door", "Love Next Door"),
+    ("SQUID GAME!", "Squid Game"),
+    ("Eomma Chingu Adeul", "Love Next Door"),
+    ("Squid Game Season 1", "Squid Game"),
+])
+def test_lookup_matches_titles_and_aliases(catalog, query, title):
+    assert catalog.lookup(query)["title"] == title
+
+
+@pytest.mark.parametrize("query", ["L", "Love", "Squid", "Squid Game 2", "The Squid Game", "Love Next Dor", ""])
+def test_lookup_ignores_partial_and_fuzzy_matches(catalog, query):
+    assert catalog.lookup(query) is None
+
+
+def test_lookup_with_details_skips_list_entries(catalog):
+    assert catalog.lookup("Lovely Runner")["title"] == "Lovely Runner"
+    assert catalog.lookup("Lovely Runner", require_details=True) is None
+    assert catalog.lookup("Squid Game", require_details=True)["description"] == "A drama."
+
+
+def test_lookup_with_details_skips_stale_records(catalog, monkeypatch):
+    monkeypatch.setattr(store, "CATALOG_MAX_AGE", 10)
+    monkeypatch.setattr(time, "time", lambda: 10 ** 12)
+    assert catalog.lookup("Squid Game", require_details=True) is None
+
+
+def test_search_keeps_prefix_and_fuzzy_matches(catalog):
+    assert [r["title"] for r in catalog.search("Love")] == ["Love Next Door", "Lovely Runner"]
+    assert [r["title"] for r in catalog.search("Squid Gme")] == ["Squid Game"]
+
+
+def test_aliases_survive_a_restart(catalog, tmp_path):
+    reopened = DramaCatalog(str(tmp_path / "catalog.db"))
+    assert reopened.lookup("Squid Game Season 1")["title"] == "Squid Game"
+    assert reopened.lookup("Eomma Chingu Adeul")["title"] == "Love Next Door"
+
+
+def test_alias_is_stored_even_when_the_record_is_unchanged(catalog, tmp_path):
+    catalog.upsert({"title": "Squid Game", **DETAILS}, aliases=["Ojingeo Geim"])
+    assert DramaCatalog(str(tmp_path / "catalog.db")).lookup("Ojingeo Geim")["title"] == "Squid Game"
+
+
+def test_workers_merge_with_each_others_writes(catalog, tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "CATALOG_RELOAD_CHECK", 0)
+    other = DramaCatalog(str(tmp_path / "catalog.db"))
+    other.upsert({"title": "Lovely Runner", "rating": "9.1/10"})
+    catalog.upsert({"title": "Lovely Runner", "genres": ["Romance"]}, aliases=["Seondoo"])
+    record = other.lookup("Seondoo")
+    assert record["rating"] == "9.1/10" and record["genres"] == ["Romance"] and record["year"] == 2024
+    assert catalog.lookup("Lovely Runner")["rating"] == "9.1/10"
+
+
+def test_details_lookup_drops_list_only_fields(catalog):
+    catalog.upsert({"title": "Squid Game", "reason": "Tense.", "airDate": "2021-09-17", "network": "Netflix"})
+    catalog.upsert({"title": "Squid Game", "posterUrl": "https://img/squid.jpg"})
+    record = catalog.lookup("Squid Game", require_details=True)
+    assert record["posterUrl"] == "https://img/squid.jpg" and record["description"] == "A drama."
+    assert not {"reason", "airDate", "network"} & set(record)
+    assert catalog.lookup("Squid Game")["network"] == "Netflix"
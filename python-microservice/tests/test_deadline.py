@@ -0,0 +1,154 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core import deadline
+from core.deadline import (
+    DeadlineExceeded, check, clamp, deadline_scope, expired, iter_with_budget, parse_budget, remaining,
+    run_until, run_with_budget, stage,
+)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1500", 1.5),
+    ("250.9", 0.25),
+    (None, deadline.REQUEST_BUDGET_MS / 1000),
+    ("soon", deadline.REQUEST_BUDGET_MS / 1000),
+    ("-5", deadline.REQUEST_BUDGET_MS / 1000),
+    (str(10 ** 9), deadline.MAX_BUDGET_MS / 1000),
+])
+def test_parse_budget(value, seconds):
+    assert parse_budget(value) == seconds
+
+
+def test_no_deadline_outside_a_scope():
+    assert remaining() is None
+    assert not expired()
+    assert clamp(5) == 5 and clamp(None) is None
+
+
+def test_nested_scope_never_extends_the_outer_deadline():
+    with deadline_scope(0.5):
+        with deadline_scope(60):
+            assert remaining() <= 0.5
+        with deadline_scope(0.1):
+            assert remaining() <= 0.1
+        assert 0.1 < remaining() <= 0.5
+    assert remaining() is None
+
+
+def test_stage_gets_a_share_of_what_is_left():
+    with deadline_scope(10):
+        with stage(0.5):
+            assert 4 < remaining() <= 5
+
+
+def test_clamp_and_check_after_expiry():
+    with deadline_scope(0):
+        assert expired()
+        assert clamp(5) == 0 and clamp(None) == 0
+        with pytest.raises(DeadlineExceeded):
+            check("test")
+
+
+def test_copied_context_carries_the_deadline_into_worker_threads():
+    with ThreadPoolExecutor(max_workers=1) as executor, deadline_scope(2):
+        assert 0 < executor.submit(contextvars.copy_context().run, remaining).result() <= 2
+        # Plain submits (background jobs) run without the request's deadline.
+        assert executor.submit(remaining).result() is None
+
+
+def test_plain_threads_have_no_deadline():
+    seen = []
+    with deadline_scope(2):
+        thread = threading.Thread(target=lambda: seen.append(remaining()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
+
+
+def test_run_with_budget():
+    assert 0 < run_with_budget(1.0, remaining) <= 1.0
+    assert remaining() is None
+
+
+def test_run_until_counts_from_a_fixed_deadline():
+    assert 0 < run_until(time.monotonic() + 1.0, remaining) <= 1.0
+    with pytest.raises(DeadlineExceeded):
+        run_until(time.monotonic() - 0.01, pytest.fail)
+
+
+def test_iter_with_budget_applies_one_deadline_to_every_step():
+    def steps():
+        for _ in range(3):
+            yield remaining()
+
+    stream = iter_with_budget(0.2, steps())
+    first = next(stream)
+    time.sleep(0.05)
+    rest = list(stream)
+    assert first <= 0.2 and all(left <= 0.15 for left in rest)
+    # Each step ran in its own scope; nothing leaks into the caller.
+    assert remaining() is None
+
+
+def test_iter_with_budget_steps_may_run_on_other_threads():
+    stream = iter_with_budget(1.0, (remaining() for _ in range(2)))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = [executor.submit(next, stream).result() for _ in range(2)]
+    assert all(0 < left <= 1.0 for left in results)
+
+
+def _echo_remaining(*args, **kwargs):
+    return {"remaining": remaining()}, 200
+
+
+def test_flask_request_runs_under_the_budget_header(monkeypatch):
+    import app
+    import handlers
+
+    monkeypatch.setattr(handlers, "fetch", _echo_remaining)
+    client = app.app.test_client()
+    assert 0 < client.get("/fetch?title=x", headers={deadline.BUDGET_HEADER: "2000"}).get_json()["remaining"] <= 2
+    default = client.get("/fetch?title=x").get_json()["remaining"]
+    assert deadline.REQUEST_BUDGET_MS / 1000 - 5 < default <= deadline.REQUEST_BUDGET_MS / 1000
+
+
+def test_asgi_request_and_stream_run_under_the_budget_header(monkeypatch):
+    from starlette.testclient import TestClient
+
+    import asgi
+    import handlers
+
+    def stream(*args, **kwargs):
+        return (f"{remaining()}\n" for _ in range(2)), "application/x-ndjson"
+
+    monkeypatch.setattr(handlers, "fetch", _echo_remaining)
+    monkeypatch.setattr(handlers, "recommend_stream", stream)
+    client = TestClient(asgi.app)
+    headers = {deadline.BUDGET_HEADER: "2000"}
+    assert 0 < client.get("/fetch?title=x", headers=headers).json()["remaining"] <= 2
+    lines = client.get("/recommend?genre=x&stream=ndjson", headers=headers).text.split()
+    assert len(lines) == 2 and all(0 < float(left) <= 2 for left in lines)
+
+
+def test_asgi_request_that_expires_in_the_queue_gets_a_504(monkeypatch):
+    from starlette.testclient import TestClient
+
+    import asgi
+    import handlers
+
+    monkeypatch.setattr(handlers, "fetch", _echo_remaining)
+    busy = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(asgi, "_executor", busy)
+    try:
+        busy.submit(time.sleep, 0.3)
+        client = TestClient(asgi.app)
+        response = client.get("/fetch?title=x", headers={deadline.BUDGET_HEADER: "100"})
+        assert response.status_code == 504
+        assert 0 < client.get("/fetch?title=x", headers={deadline.BUDGET_HEADER: "2000"}).json()["remaining"] < 2
+    finally:
+        busy.shutdown()
@@ -0,0 +1,44 @@
+import json
+
+from llm import drama_metadata
+
+
+class _Response:
+    def __init__(self, items):
+        self.text = json.dumps(items)
+
+
+def _setup(monkeypatch, items, single):
+    monkeypatch.setattr(drama_metadata, "llm_configured", lambda: True)
+    monkeypatch.setattr(drama_metadata, "generate", lambda task, prompt, **kwargs: _Response(items))
+    monkeypatch.setattr(drama_metadata, "get_llm_drama_details", single)
+
+
+def test_batch_elements_match_only_by_query(monkeypatch):
+    items = [
+        {"title": "Goblin", "query": "goblin"},
+        {"title": "Unasked", "query": "Something Else"},
+        {"title": "No Query"},
+    ]
+    retried = []
+
+    def single(title):
+        retried.append(title)
+        return {"title": f"{title} (single)"}
+
+    _setup(monkeypatch, items, single)
+    results = drama_metadata.get_llm_drama_details_batch(["Signal", "Goblin", "Vincenzo"])
+    assert [result["title"] for result in results] == ["Signal (single)", "Goblin", "Vincenzo (single)"]
+    assert sorted(retried) == ["Signal", "Vincenzo"]
+
+
+def test_failed_single_retry_gives_an_error_entry(monkeypatch):
+    def single(title):
+        if title == "Signal":
+            raise RuntimeError("boom")
+        return {"title": title, "description": "ok"}
+
+    _setup(monkeypatch, [], single)
+    signal, goblin = drama_metadata.get_llm_drama_details_batch(["Signal", "Goblin"])
+    assert signal["title"] == "Signal" and signal["description"].startswith("Error")
+    assert goblin["description"] == "ok"
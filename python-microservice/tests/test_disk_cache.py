@@ -0,0 +1,129 @@
+import pytest
+
+from core import disk_cache
+from core.disk_cache import DiskCache
+from scrapers import drama_scraper
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(disk_cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache.db")
+
+
+def test_round_trip_and_default(path, clock):
+    cache = DiskCache(path)
+    cache.set("k", {"posterUrl": "https://example.com/p.jpg", "cast": ["A"]}, ttl=60)
+    assert cache.get("k") == {"posterUrl": "https://example.com/p.jpg", "cast": ["A"]}
+    assert cache.get("missing", "default") == "default"
+
+
+def test_entries_expire_after_ttl(path, clock):
+    cache = DiskCache(path)
+    cache.set("k", "v", ttl=10)
+    clock.advance(9)
+    assert cache.get("k") == "v"
+    clock.advance(2)
+    assert cache.get("k") is None
+    # Gone from disk too, not just from the memory copy.
+    assert DiskCache(path).get("k") is None
+    assert cache.stats()["disk_entries"] == 0
+
+
+def test_poster_misses_use_the_negative_ttl(path, clock, monkeypatch):
+    monkeypatch.setattr(drama_scraper, "_poster_cache", DiskCache(path))
+    monkeypatch.setattr(drama_scraper, "POSTER_CACHE_TTL", 1000)
+    monkeypatch.setattr(drama_scraper, "POSTER_CACHE_NEGATIVE_TTL", 10)
+    found = {"Found Drama": "https://example.com/found.jpg"}
+    searches = []
+
+    def search(title):
+        searches.append(title)
+        return found.get(title, drama_scraper.PLACEHOLDER_POSTER)
+
+    monkeypatch.setattr(drama_scraper, "_search_poster", search)
+    assert drama_scraper._lookup_poster("Found Drama") == "https://example.com/found.jpg"
+    assert drama_scraper._lookup_poster("Missing Drama") == drama_scraper.PLACEHOLDER_POSTER
+    clock.advance(11)
+    drama_scraper._lookup_poster("Found Drama")
+    drama_scraper._lookup_poster("Missing Drama")
+    # Only the miss expired and was searched again.
+    assert searches == ["Found Drama", "Missing Drama", "Missing Drama"]
+
+
+def test_lru_eviction_at_the_size_cap(path, clock):
+    cache = DiskCache(path, max_entries=3, evict_every=1)
+    for key in ("a", "b", "c"):
+        cache.set(key, key, ttl=60)
+        clock.advance(1)
+    # A memory hit counts as use once its touch is flushed.
+    assert cache.get("a") == "a"
+    clock.advance(1)
+    cache.set("d", "d", ttl=60)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_eviction_drops_the_memory_copy(path, clock):
+    cache = DiskCache(path, max_entries=1, evict_every=1)
+    cache.set("old", "v", ttl=60)
+    clock.advance(1)
+    cache.set("new", "v", ttl=60)
+    assert "old" not in cache._memory
+    assert cache.get("old") is None
+
+
+def test_reads_back_after_reopening(path, clock):
+    cache = DiskCache(path)
+    cache.set("a", [1, 2], ttl=60)
+    clock.advance(1)
+    cache.set("b", {"x": None}, ttl=60)
+    clock.advance(1)
+    cache.get("a")
+    cache.entries()  # flushes pending access times
+
+    reopened = DiskCache(path)
+    assert reopened.get("b") == {"x": None}
+    assert reopened.stats()["disk_hits"] == 1
+    assert [key for key, _ in reopened.entries()] == ["b", "a"]
+
+
+def test_memory_copy_follows_writes_and_deletes(path, clock):
+    cache = DiskCache(path, memory_entries=2)
+    cache.set("k", "first", ttl=60)
+    cache.set("k", "second", ttl=60)
+    assert cache.get("k") == "second"
+    cache.delete("k")
+    assert cache.get("k") is None
+    for key in ("a", "b", "c"):
+        cache.set(key, key, ttl=60)
+    assert list(cache._memory) == ["b", "c"]
+    # Entries pushed out of memory are still served from disk.
+    assert cache.get("a") == "a"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_clear_empties_memory_and_disk(path, clock):
+    cache = DiskCache(path)
+    cache.set("k", "v", ttl=60)
+    cache.clear()
+    assert cache.get("k") is None
+    assert DiskCache(path).get("k") is None
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from core.breaker import CircuitBreaker
+from core.deadline import DeadlineExceeded
+from core.quota import QuotaExceeded
+from llm import router
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.01)
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+
+class _FailingProvider:
+    def __init__(self, error):
+        self.error = error
+
+    def generate(self, spec, model, prompt, timeout=None, **kwargs):
+        raise self.error
+
+
+class _Spec:
+    task = "test"
+
+
+@pytest.mark.parametrize("error", [QuotaExceeded("no slot"), DeadlineExceeded("late")])
+def test_llm_probe_released_after_quota_and_deadline_errors(monkeypatch, error):
+    breaker = half_open_breaker()
+    monkeypatch.setitem(router._breakers, "gemini", breaker)
+    monkeypatch.setitem(router.PROVIDERS, "gemini", _FailingProvider(error))
+    assert breaker.allow()
+    with pytest.raises(type(error)):
+        router._call_route(("gemini", "test-model"), _Spec(), "prompt", timeout=1)
+    assert breaker.allow()
+
+
+def test_llm_probe_released_when_future_is_cancelled(monkeypatch):
+    breaker = half_open_breaker()
+    monkeypatch.setitem(router._breakers, "gemini", breaker)
+    assert breaker.allow()
+    future = Future()
+    future.cancel()
+    router._on_done(None, ("gemini", "test-model"), future)
+    assert breaker.allow()
@@ -0,0 +1,41 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core import quota
+from core.quota import AllowanceSpent, call_allowance, call_with_quota
+
+
+def test_allowance_caps_calls_across_context_copies():
+    calls = []
+    with call_allowance(google_cse=2) as allowance:
+        call_with_quota("google_cse", calls.append, 1)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(contextvars.copy_context().run, call_with_quota, "google_cse", calls.append, 2).result()
+        assert allowance.spent("google_cse")
+        with pytest.raises(AllowanceSpent):
+            call_with_quota("google_cse", calls.append, 3)
+        # APIs without a cap are unaffected.
+        call_with_quota("gemini", calls.append, 4)
+    call_with_quota("google_cse", calls.append, 5)
+    assert calls == [1, 2, 4, 5]
+
+
+def test_refused_slot_is_refunded(monkeypatch):
+    def refuse(priority, timeout):
+        raise quota.QuotaExceeded("no slot")
+
+    monkeypatch.setattr(quota.get_bucket("google_cse"), "acquire", refuse)
+    with call_allowance(google_cse=1) as allowance:
+        with pytest.raises(quota.QuotaExceeded):
+            call_with_quota("google_cse", lambda: None)
+        assert not allowance.spent("google_cse")
+
+
+def test_zero_rate_refuses_immediately():
+    bucket = quota.TokenBucket("disabled", per_minute=0)
+    for _ in range(2):
+        with pytest.raises(quota.QuotaExceeded, match="disabled"):
+            bucket.acquire(timeout=5)
+    assert bucket.stats()["rejected"] == 2
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from core.deadline import DeadlineExceeded, deadline_scope
+from core.singleflight import SingleFlight
+
+
+def run_concurrently(group, fn, followers=3):
+    """Starts a leader, then `followers` callers while it is in flight; returns their (result, error) pairs."""
+    results = [None] * (followers + 1)
+
+    def call(index, budget):
+        with deadline_scope(budget):
+            try:
+                results[index] = (group.do("key", fn), None)
+            except Exception as e:
+                results[index] = (None, e)
+
+    threads = [threading.Thread(target=call, args=(0, 0.1))]
+    threads[0].start()
+    time.sleep(0.02)
+    threads += [threading.Thread(target=call, args=(i, 5)) for i in range(1, followers + 1)]
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_every_caller_gets_its_own_copy():
+    group = SingleFlight("test")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"title": "A", "cast": ["x"]}
+
+    results = run_concurrently(group, fn)
+    values = [value for value, error in results]
+    assert len(calls) == 1
+    assert all(value == {"title": "A", "cast": ["x"]} for value in values)
+    assert len({id(value) for value in values}) == len(values)
+    assert len({id(value["cast"]) for value in values}) == len(values)
+
+
+def test_leader_mutation_does_not_reach_followers():
+    group = SingleFlight("test")
+    release = threading.Event()
+    follower_result = []
+
+    def fn():
+        release.wait()
+        return {"posterUrl": None}
+
+    def follower():
+        follower_result.append(group.do("key", fn))
+
+    def leader():
+        result = group.do("key", fn)
+        result["posterUrl"] = "https://example.com/p.jpg"
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+    time.sleep(0.02)
+    follower_thread = threading.Thread(target=follower)
+    follower_thread.start()
+    time.sleep(0.02)
+    release.set()
+    leader_thread.join()
+    follower_thread.join()
+    assert follower_result == [{"posterUrl": None}]
+
+
+def test_follower_with_budget_retries_after_leader_deadline():
+    group = SingleFlight("test")
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.15)
+        if len(calls) == 1:
+            raise DeadlineExceeded("leader out of time")
+        return "fresh"
+
+    results = run_concurrently(group, fn, followers=2)
+    assert isinstance(results[0][1], DeadlineExceeded)
+    assert [value for value, _ in results[1:]] == ["fresh", "fresh"]
+    # One follower re-ran the call; the other coalesced onto it.
+    assert len(calls) == 2
+
+
+def test_errors_are_shared_with_followers():
+    group = SingleFlight("test")
+
+    def fn():
+        time.sleep(0.1)
+        raise ValueError("upstream failed")
+
+    results = run_concurrently(group, fn)
+    assert all(isinstance(error, ValueError) for _, error in results)
+
+
+def test_follower_gives_up_at_its_own_deadline():
+    group = SingleFlight("test")
+    release = threading.Event()
+    thread = threading.Thread(target=group.do, args=("key", release.wait))
+    thread.start()
+    time.sleep(0.02)
+    with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+        group.do("key", release.wait)
+    release.set()
+    thread.join()
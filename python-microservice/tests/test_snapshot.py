@@ -0,0 +1,54 @@
+import time
+import threading
+
+from core.deadline import deadline_scope
+from feeds import snapshot
+from feeds.snapshot import PeriodicRefresher, SnapshotStore
+
+
+def _refresher(tmp_path, build, interval=600):
+    return PeriodicRefresher(SnapshotStore(str(tmp_path), "feed"), build, interval)
+
+
+def test_failed_builds_back_off_until_the_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_RETRY_DELAY", 10)
+    refresher = _refresher(tmp_path, lambda: None)
+    waits = []
+    for _ in range(8):
+        assert refresher.refresh() is None
+        waits.append(refresher.next_wait(None))
+    assert waits[:4] == [10, 20, 40, 80]
+    assert waits[-1] == 600
+
+
+def test_successful_build_resets_the_backoff(tmp_path):
+    payloads = iter([None, None, {"dramas": [1]}])
+    refresher = _refresher(tmp_path, lambda: next(payloads))
+    refresher.refresh()
+    refresher.refresh()
+    assert refresher.failures == 2
+    assert refresher.refresh() is not None
+    assert refresher.failures == 0
+    assert 599 < refresher.next_wait(refresher.store.age()) <= 600
+
+
+def test_cold_start_wait_gives_up_at_the_deadline(tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_build():
+        started.set()
+        release.wait(5)
+        return {"dramas": [1]}
+
+    refresher = _refresher(tmp_path, slow_build)
+    builder = threading.Thread(target=refresher.refresh)
+    builder.start()
+    started.wait(1)
+    try:
+        with deadline_scope(0.2):
+            began = time.monotonic()
+            assert refresher.refresh(wait=True) is None
+            assert time.monotonic() - began < 1
+    finally:
+        release.set()
+        builder.join()